@@ -0,0 +1,56 @@
+"""
+Compare the frame loading speed of Hdf5Loader (h5py filter pipeline,
+frame by frame) with Hdf5LoaderFast with and without direct chunk reads,
+for an unmapped raster scan stored one gzip-compressed frame per chunk.
+"""
+import os
+import time
+import tempfile
+import h5py as h5
+import numpy as np
+
+from ptypy import utils as u
+from ptypy.experiment.hdf5_loader import Hdf5Loader, Hdf5LoaderFast
+
+u.verbose.set_level("info")
+
+tmpdir = tempfile.mkdtemp()
+nslow, nfast = 16, 32
+shape = 256
+threads = os.cpu_count()
+
+# Poisson counts with a bright centre, similar to far-field data
+q2 = np.sum((np.indices((shape, shape)) - shape // 2) ** 2, axis=0)
+intensity = 1e4 * np.exp(-q2 / (shape / 8.) ** 2) + 0.1
+data = np.random.poisson(intensity, (nslow * nfast, shape, shape)).astype(np.int32)
+
+data_file = os.path.join(tmpdir, "frames.h5")
+with h5.File(data_file, "w") as f:
+    f.create_dataset("data", data=data, chunks=(1, shape, shape),
+                     compression="gzip", shuffle=True)
+    f["slow"] = np.arange(nslow) * 1e-7
+    f["fast"] = np.arange(nfast) * 1e-7
+
+p = u.Param()
+p.auto_center = False
+p.intensities = u.Param(file=data_file, key="data")
+p.positions = u.Param(file=data_file, slow_key="slow", fast_key="fast")
+
+runs = [("Hdf5Loader", Hdf5Loader, {}),
+        ("Hdf5LoaderFast", Hdf5LoaderFast, dict(direct_chunks=False)),
+        ("Hdf5LoaderFast, direct chunks", Hdf5LoaderFast,
+         dict(direct_chunks=True, decompress_threads=threads))]
+
+indices = list(range(nslow * nfast))
+for label, cls, extra in runs:
+    pars = p.copy(99)
+    pars.update(extra)
+    loader = cls(pars)
+    loader.initialize()
+    # Warm-up, starts the worker pool of Hdf5LoaderFast
+    loader.load(indices[:8])
+    t = time.perf_counter()
+    loader.load(indices)
+    dt = time.perf_counter() - t
+    loader._finalize()
+    print("%-32s %7.3f s  %8.1f frames/s" % (label, dt, len(indices) / dt))
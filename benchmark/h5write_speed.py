@@ -0,0 +1,22 @@
+"""
+Compare write speed and compression ratio of the h5rw filters for a
+stack of simulated diffraction frames.
+"""
+import tempfile
+import numpy as np
+
+from ptypy import io
+from ptypy import utils as u
+
+u.verbose.set_level("info")
+
+tmpdir = tempfile.gettempdir()
+nframes = 256
+shape = 256
+
+# Poisson counts with a bright centre, similar to far-field data
+q2 = np.sum((np.indices((shape, shape)) - shape // 2) ** 2, axis=0)
+intensity = 1e4 * np.exp(-q2 / (shape / 8.) ** 2) + 0.1
+data = np.random.poisson(intensity, (nframes, shape, shape)).astype(np.int32)
+
+res = io.h5write_benchmark("/".join([tmpdir, "h5write_speed.h5"]), data, repeat=3)
@@ -48,14 +48,6 @@ def sum_to_buffer(in1, outshape, in1_addr, out1_addr, dtype):
     return out1
 
 
-def norm2(input):
-    '''
-    Input here could be a variety of 1D, 2D, 3D complex or real. all will be single precision at least.
-    return should be real
-    '''
-    return np.sum(abs2(input))
-
-
 def complex_gaussian_filter(input, mfs):
     '''
     takes 2D and 3D arrays. Complex input, complex output. mfs has len 0<x<=2
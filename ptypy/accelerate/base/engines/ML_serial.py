@@ -29,6 +29,30 @@ __all__ = ['ML_serial']
 
 @register()
 class ML_serial(ML):
+    """
+    Defaults:
+
+    [batched_po_update]
+    default = False
+    type = bool
+    help = Vectorise object and probe gradient updates over batches of non-overlapping views
+    doc = Replaces the loop over views in the object and probe gradient kernels by one
+      numpy operation per batch of views that do not overlap. The result is identical
+      to the loop.
+    userlevel = 2
+
+    [batched_aux_wave]
+    default = False
+    type = bool
+    help = Build propagated exit waves with strided gathers over the whole stack
+    doc = Replaces the loop over views in the auxiliary wave kernel by gathers through
+      index tables that are precomputed from the address array. The result is identical
+      to the loop.
+    userlevel = 2
+
+    """
+
+    SUPPORTS_TILED_OBJECT = False
 
     def __init__(self, ptycho_parent, pars=None):
         """
@@ -60,6 +84,13 @@ class ML_serial(ML):
         else:
             raise RuntimeError("Unsupported ML_type: '%s'" % self.p.ML_type)
 
+    def _initialize_optimizer(self):
+
+        # engine_iterate implements the conjugate gradient only
+        if self.p.optimizer.lower() != 'cg':
+            raise NotImplementedError("Optimizer '%s' not yet implemented" % self.p.optimizer)
+        super(ML_serial, self)._initialize_optimizer()
+
     def _setup_kernels(self):
         """
         Setup kernels, one for each scan. Derive scans from ptycho class
@@ -94,10 +125,10 @@ class ML_serial(ML):
             kern.GDK = GradientDescentKernel(aux, nmodes)
             kern.GDK.allocate()
 
-            kern.POK = PoUpdateKernel()
+            kern.POK = PoUpdateKernel(batched=self.p.batched_po_update)
             kern.POK.allocate()
 
-            kern.AWK = AuxiliaryWaveKernel()
+            kern.AWK = AuxiliaryWaveKernel(batched=self.p.batched_aux_wave)
             kern.AWK.allocate()
 
             kern.FW = geo.propagator.fw
@@ -135,6 +166,8 @@ class ML_serial(ML):
                     for j,ea in enumerate(addr[:,2,0]):
                         prep.addr[i,j,2,0] = i*nmodes+j
             prep.I = d.data
+            if self.p.batched_aux_wave:
+                self.kernels[prep.label].AWK.gather_index(prep.addr)
             if self.do_position_refinement:
                 prep.original_addr = np.zeros_like(prep.addr)
                 prep.original_addr[:] = prep.addr
@@ -310,7 +343,7 @@ class ML_serial(ML):
 
                 # We need to re-calculate the current error 
                 PCK.build_aux(aux, addr, ob, pr)
-                aux[:] = FW(aux)
+                FW(aux, out=aux)
                 PCK.log_likelihood_ml(aux, addr, I, w, err_phot)
                 error_state = np.zeros_like(err_phot)
                 error_state[:] = err_phot
@@ -320,7 +353,7 @@ class ML_serial(ML):
                 for i in range(PCK.mangler.nshifts):
                     PCK.mangler.get_address(i, addr, mangled_addr, max_oby, max_obx)
                     PCK.build_aux(aux, mangled_addr, ob, pr)
-                    aux[:] = FW(aux)
+                    FW(aux, out=aux)
                     PCK.log_likelihood_ml(aux, mangled_addr, I, w, err_phot)
                     PCK.update_addr_and_error_state(addr, error_state, mangled_addr, err_phot)
 
@@ -438,7 +471,15 @@ class GaussianModel(BaseModelSerial):
             AWK.build_aux_no_ex(aux, addr, ob, pr, add=False)
 
             # forward prop
-            aux[:] = FW(aux)
+            FW(aux, out=aux)
+
+            # keep the propagated exit waves for the line search
+            if self.p.cache_forward:
+                nrows = prep.I.shape[0] * GDK.nmodes
+                if getattr(prep, 'fcache', None) is None or len(prep.fcache) != nrows:
+                    prep.fcache = np.empty_like(aux[:nrows])
+                prep.fcache[:] = aux[:nrows]
+                prep.fcache_valid = True
 
             GDK.make_model(aux, addr)
 
@@ -447,7 +488,7 @@ class GaussianModel(BaseModelSerial):
 
             GDK.main(aux, addr, w, I)
             GDK.error_reduce(addr, err_phot)
-            aux[:] = BW(aux)
+            BW(aux, out=aux)
 
             POK.ob_update_ML(addr, obg, pr, aux)
             POK.pr_update_ML(addr, prg, ob, aux)
@@ -481,7 +522,7 @@ class GaussianModel(BaseModelSerial):
         in direction h
         """
 
-        B = np.zeros((3,), dtype=np.longdouble)
+        B = np.zeros((3,))
         Brenorm = 1. / self.LL[0] ** 2
 
         # Outer loop: through diffraction patterns
@@ -514,16 +555,21 @@ class GaussianModel(BaseModelSerial):
             pr_h = c_pr_h.S[pID].data
             I = self.di.S[dID].data
 
-            # make propagated exit (to buffer)
-            AWK.build_aux_no_ex(f, addr, ob, pr, add=False)
+            # make propagated exit (to buffer), the exit waves of the
+            # last gradient computation are reused if they were kept
+            if getattr(prep, 'fcache_valid', False):
+                f = prep.fcache
+                prep.fcache_valid = False
+            else:
+                AWK.build_aux_no_ex(f, addr, ob, pr, add=False)
+                FW(f, out=f)
             AWK.build_aux_no_ex(a, addr, ob_h, pr, add=False)
             AWK.build_aux_no_ex(a, addr, ob, pr_h, add=True)
             AWK.build_aux_no_ex(b, addr, ob_h, pr_h, add=False)
 
             # forward prop
-            f[:] = FW(f)
-            a[:] = FW(a)
-            b[:] = FW(b)
+            FW(a, out=a)
+            FW(b, out=b)
 
             GDK.make_a012(f, a, b, addr, I, fic)
             GDK.fill_b(addr, Brenorm, w, B)
@@ -9,6 +9,7 @@ This file is part of the PTYPY package.
 """
 import numpy as np
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from ptypy import utils as u
 from ptypy.utils.verbose import logger, log
@@ -65,43 +66,76 @@ def serialize_array_access(diff_storage):
 
     poe_ID = (pr.ID, ob.ID, ex.ID)
 
-    addr = []
+    # Rows of the pod views in the view tables of their containers
+    rows = []
     for view in views:
-        address = []
-
+        row = []
         for pname, pod in view.pods.items():
-            ## store them for each pod
-            # create addresses
-            a = np.array(
-                [(pod.pr_view.dlayer, pod.pr_view.dlow[0], pod.pr_view.dlow[1]),
-                 (pod.ob_view.dlayer, pod.ob_view.dlow[0], pod.ob_view.dlow[1]),
-                 (pod.ex_view.dlayer, pod.ex_view.dlow[0], pod.ex_view.dlow[1]),
-                 (pod.di_view.dlayer, pod.di_view.dlow[0], pod.di_view.dlow[1]),
-                 (pod.ma_view.dlayer, pod.ma_view.dlow[0], pod.ma_view.dlow[1])])
-
-            address.append(a)
-
-            if pod.pr_view.storage.ID != pr.ID:
+            row.append((pod.pr_view.numID, pod.ob_view.numID, pod.ex_view.numID,
+                        pod.di_view.numID, pod.ma_view.numID))
+
+            if pod.pr_view.storage is not pr:
                 log(1, "Splitting probes for one diffraction stack is not supported in " + __name__)
-            if pod.ob_view.storage.ID != ob.ID:
+            if pod.ob_view.storage is not ob:
                 log(1, "Splitting objects for one diffraction stack is not supported in " + __name__)
-            if pod.ex_view.storage.ID != ex.ID:
+            if pod.ex_view.storage is not ex:
                 log(1, "Splitting exit stacks for one diffraction stack is not supported in " + __name__)
+        rows.append(row)
+    rows = np.array(rows)
 
-        ## store data for each view
-        # adresses
-        addr.append(address)
+    # Read the addresses (layer, row, column) from the view tables
+    addr = np.empty(rows.shape + (3,), dtype=np.int32)
+    for i, v in enumerate([mpod.pr_view, mpod.ob_view, mpod.ex_view, mpod.di_view, mpod.ma_view]):
+        table = v.owner.view_table
+        addr[:, :, i, 0] = table['dlayer'][rows[:, :, i]]
+        addr[:, :, i, 1:] = table['dlow'][rows[:, :, i], :2]
 
     # store them for each storage
-    return view_IDs, poe_ID, np.array(addr).astype(np.int32)
+    return view_IDs, poe_ID, addr
 
 
 class _ProjectionEngine_serial(_ProjectionEngine):
     """
     A full-fledged Difference Map engine that uses numpy arrays instead of iteration.
 
+    Defaults:
+
+    [batched_po_update]
+    default = False
+    type = bool
+    help = Vectorise object and probe updates over batches of non-overlapping views
+    doc = Replaces the loop over views in the object and probe update kernels by one
+      numpy operation per batch of views that do not overlap. The result is identical
+      to the loop. This pays off for many small frames, for large frames the loop is
+      usually as fast.
+    userlevel = 2
+
+    [batched_aux_wave]
+    default = False
+    type = bool
+    help = Build auxiliary and exit waves with strided gathers over the whole stack
+    doc = Replaces the loop over views in the auxiliary wave kernel by gathers through
+      index tables that are precomputed from the address array. The result is identical
+      to the loop.
+    userlevel = 2
+
+    [numthreads]
+    default = 1
+    type = int
+    lowlim = 1
+    help = Number of threads working on diffraction storages and frame blocks
+    doc = With more than one thread, the diffraction storages are split into blocks of
+      frames that are processed concurrently in a thread pool, each thread with its own
+      auxiliary buffer. FFTs and most numpy kernels release the GIL. Object and probe
+      updates are accumulated per thread and summed in thread order, which is
+      deterministic but may differ in the last bits from the single threaded result.
+      Each thread holds its own object and probe accumulators.
+    userlevel = 2
+
     """
 
+    SUPPORTS_TILED_OBJECT = False
+
     def __init__(self, ptycho_parent, pars=None):
         """
         Difference map reconstruction engine.
@@ -127,6 +161,11 @@ class _ProjectionEngine_serial(_ProjectionEngine):
         self.pr_cfact = {}
         self.kernels = {}
 
+        # Thread pool, blocks of frames and accumulators for each thread
+        self.pool = None
+        self.thread_blocks = []
+        self.thread_buffers = []
+
     def engine_initialize(self):
         """
         Prepare for reconstruction.
@@ -135,6 +174,9 @@ class _ProjectionEngine_serial(_ProjectionEngine):
         super().engine_initialize()
         self._reset_benchmarks()
         self._setup_kernels()
+        if self.p.numthreads > 1:
+            self.pool = ThreadPoolExecutor(max_workers=self.p.numthreads)
+            self.thread_buffers = [{} for t in range(self.p.numthreads)]
 
     def _reset_benchmarks(self):
         self.benchmark.A_Build_aux = 0.
@@ -182,10 +224,10 @@ class _ProjectionEngine_serial(_ProjectionEngine):
             kern.FUK = FourierUpdateKernel(aux, nmodes)
             kern.FUK.allocate()
 
-            kern.POK = PoUpdateKernel()
+            kern.POK = PoUpdateKernel(batched=self.p.batched_po_update)
             kern.POK.allocate()
 
-            kern.AWK = AuxiliaryWaveKernel()
+            kern.AWK = AuxiliaryWaveKernel(batched=self.p.batched_aux_wave)
             kern.AWK.allocate()
 
             kern.FW = geo.propagator.fw
@@ -196,6 +238,55 @@ class _ProjectionEngine_serial(_ProjectionEngine):
                 kern.PCK = PositionCorrectionKernel(aux, nmodes, self.p.position_refinement, geo.resolution)
                 kern.PCK.allocate()
 
+            # one set of buffers and kernels per thread for blocks of frames
+            kern.threads = []
+            if self.p.numthreads > 1:
+                kern.block_size = -(-fpc // self.p.numthreads)
+                for t in range(self.p.numthreads):
+                    tkern = u.Param()
+                    tkern.aux = np.zeros((kern.block_size * nmodes,) + tuple(geo.shape), dtype=np.complex64)
+                    tkern.FUK = FourierUpdateKernel(tkern.aux, nmodes)
+                    tkern.FUK.allocate()
+                    tkern.POK = PoUpdateKernel(batched=self.p.batched_po_update)
+                    tkern.POK.allocate()
+                    tkern.AWK = AuxiliaryWaveKernel(batched=self.p.batched_aux_wave)
+                    tkern.AWK.allocate()
+                    kern.threads.append(tkern)
+
+    def _setup_thread_blocks(self):
+        """
+        Split the diffraction storages into blocks of frames and assign
+        them to the threads in a fixed round-robin order.
+        """
+        blocks = []
+        for dID in self.di.S.keys():
+            prep = self.diff_info[dID]
+            bs = self.kernels[prep.label].block_size
+            nframes = prep.addr.shape[0]
+            for start in range(0, nframes, bs):
+                blocks.append((dID, slice(start, min(start + bs, nframes))))
+        n = self.p.numthreads
+        self.thread_blocks = [blocks[t::n] for t in range(n)]
+
+    def _thread_map(self, func):
+        """
+        Run `func(t, blocks)` for every thread `t` with its blocks of frames.
+        """
+        futures = [self.pool.submit(func, t, blocks) for t, blocks in enumerate(self.thread_blocks)]
+        return [f.result() for f in futures]
+
+    def _thread_buffer(self, t, key, like):
+        """
+        Per-thread accumulation buffer shaped like `like`, set to zero.
+        """
+        buf = self.thread_buffers[t].get(key)
+        if buf is None or buf.shape != like.shape:
+            buf = np.zeros_like(like)
+            self.thread_buffers[t][key] = buf
+        else:
+            buf.fill(0)
+        return buf
+
     def engine_prepare(self):
 
         super().engine_prepare()
@@ -221,6 +312,8 @@ class _ProjectionEngine_serial(_ProjectionEngine):
         for label, d in self.di.storages.items():
             prep = self.diff_info[d.ID]
             prep.view_IDs, prep.poe_IDs, prep.addr = serialize_array_access(d)
+            if self.p.batched_aux_wave:
+                self.kernels[prep.label].AWK.gather_index(prep.addr)
             if self.do_position_refinement:
                 prep.original_addr = np.zeros_like(prep.addr)
                 prep.original_addr[:] = prep.addr
@@ -234,6 +327,9 @@ class _ProjectionEngine_serial(_ProjectionEngine):
             cfact = self.p.probe_inertia * len(pr.views) / pr.data.shape[0]
             self.pr_cfact[pID] = cfact / u.parallel.size
 
+        if self.pool is not None:
+            self._setup_thread_blocks()
+
     def engine_iterate(self, num=1):
         """
         Compute one iteration.
@@ -243,74 +339,20 @@ class _ProjectionEngine_serial(_ProjectionEngine):
 
             error = {}
 
-            for dID in self.di.S.keys():
-
-                # find probe, object and exit ID in dependence of dID
-                prep = self.diff_info[dID]
-                pID, oID, eID = prep.poe_IDs
-
-                # references for kernels
-                kern = self.kernels[prep.label]
-                FUK = kern.FUK
-                AWK = kern.AWK
-                FW = kern.FW
-                BW = kern.BW
-
-                # get addresses and buffers
-                addr = prep.addr
-                mag = prep.mag
-                ma_sum = prep.ma_sum
-                err_phot = prep.err_phot
-                err_fourier = prep.err_fourier
-                err_exit = prep.err_exit
-                pbound = self.pbound_scan[prep.label]
-                aux = kern.aux
-
-                # local references
-                ma = prep.ma
-                ob = self.ob.S[oID].data
-                pr = self.pr.S[pID].data
-                ex = self.ex.S[eID].data
-
-                ## compute log-likelihood
-                if self.p.compute_log_likelihood:
-                    t1 = time.time()
-                    AWK.build_aux_no_ex(aux, addr, ob, pr)
-                    aux[:] = FW(aux)
-                    FUK.log_likelihood(aux, addr, mag, ma, err_phot)
-                    self.benchmark.F_LLerror += time.time() - t1
-
-                ## build auxilliary wave
-                t1 = time.time()
-                AWK.make_aux(aux, addr, ob, pr, ex, c_po=self._c, c_e=1-self._c)
-                self.benchmark.A_Build_aux += time.time() - t1
-
-                ## forward FFT
-                t1 = time.time()
-                aux[:] = FW(aux)
-                self.benchmark.B_Prop += time.time() - t1
-
-                ## Deviation from measured data
-                t1 = time.time()
-                FUK.fourier_error(aux, addr, mag, ma, ma_sum)
-                FUK.error_reduce(addr, err_fourier)
-                FUK.fmag_all_update(aux, addr, mag, ma, err_fourier, pbound)
-                self.benchmark.C_Fourier_update += time.time() - t1
-
-                ## backward FFT
-                t1 = time.time()
-                aux[:] = BW(aux)
-                self.benchmark.D_iProp += time.time() - t1
-
-                ## build exit wave
-                t1 = time.time()
-                AWK.make_exit(aux, addr, ob, pr, ex, c_a=self._b, c_po=self._a, c_e=-(self._a+self._b))
-                FUK.exit_error(aux,addr)
-                FUK.error_reduce(addr, err_exit)
-                self.benchmark.E_Build_exit += time.time() - t1
+            if self.pool is not None:
+                # timings are accumulated per thread, then summed
+                for timing in self._thread_map(self._fourier_update_blocks):
+                    for key, value in timing.items():
+                        self.benchmark[key] += value
+            else:
+                for dID in self.di.S.keys():
+                    prep = self.diff_info[dID]
+                    self._fourier_update(dID, self.kernels[prep.label], slice(None), self.benchmark)
 
+            for dID in self.di.S.keys():
                 # update errors
-                errs = np.ascontiguousarray(np.vstack([err_fourier, err_phot, err_exit]).T)
+                prep = self.diff_info[dID]
+                errs = np.ascontiguousarray(np.vstack([prep.err_fourier, prep.err_phot, prep.err_exit]).T)
                 error.update(zip(prep.view_IDs, errs))
 
                 self.benchmark.calls_fourier += 1
@@ -332,6 +374,83 @@ class _ProjectionEngine_serial(_ProjectionEngine):
         self.error = error
         return error
 
+    def _fourier_update_blocks(self, t, blocks):
+        timing = u.Param(A_Build_aux=0., B_Prop=0., C_Fourier_update=0.,
+                         D_iProp=0., E_Build_exit=0., F_LLerror=0.)
+        for dID, sl in blocks:
+            prep = self.diff_info[dID]
+            self._fourier_update(dID, self.kernels[prep.label].threads[t], sl, timing)
+        return timing
+
+    def _fourier_update(self, dID, kern, sl, timing):
+        """
+        Fourier constraint for the frames `sl` of diffraction storage `dID`,
+        using the buffers and kernels in `kern`. The time spent in each
+        step is added to `timing`.
+        """
+        # find probe, object and exit ID in dependence of dID
+        prep = self.diff_info[dID]
+        pID, oID, eID = prep.poe_IDs
+
+        # references for kernels
+        FUK = kern.FUK
+        AWK = kern.AWK
+        FW = self.kernels[prep.label].FW
+        BW = self.kernels[prep.label].BW
+
+        # get addresses and buffers
+        addr = prep.addr[sl]
+        mag = prep.mag[sl]
+        ma_sum = prep.ma_sum[sl]
+        err_phot = prep.err_phot[sl]
+        err_fourier = prep.err_fourier[sl]
+        err_exit = prep.err_exit[sl]
+        pbound = self.pbound_scan[prep.label]
+        aux = kern.aux
+
+        # local references
+        ma = prep.ma[sl]
+        ob = self.ob.S[oID].data
+        pr = self.pr.S[pID].data
+        ex = self.ex.S[eID].data
+
+        ## compute log-likelihood
+        if self.p.compute_log_likelihood:
+            t1 = time.time()
+            AWK.build_aux_no_ex(aux, addr, ob, pr)
+            FW(aux, out=aux)
+            FUK.log_likelihood(aux, addr, mag, ma, err_phot)
+            timing.F_LLerror += time.time() - t1
+
+        ## build auxilliary wave
+        t1 = time.time()
+        AWK.make_aux(aux, addr, ob, pr, ex, c_po=self._c, c_e=1-self._c)
+        timing.A_Build_aux += time.time() - t1
+
+        ## forward FFT
+        t1 = time.time()
+        FW(aux, out=aux)
+        timing.B_Prop += time.time() - t1
+
+        ## Deviation from measured data
+        t1 = time.time()
+        FUK.fourier_error(aux, addr, mag, ma, ma_sum)
+        FUK.error_reduce(addr, err_fourier)
+        FUK.fmag_all_update(aux, addr, mag, ma, err_fourier, pbound)
+        timing.C_Fourier_update += time.time() - t1
+
+        ## backward FFT
+        t1 = time.time()
+        BW(aux, out=aux)
+        timing.D_iProp += time.time() - t1
+
+        ## build exit wave
+        t1 = time.time()
+        AWK.make_exit(aux, addr, ob, pr, ex, c_a=self._b, c_po=self._a, c_e=-(self._a+self._b))
+        FUK.exit_error(aux,addr)
+        FUK.error_reduce(addr, err_exit)
+        timing.E_Build_exit += time.time() - t1
+
     def position_update(self):
         """
         Position refinement
@@ -372,7 +491,7 @@ class _ProjectionEngine_serial(_ProjectionEngine):
 
                 # We need to re-calculate the current error
                 PCK.build_aux(aux, addr, ob, pr)
-                aux[:] = FW(aux)
+                FW(aux, out=aux)
                 if self.p.position_refinement.metric == "fourier":
                     PCK.fourier_error(aux, addr, mag, ma, ma_sum)
                     PCK.error_reduce(addr, err_fourier)
@@ -386,7 +505,7 @@ class _ProjectionEngine_serial(_ProjectionEngine):
                 for i in range(PCK.mangler.nshifts):
                     PCK.mangler.get_address(i, addr, mangled_addr, max_oby, max_obx)
                     PCK.build_aux(aux, mangled_addr, ob, pr)
-                    aux[:] = FW(aux)
+                    FW(aux, out=aux)
                     if self.p.position_refinement.metric == "fourier":
                         PCK.fourier_error(aux, mangled_addr, mag, ma, ma_sum)
                         PCK.error_reduce(mangled_addr, err_fourier)
@@ -443,20 +562,27 @@ class _ProjectionEngine_serial(_ProjectionEngine):
 
             obn.data[:] = cfact
 
-        # storage for-loop
-        for dID in self.di.S.keys():
-            prep = self.diff_info[dID]
+        if self.pool is not None:
+            # accumulate per thread, then reduce in thread order
+            for buffers in self._thread_map(self._ob_update_blocks):
+                for oID, (obb, obnb) in buffers.items():
+                    self.ob.S[oID].data += obb
+                    self.ob_nrm.S[oID].data += obnb
+        else:
+            # storage for-loop
+            for dID in self.di.S.keys():
+                prep = self.diff_info[dID]
 
-            POK = self.kernels[prep.label].POK
-            # find probe, object in exit ID in dependence of dID
-            pID, oID, eID = prep.poe_IDs
+                POK = self.kernels[prep.label].POK
+                # find probe, object in exit ID in dependence of dID
+                pID, oID, eID = prep.poe_IDs
 
-            # scan for loop
-            ev = POK.ob_update(prep.addr,
-                               self.ob.S[oID].data,
-                               self.ob_nrm.S[oID].data,
-                               self.pr.S[pID].data,
-                               self.ex.S[eID].data)
+                # scan for loop
+                ev = POK.ob_update(prep.addr,
+                                   self.ob.S[oID].data,
+                                   self.ob_nrm.S[oID].data,
+                                   self.pr.S[pID].data,
+                                   self.ex.S[eID].data)
 
         for oID, ob in self.ob.storages.items():
             obn = self.ob_nrm.S[oID]
@@ -494,22 +620,31 @@ class _ProjectionEngine_serial(_ProjectionEngine):
             pr.data *= cfact
             prn.data.fill(cfact)
 
-        for dID in self.di.S.keys():
-            prep = self.diff_info[dID]
+        if self.pool is not None:
+            # accumulate per thread, then reduce in thread order
+            for buffers in self._thread_map(self._pr_update_blocks):
+                for pID, (prb, prnb) in buffers.items():
+                    self.pr.S[pID].data += prb
+                    self.pr_nrm.S[pID].data += prnb
+            self.benchmark.probe_update += time.time() - t1
+            self.benchmark.calls_probe += 1
+        else:
+            for dID in self.di.S.keys():
+                prep = self.diff_info[dID]
 
-            POK = self.kernels[prep.label].POK
-            # find probe, object in exit ID in dependence of dID
-            pID, oID, eID = prep.poe_IDs
+                POK = self.kernels[prep.label].POK
+                # find probe, object in exit ID in dependence of dID
+                pID, oID, eID = prep.poe_IDs
 
-            # scan for-loop
-            ev = POK.pr_update(prep.addr,
-                               self.pr.S[pID].data,
-                               self.pr_nrm.S[pID].data,
-                               self.ob.S[oID].data,
-                               self.ex.S[eID].data)
+                # scan for-loop
+                ev = POK.pr_update(prep.addr,
+                                   self.pr.S[pID].data,
+                                   self.pr_nrm.S[pID].data,
+                                   self.ob.S[oID].data,
+                                   self.ex.S[eID].data)
 
-            self.benchmark.probe_update += time.time() - t1
-            self.benchmark.calls_probe += 1
+                self.benchmark.probe_update += time.time() - t1
+                self.benchmark.calls_probe += 1
 
         for pID, pr in self.pr.storages.items():
 
@@ -534,6 +669,36 @@ class _ProjectionEngine_serial(_ProjectionEngine):
 
         return np.sqrt(change)
 
+    def _ob_update_blocks(self, t, blocks):
+        buffers = {}
+        for dID, sl in blocks:
+            prep = self.diff_info[dID]
+            POK = self.kernels[prep.label].threads[t].POK
+            pID, oID, eID = prep.poe_IDs
+            if oID not in buffers:
+                buffers[oID] = (self._thread_buffer(t, ('ob', oID), self.ob.S[oID].data),
+                                self._thread_buffer(t, ('obn', oID), self.ob_nrm.S[oID].data))
+            obb, obnb = buffers[oID]
+            POK.ob_update(prep.addr[sl], obb, obnb,
+                          self.pr.S[pID].data,
+                          self.ex.S[eID].data)
+        return buffers
+
+    def _pr_update_blocks(self, t, blocks):
+        buffers = {}
+        for dID, sl in blocks:
+            prep = self.diff_info[dID]
+            POK = self.kernels[prep.label].threads[t].POK
+            pID, oID, eID = prep.poe_IDs
+            if pID not in buffers:
+                buffers[pID] = (self._thread_buffer(t, ('pr', pID), self.pr.S[pID].data),
+                                self._thread_buffer(t, ('prn', pID), self.pr_nrm.S[pID].data))
+            prb, prnb = buffers[pID]
+            POK.pr_update(prep.addr[sl], prb, prnb,
+                          self.ob.S[oID].data,
+                          self.ex.S[eID].data)
+        return buffers
+
     def engine_finalize(self, benchmark=True):
         """
         try deleting ever helper contianer
@@ -558,6 +723,11 @@ class _ProjectionEngine_serial(_ProjectionEngine):
 
         self._reset_benchmarks()
 
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+            self.thread_buffers = []
+
         if self.do_position_refinement and self.p.position_refinement.record:
             for label, d in self.di.storages.items():
                 prep = self.diff_info[d.ID]
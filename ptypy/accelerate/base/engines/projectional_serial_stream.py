@@ -121,7 +121,7 @@ class DM_serial_stream(DM_serial):
 
                         ## FFT
                         t1 = time.time()
-                        aux[:] = FW(aux)
+                        FW(aux, out=aux)
                         self.benchmark.B_Prop += time.time() - t1
 
                         ## Deviation from measured data
@@ -132,7 +132,7 @@ class DM_serial_stream(DM_serial):
                         self.benchmark.C_Fourier_update += time.time() - t1
 
                         t1 = time.time()
-                        aux[:] = BW(aux)
+                        BW(aux, out=aux)
                         self.benchmark.D_iProp += time.time() - t1
 
                         ## apply changes #2
@@ -238,7 +238,7 @@ class _StochasticEngineSerial(_StochasticEngine):
 
                     ## forward FFT
                     t1 = time.time()
-                    aux[:] = FW(aux)
+                    FW(aux, out=aux)
                     self.benchmark.B_Prop += time.time() - t1
 
                     ## Deviation from measured data
@@ -253,7 +253,7 @@ class _StochasticEngineSerial(_StochasticEngine):
 
                     ## backward FFT
                     t1 = time.time()
-                    aux[:] = BW(aux)
+                    BW(aux, out=aux)
                     self.benchmark.D_iProp += time.time() - t1
 
                     ## build exit wave
@@ -293,7 +293,7 @@ class _StochasticEngineSerial(_StochasticEngine):
                     ## compute log-likelihood
                     if self.p.compute_log_likelihood:
                         t1 = time.time()
-                        aux[:] = FW(aux)
+                        FW(aux, out=aux)
                         FUK.log_likelihood(aux, addr, mag, ma, err_phot)
                         self.benchmark.F_LLerror += time.time() - t1
 
@@ -349,7 +349,7 @@ class _StochasticEngineSerial(_StochasticEngine):
 
             # We first need to calculate the current error
             PCK.build_aux(aux, addr, ob, pr)
-            aux[:] = FW(aux)
+            FW(aux, out=aux)
             if self.p.position_refinement.metric == "fourier":
                 PCK.fourier_error(aux, addr, mag, ma, ma_sum)
                 PCK.error_reduce(addr, err_fourier)
@@ -363,7 +363,7 @@ class _StochasticEngineSerial(_StochasticEngine):
             for i in range(PCK.mangler.nshifts):
                 PCK.mangler.get_address(i, addr, mangled_addr, max_oby, max_obx)
                 PCK.build_aux(aux, mangled_addr, ob, pr)
-                aux[:] = FW(aux)
+                FW(aux, out=aux)
                 if self.p.position_refinement.metric == "fourier":
                     PCK.fourier_error(aux, mangled_addr, mag, ma, ma_sum)
                     PCK.error_reduce(mangled_addr, err_fourier)
@@ -1,6 +1,7 @@
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from ptypy.utils.verbose import logger, log
-from .array_utils import max_abs2, abs2
+from .array_utils import max_abs2, abs2, dot
 
 class Adict(object):
 
@@ -29,10 +30,15 @@ class FourierUpdateKernel(BaseKernel):
         self.nmodes = np.int32(nmodes)
         ash = aux.shape
         self.fshape = (ash[0] // nmodes, ash[1], ash[2])
+        self.ashape = tuple(ash)
+        self.ftype = np.abs(aux.flat[:1]).dtype
 
         # temporary buffer arrays
         self.npy.fdev = None
         self.npy.ferr = None
+        self.npy.fm = None
+        self.npy.ftmp = None
+        self.npy.fabs = None
 
         self.kernels = [
             'fourier_error',
@@ -48,6 +54,31 @@ class FourierUpdateKernel(BaseKernel):
         # temporary buffer arrays
         self.npy.fdev = np.zeros(self.fshape, dtype=np.float32)
         self.npy.ferr = np.zeros(self.fshape, dtype=np.float32)
+        self.npy.fm = np.zeros(self.fshape, dtype=np.float32)
+        self.npy.ftmp = np.zeros(self.fshape, dtype=np.float32)
+        self.npy.fabs = np.zeros(self.ashape, dtype=self.ftype)
+
+    def _model_intensity(self, aux, maxz):
+        """
+        Incoherent sum of the mode intensities of `aux`, computed in
+        the scratch buffers. Returns a view of shape (maxz, nmodes, ...).
+        """
+        sh = self.fshape
+        fabs = self.npy.fabs
+        if fabs is None or fabs.shape[0] < aux.shape[0]:
+            fabs = self.npy.fabs = np.zeros(self.ashape, dtype=self.ftype)
+        tf = aux.reshape(maxz, self.nmodes, sh[1], sh[2])
+        af2 = fabs[:aux.shape[0]].reshape(tf.shape)
+        np.abs(tf, out=af2)
+        np.square(af2, out=af2)
+        return af2
+
+    def _fmag_update(self, aux, fm):
+        # multiply all modes by the magnitude correction, in place
+        nmodes = self.nmodes
+        ish = aux.shape
+        a4 = aux.reshape(ish[0] // nmodes, nmodes, ish[1], ish[2])
+        a4 *= fm[:, np.newaxis, :, :]
 
     def fourier_error(self, b_aux, addr, mag, mask, mask_sum):
         # reference shape (write-to shape)
@@ -64,14 +95,18 @@ class FourierUpdateKernel(BaseKernel):
 
         # build model from complex fourier magnitudes, summing up 
         # all modes incoherently
-        tf = aux.reshape(maxz, self.nmodes, sh[1], sh[2])
-        af = np.sqrt((np.abs(tf) ** 2).sum(1))
+        af2 = self._model_intensity(aux, maxz)
+        np.sum(af2, axis=1, out=fdev)
+        np.sqrt(fdev, out=fdev)
 
         # calculate difference to real data (g_mag)
-        fdev[:] = af - mag
+        fdev -= mag
 
         # Calculate error on fourier magnitudes on a per-pixel basis
-        ferr[:] = mask * np.abs(fdev) ** 2 / mask_sum.reshape((maxz, 1, 1))
+        np.abs(fdev, out=ferr)
+        np.square(ferr, out=ferr)
+        ferr *= mask
+        ferr /= mask_sum.reshape((maxz, 1, 1))
         return
 
     def fourier_deviation(self, b_aux, addr, mag):
@@ -88,11 +123,12 @@ class FourierUpdateKernel(BaseKernel):
 
         # build model from complex fourier magnitudes, summing up 
         # all modes incoherently
-        tf = aux.reshape(maxz, self.nmodes, sh[1], sh[2])
-        af = np.sqrt((np.abs(tf) ** 2).sum(1))
+        af2 = self._model_intensity(aux, maxz)
+        np.sum(af2, axis=1, out=fdev)
+        np.sqrt(fdev, out=fdev)
 
         # calculate difference to real data (g_mag)
-        fdev[:] = af - mag
+        fdev -= mag
 
         return
 
@@ -110,7 +146,7 @@ class FourierUpdateKernel(BaseKernel):
 
         # Reduces the Fourier error along the last 2 dimensions.fd
         #err_sum[:] = ferr.astype(np.double).sum(-1).sum(-1).astype(np.float)
-        err_sum[:] = ferr.sum(-1).sum(-1)
+        err_sum[:] = ferr.sum((-2, -1), dtype=np.float64)
         return
 
     def fmag_all_update(self, b_aux, addr, mag, mask, err_sum, pbound=0.0):
@@ -125,13 +161,11 @@ class FourierUpdateKernel(BaseKernel):
         fdev = self.npy.fdev[:maxz]
         aux = b_aux[:maxz * nmodes]
 
-        # write-to shape
-        ish = aux.shape
-
         ## Actual math ##
 
         # local values
-        fm = np.ones((maxz, sh[1], sh[2]), np.float32)
+        fm = self.npy.fm[:maxz]
+        ftmp = self.npy.ftmp[:maxz]
         renorm = np.ones((maxz,), np.float32)
 
         ## As opposed to DM we use renorm to differentiate the cases.
@@ -148,12 +182,19 @@ class FourierUpdateKernel(BaseKernel):
         renorm[ind] = np.sqrt(pbound / err_sum[ind])
         renorm = renorm.reshape((renorm.shape[0], 1, 1))
 
-        af = fdev + mag
-        fm[:] = (1 - mask) + mask * (mag + fdev * renorm) / (af + self.denom)
+        # fm = (1 - mask) + mask * (mag + fdev * renorm) / (fdev + mag + denom)
+        np.add(fdev, mag, out=ftmp)
+        ftmp += self.denom
+        np.multiply(fdev, renorm, out=fm)
+        np.add(mag, fm, out=fm)
+        fm *= mask
+        fm /= ftmp
+        np.subtract(1, mask, out=ftmp, casting='unsafe')
+        np.add(ftmp, fm, out=fm)
 
         #fm[:] = mag / (af + 1e-6)
         # upcasting
-        aux[:] = (aux.reshape(ish[0] // nmodes, nmodes, ish[1], ish[2]) * fm[:, np.newaxis, :, :]).reshape(ish)
+        self._fmag_update(aux, fm)
         return
 
     def fmag_update_nopbound(self, b_aux, addr, mag, mask):
@@ -168,19 +209,22 @@ class FourierUpdateKernel(BaseKernel):
         fdev = self.npy.fdev[:maxz]
         aux = b_aux[:maxz * nmodes]
 
-        # write-to shape
-        ish = aux.shape
-
         ## Actual math ##
 
         # local values
-        fm = np.ones((maxz, sh[1], sh[2]), np.float32)
+        fm = self.npy.fm[:maxz]
+        ftmp = self.npy.ftmp[:maxz]
 
-        af = fdev + mag
-        fm[:] = (1 - mask) + mask * mag / (af + self.denom)
+        # fm = (1 - mask) + mask * mag / (fdev + mag + denom)
+        np.add(fdev, mag, out=ftmp)
+        ftmp += self.denom
+        np.multiply(mask, mag, out=fm)
+        fm /= ftmp
+        np.subtract(1, mask, out=ftmp, casting='unsafe')
+        np.add(ftmp, fm, out=fm)
 
         # upcasting
-        aux[:] = (aux.reshape(ish[0] // nmodes, nmodes, ish[1], ish[2]) * fm[:, np.newaxis, :, :]).reshape(ish)
+        self._fmag_update(aux, fm)
         return
 
     def log_likelihood(self, b_aux, addr, mag, mask, err_phot):
@@ -201,7 +245,7 @@ class FourierUpdateKernel(BaseKernel):
         I = mag**2
 
         # Calculate log likelihood error
-        err_phot[:] = ((mask * (LL - I)**2 / (I + 1.)).sum(-1).sum(-1) /  np.prod(LL.shape[-2:]))
+        err_phot[:] = ((mask * (LL - I)**2 / (I + 1.)).sum((-2, -1), dtype=np.float64) /  np.prod(LL.shape[-2:]))
         return
 
     def exit_error(self, aux, addr):
@@ -290,7 +334,7 @@ class GradientDescentKernel(BaseKernel):
         fc = fic.reshape((maxz,1,1))
         A0.fill(0.)
         tf = np.real(f * f.conj()).astype(self.ftype)
-        A0[:maxz] = np.double(tf.reshape(maxz, self.nmodes, sh[1], sh[2]).sum(1) * fc) - I
+        A0[:maxz] = tf.reshape(maxz, self.nmodes, sh[1], sh[2]).sum(1) * fc - I
 
         A1.fill(0.)
         tf = 2. * np.real(f * a.conj())
@@ -316,9 +360,9 @@ class GradientDescentKernel(BaseKernel):
 
         # maybe two kernel calls?
 
-        B[0] += np.dot(w.flat, (A0 ** 2).flat) * Brenorm
-        B[1] += np.dot(w.flat, (2 * A0 * A1).flat) * Brenorm
-        B[2] += np.dot(w.flat, (A1 ** 2 + 2 * A0 * A2).flat) * Brenorm
+        B[0] += dot(w, A0 ** 2) * Brenorm
+        B[1] += dot(w, 2 * A0 * A1) * Brenorm
+        B[2] += dot(w, A1 ** 2 + 2 * A0 * A2) * Brenorm
         return
 
     def error_reduce(self, addr, err_sum):
@@ -335,7 +379,7 @@ class GradientDescentKernel(BaseKernel):
         ## Actual math ##
 
         # Reduces the LL error along the last 2 dimensions.fd
-        err_sum[:] = ferr.sum(-1).sum(-1)
+        err_sum[:] = ferr.sum((-2, -1), dtype=np.float64)
         return
 
     def floating_intensity(self, addr, w, I, fic):
@@ -355,8 +399,8 @@ class GradientDescentKernel(BaseKernel):
         ## math ##
         num[:] = w * Imodel * I
         den[:] = w * Imodel ** 2
-        fic[:] = num.sum(-1).sum(-1)
-        fic_tmp[:]= den.sum(-1).sum(-1)
+        fic[:] = num.sum((-2, -1), dtype=np.float64)
+        fic_tmp[:] = den.sum((-2, -1), dtype=np.float64)
         fic/=fic_tmp
         Imodel *= fic.reshape(Imodel.shape[0], 1, 1)
 
@@ -375,7 +419,7 @@ class GradientDescentKernel(BaseKernel):
         ish = aux.shape
 
         ## math ##
-        DI = np.double(Imodel) - I
+        DI = Imodel - I
         tmp = w * DI
         err[:] = tmp * DI
 
@@ -385,8 +429,17 @@ class GradientDescentKernel(BaseKernel):
 
 class AuxiliaryWaveKernel(BaseKernel):
 
-    def __init__(self):
+    def __init__(self, batched=False):
         super(AuxiliaryWaveKernel, self).__init__()
+        # Build the whole auxiliary stack with strided gathers instead
+        # of slicing object and probe for every address row.
+        self.batched = batched
+        # upper limit for the number of elements in temporary batch
+        # arrays, small enough for them to stay in cache
+        self.max_batch_size = 2 ** 16
+        # cache of gather tables, keyed by the addresses they were built from
+        self.max_tables = 16
+        self._tables = {}
         self.kernels = [
             'build_aux',
             'build_exit',
@@ -395,6 +448,59 @@ class AuxiliaryWaveKernel(BaseKernel):
     def allocate(self):
         pass
 
+    def gather_index(self, addr):
+        """
+        Precompute the gather index tables for the flattened address rows
+        of `addr`. Tables are cached, calling this once in the engine's
+        prepare step avoids building them in the first iteration.
+
+        Returns
+        -------
+        table : Adict
+            With attributes `pr`, `ob`, `ex` holding (layer, row, column)
+            index arrays, `ex_slice`, a slice into the exit stack if the
+            exit waves are consecutive layers without offset (None otherwise),
+            and `ex_unique`, which is True if no two rows share an exit wave.
+        """
+        flat_addr = addr.reshape(-1, addr.shape[-2], addr.shape[-1])
+        key = flat_addr.tobytes()
+        table = self._tables.get(key)
+        if table is not None:
+            return table
+
+        table = Adict()
+        idx = flat_addr.astype(np.intp)
+        table.pr = tuple(idx[:, 0].T)
+        table.ob = tuple(idx[:, 1].T)
+        table.ex = tuple(idx[:, 2].T)
+        ex_layers = idx[:, 2, 0]
+        table.ex_unique = len(np.unique(idx[:, 2], axis=0)) == len(idx)
+        table.ex_slice = None
+        if (len(idx) and not idx[:, 2, 1:].any() and
+                np.array_equal(ex_layers, np.arange(len(idx)) + ex_layers[0])):
+            table.ex_slice = slice(ex_layers[0], ex_layers[0] + len(idx))
+
+        if len(self._tables) >= self.max_tables:
+            self._tables.clear()
+        self._tables[key] = table
+        return table
+
+    def _batches(self, nrows, rows, cols):
+        step = max(1, self.max_batch_size // (rows * cols))
+        for i in range(0, nrows, step):
+            yield slice(i, min(i + step, nrows))
+
+    @staticmethod
+    def _gather(arr, table, sl, rows, cols):
+        win = sliding_window_view(arr, (rows, cols), axis=(-2, -1))
+        return win[table[0][sl], table[1][sl], table[2][sl]]
+
+    def _gather_ex(self, ex, table, sl, rows, cols):
+        if table.ex_slice is not None:
+            start = table.ex_slice.start
+            return ex[start + sl.start:start + sl.stop]
+        return self._gather(ex, table.ex, sl, rows, cols)
+
     def build_aux(self, b_aux, addr, ob, pr, ex, alpha=1.0):
         # DM only, legacy
         self.make_aux(b_aux, addr, ob, pr, ex, 1.+alpha, -alpha)
@@ -434,6 +540,15 @@ class AuxiliaryWaveKernel(BaseKernel):
         aux = b_aux[:maxz * nmodes]
         flat_addr = addr.reshape(maxz * nmodes, sh[2], sh[3])
         rows, cols = ex.shape[-2:]
+        if self.batched:
+            t = self.gather_index(addr)
+            for sl in self._batches(len(aux), rows, cols):
+                tmp = aux[sl]
+                np.multiply(self._gather(ob, t.ob, sl, rows, cols), pr[t.pr[0][sl]], out=tmp)
+                tmp *= c_po
+                tmp += self._gather_ex(ex, t, sl, rows, cols) * c_e
+            return
+
         for ind, (prc, obc, exc, mac, dic) in enumerate(flat_addr):
             tmp = ob[obc[0], obc[1]:obc[1] + rows, obc[2]:obc[2] + cols] * \
                   pr[prc[0], :, :] * c_po + \
@@ -462,6 +577,21 @@ class AuxiliaryWaveKernel(BaseKernel):
         flat_addr = addr.reshape(maxz * nmodes, sh[2], sh[3])
         rows, cols = ex.shape[-2:]
 
+        t = self.gather_index(addr) if self.batched else None
+        if t is not None and t.ex_unique:
+            for sl in self._batches(len(aux), rows, cols):
+                exc = self._gather_ex(ex, t, sl, rows, cols)
+                dex = c_a * aux[sl] + c_po * \
+                      self._gather(ob, t.ob, sl, rows, cols) * \
+                      self._gather(pr, t.pr, sl, rows, cols) + c_e * exc
+                if t.ex_slice is not None:
+                    exc += dex
+                else:
+                    exw = sliding_window_view(ex, (rows, cols), axis=(-2, -1), writeable=True)
+                    exw[t.ex[0][sl], t.ex[1][sl], t.ex[2][sl]] = exc + dex
+                aux[sl] = dex
+            return
+
         for ind, (prc, obc, exc, mac, dic) in enumerate(flat_addr):
             dex = c_a * aux[ind, :, :] + c_po * \
                   ob[obc[0], obc[1]:obc[1] + rows, obc[2]:obc[2] + cols] * \
@@ -536,6 +666,17 @@ class AuxiliaryWaveKernel(BaseKernel):
         flat_addr = addr.reshape(maxz * nmodes, sh[2], sh[3])
         rows, cols = b_aux.shape[-2:]
 
+        if self.batched:
+            t = self.gather_index(addr)
+            for sl in self._batches(len(aux), rows, cols):
+                tmp = self._gather(ob, t.ob, sl, rows, cols) * \
+                      self._gather(pr, t.pr, sl, rows, cols) * fac
+                if add:
+                    aux[sl] += tmp
+                else:
+                    aux[sl] = tmp
+            return
+
         for ind, (prc, obc, exc, mac, dic) in enumerate(flat_addr):
             tmp = ob[obc[0], obc[1]:obc[1] + rows, obc[2]:obc[2] + cols] * \
                   pr[prc[0], prc[1]:prc[1] + rows, prc[2]:prc[2] + cols] * fac
@@ -547,9 +688,18 @@ class AuxiliaryWaveKernel(BaseKernel):
 
 class PoUpdateKernel(BaseKernel):
 
-    def __init__(self):
+    def __init__(self, batched=False):
 
         super(PoUpdateKernel, self).__init__()
+        # Replace the per-view loops by one numpy operation per batch of
+        # non-overlapping views. The result is identical to the loops.
+        self.batched = batched
+        # upper limit for the number of elements in temporary batch
+        # arrays, small enough for them to stay in cache
+        self.max_batch_size = 2 ** 16
+        # cache of batch plans, keyed by the addresses they were built from
+        self.max_plans = 16
+        self._plans = {}
         self.kernels = [
             'pr_update',
             'ob_update',
@@ -558,11 +708,123 @@ class PoUpdateKernel(BaseKernel):
     def allocate(self):
         pass
 
+    def batch_plan(self, addr, col, shape, rows, cols):
+        """
+        Split the flattened address rows of `addr` into batches that can be
+        accumulated into the array region ``addr[..., col, :]`` with single
+        numpy operations, while every pixel of the target array still
+        receives its contributions in the order of the address rows.
+
+        Rows that write to the very same region (like all views of a probe
+        mode) are grouped for a sequential reduction, otherwise rows are
+        grouped into sets of mutually non-overlapping regions.
+
+        Parameters
+        ----------
+        addr : ndarray
+            Address array as built by `serialize_array_access`.
+        col : int
+            Column of the address array to target, 0 for the probe,
+            1 for the object, 4 for the mask / diffraction frames.
+        shape : tuple
+            Shape of the target array.
+        rows, cols : int
+            Shape of a single view.
+
+        Returns
+        -------
+        plan : list
+            List of ``(reduce, indices)`` tuples, with `indices` being
+            indices into the flattened address rows.
+        """
+        tgt = addr.reshape(-1, addr.shape[-2], addr.shape[-1])[:, col]
+        key = (col, tuple(shape), rows, cols, tgt.tobytes())
+        plan = self._plans.get(key)
+        if plan is not None:
+            return plan
+
+        # restrict book-keeping to the bounding box of all regions
+        lo = tgt[:, 1:].min(0)
+        ext = tgt[:, 1:].max(0) - lo + (rows, cols)
+        cover = np.zeros((shape[0],) + tuple(ext), dtype=np.int32)
+        loc = tgt - np.array([0, lo[0], lo[1]])
+
+        plan = []
+        regions, inverse = np.unique(loc, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        if len(regions) < len(loc):
+            for l, y, x in regions:
+                cover[l, y:y + rows, x:x + cols] += 1
+            if cover.max() <= 1:
+                # identical or disjoint regions only
+                for k in range(len(regions)):
+                    plan.append((True, np.flatnonzero(inverse == k)))
+            cover[:] = 0
+
+        if not plan:
+            # Level of a row is one more than that of any earlier row it
+            # overlaps with, rows of the same level can be applied at once.
+            levels = np.empty(len(loc), dtype=np.int32)
+            for i, (l, y, x) in enumerate(loc):
+                region = cover[l, y:y + rows, x:x + cols]
+                levels[i] = region.max()
+                region[:] = levels[i] + 1
+            for k in range(levels.max() + 1):
+                plan.append((False, np.flatnonzero(levels == k)))
+
+        # limit the size of temporary arrays
+        step = max(1, self.max_batch_size // (rows * cols))
+        plan = [(reduce, ind[i:i + step]) for reduce, ind in plan
+                for i in range(0, len(ind), step)]
+
+        if len(self._plans) >= self.max_plans:
+            self._plans.clear()
+        self._plans[key] = plan
+        return plan
+
+    @staticmethod
+    def _windows(arr, rows, cols):
+        return sliding_window_view(arr, (rows, cols), axis=(-2, -1), writeable=True)
+
+    @staticmethod
+    def _gather(win, a):
+        return win[a[:, 0], a[:, 1], a[:, 2]]
+
+    def _accumulate(self, addr, col, dst, values, rows, cols):
+        """
+        Add the per-row `values(ind)` into the view regions of the
+        arrays in `dst`, batch by batch.
+        """
+        plan = self.batch_plan(addr, col, dst[0].shape, rows, cols)
+        flat_addr = addr.reshape(-1, addr.shape[-2], addr.shape[-1])
+        wins = [self._windows(d, rows, cols) for d in dst]
+        for reduce, ind in plan:
+            a = flat_addr[ind, col]
+            vals = values(ind)
+            for win, val in zip(wins, vals):
+                if reduce:
+                    region = win[a[0, 0], a[0, 1], a[0, 2]]
+                    val[0] += region
+                    np.add.reduce(val, axis=0, out=region)
+                else:
+                    win[a[:, 0], a[:, 1], a[:, 2]] += val
+
     def ob_update(self, addr, ob, obn, pr, ex):
 
         sh = addr.shape
         flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
         rows, cols = ex.shape[-2:]
+        if self.batched:
+            prw = self._windows(pr, rows, cols)
+            exw = self._windows(ex, rows, cols)
+
+            def values(ind):
+                prc = self._gather(prw, flat_addr[ind, 0]).conj()
+                exc = self._gather(exw, flat_addr[ind, 2])
+                return prc * exc, (prc * prc.conj()).real
+            self._accumulate(addr, 1, (ob, obn), values, rows, cols)
+            return
+
         for ind, (prc, obc, exc, mac, dic) in enumerate(flat_addr):
             ob[obc[0], obc[1]:obc[1] + rows, obc[2]:obc[2] + cols] += \
                 pr[prc[0], prc[1]:prc[1] + rows, prc[2]:prc[2] + cols].conj() * \
@@ -577,6 +839,17 @@ class PoUpdateKernel(BaseKernel):
         sh = addr.shape
         flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
         rows, cols = ex.shape[-2:]
+        if self.batched:
+            obw = self._windows(ob, rows, cols)
+            exw = self._windows(ex, rows, cols)
+
+            def values(ind):
+                obc = self._gather(obw, flat_addr[ind, 1]).conj()
+                exc = self._gather(exw, flat_addr[ind, 2])
+                return obc * exc, (obc * obc.conj()).real
+            self._accumulate(addr, 0, (pr, prn), values, rows, cols)
+            return
+
         for ind, (prc, obc, exc, mac, dic) in enumerate(flat_addr):
             pr[prc[0], prc[1]:prc[1] + rows, prc[2]:prc[2] + cols] += \
                 ob[obc[0], obc[1]:obc[1] + rows, obc[2]:obc[2] + cols].conj() * \
@@ -591,6 +864,16 @@ class PoUpdateKernel(BaseKernel):
         sh = addr.shape
         flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
         rows, cols = ex.shape[-2:]
+        if self.batched:
+            prw = self._windows(pr, rows, cols)
+            exw = self._windows(ex, rows, cols)
+
+            def values(ind):
+                return (self._gather(prw, flat_addr[ind, 0]).conj() *
+                        self._gather(exw, flat_addr[ind, 2]) * fac,)
+            self._accumulate(addr, 1, (ob,), values, rows, cols)
+            return
+
         for ind, (prc, obc, exc, mac, dic) in enumerate(flat_addr):
             ob[obc[0], obc[1]:obc[1] + rows, obc[2]:obc[2] + cols] += \
                 pr[prc[0], prc[1]:prc[1] + rows, prc[2]:prc[2] + cols].conj() * \
@@ -602,6 +885,16 @@ class PoUpdateKernel(BaseKernel):
         sh = addr.shape
         flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
         rows, cols = ex.shape[-2:]
+        if self.batched:
+            obw = self._windows(ob, rows, cols)
+            exw = self._windows(ex, rows, cols)
+
+            def values(ind):
+                return (self._gather(obw, flat_addr[ind, 1]).conj() *
+                        self._gather(exw, flat_addr[ind, 2]) * fac,)
+            self._accumulate(addr, 0, (pr,), values, rows, cols)
+            return
+
         for ind, (prc, obc, exc, mac, dic) in enumerate(flat_addr):
             pr[prc[0], prc[1]:prc[1] + rows, prc[2]:prc[2] + cols] += \
                 ob[obc[0], obc[1]:obc[1] + rows, obc[2]:obc[2] + cols].conj() * \
@@ -613,6 +906,17 @@ class PoUpdateKernel(BaseKernel):
         flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
         rows, cols = ex.shape[-2:]
         pr_norm = (1 - a) * prn.max() + a * prn
+        if self.batched:
+            prw = self._windows(pr, rows, cols)
+            exw = self._windows(ex, rows, cols)
+            nrw = self._windows(pr_norm, rows, cols)
+
+            def values(ind):
+                return ((a + b) * self._gather(prw, flat_addr[ind, 0]).conj() *
+                        (self._gather(exw, flat_addr[ind, 2]) - aux[ind, :, :]) /
+                        self._gather(nrw, flat_addr[ind, 4]),)
+            self._accumulate(addr, 1, (ob,), values, rows, cols)
+            return
         for ind, (prc, obc, exc, mac, dic) in enumerate(flat_addr):
             ob[obc[0], obc[1]:obc[1] + rows, obc[2]:obc[2] + cols] += \
                 (a + b) * pr[prc[0], prc[1]:prc[1] + rows, prc[2]:prc[2] + cols].conj() * \
@@ -625,6 +929,17 @@ class PoUpdateKernel(BaseKernel):
         flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
         rows, cols = ex.shape[-2:]
         ob_norm = (1 - a) * obn_max + a * obn
+        if self.batched:
+            obw = self._windows(ob, rows, cols)
+            exw = self._windows(ex, rows, cols)
+            nrw = self._windows(ob_norm, rows, cols)
+
+            def values(ind):
+                return ((a + b) * self._gather(obw, flat_addr[ind, 1]).conj() *
+                        (self._gather(exw, flat_addr[ind, 2]) - aux[ind, :, :]) /
+                        self._gather(nrw, flat_addr[ind, 4]),)
+            self._accumulate(addr, 0, (pr,), values, rows, cols)
+            return
         for ind, (prc, obc, exc, mac, dic) in enumerate(flat_addr):
             pr[prc[0], prc[1]:prc[1] + rows, prc[2]:prc[2] + cols] += \
                 (a + b) * ob[obc[0], obc[1]:obc[1] + rows, obc[2]:obc[2] + cols].conj() * \
@@ -637,6 +952,16 @@ class PoUpdateKernel(BaseKernel):
         flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
         rows, cols = obn.shape[-2:]
         obn[:] = 0.
+        if self.batched:
+            # each object mode should only be counted once
+            flat_addr = flat_addr[flat_addr[:, 0, 0] == 0]
+            obw = self._windows(ob, rows, cols)
+
+            def values(ind):
+                obc = self._gather(obw, flat_addr[ind, 1])
+                return ((obc.conj() * obc).real,)
+            self._accumulate(flat_addr, 4, (obn,), values, rows, cols)
+            return
         for ind, (prc, obc, exc, mac, dic) in enumerate(flat_addr):
             # each object mode should only be counted once
             if prc[0] > 0:
@@ -651,6 +976,16 @@ class PoUpdateKernel(BaseKernel):
         flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
         rows, cols = prn.shape[-2:]
         prn[:] = 0.
+        if self.batched:
+            # each probe mode should only be counted once
+            flat_addr = flat_addr[flat_addr[:, 1, 0] == 0]
+            prw = self._windows(pr, rows, cols)
+
+            def values(ind):
+                prc = self._gather(prw, flat_addr[ind, 0])
+                return ((prc.conj() * prc).real,)
+            self._accumulate(flat_addr, 4, (prn,), values, rows, cols)
+            return
         for ind, (prc, obc, exc, mac, dic) in enumerate(flat_addr):
             # each probe mode should only be counted once
             if obc[0] > 0:
@@ -763,7 +1098,7 @@ class PositionCorrectionKernel(BaseKernel):
 
         # Reduceses the Fourier error along the last 2 dimensions.fd
         #err_sum[:] = ferr.astype(np.double).sum(-1).sum(-1).astype(np.float)
-        err_sum[:] = ferr.sum(-1).sum(-1)
+        err_sum[:] = ferr.sum((-2, -1), dtype=np.float64)
         return
 
     def log_likelihood(self, b_aux, addr, mag, mask, err_sum):
@@ -784,7 +1119,7 @@ class PositionCorrectionKernel(BaseKernel):
         I = mag**2
 
         # Calculate log likelihood error
-        err_sum[:] = ((mask * (LL - I)**2 / (I + 1.)).sum(-1).sum(-1) /  np.prod(LL.shape[-2:]))
+        err_sum[:] = ((mask * (LL - I)**2 / (I + 1.)).sum((-2, -1), dtype=np.float64) /  np.prod(LL.shape[-2:]))
         return
 
     def log_likelihood_ml(self, b_aux, addr, I, weights, err_sum):
@@ -802,7 +1137,7 @@ class PositionCorrectionKernel(BaseKernel):
         LL = (np.abs(tf) ** 2).sum(1)
 
         # Calculate log likelihood error
-        err_sum[:] = ((weights * (LL - I)**2).sum(-1).sum(-1) /  np.prod(LL.shape[-2:]))
+        err_sum[:] = ((weights * (LL - I)**2).sum((-2, -1), dtype=np.float64) /  np.prod(LL.shape[-2:]))
         return
 
     def update_addr_and_error_state(self, addr, error_state, mangled_addr, err_sum):
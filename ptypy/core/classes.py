@@ -89,7 +89,7 @@ class Base(object):
     _CHILD_PREFIX = 'ID'
     _PREFIX = BASE_PREFIX
     
-    __slots__ = ['ID','numID','owner','_pool','_recs','_record']
+    __slots__ = ['ID','numID','owner','_pool','_recs','_recs_top','_recs_dirty','_record']
     _fields = [('ID','<S16')]
     
     def __init__(self, owner=None, ID=None, BeOwner=True):
@@ -128,6 +128,9 @@ class Base(object):
         # Make a pool for your own ptypy objects
         self._pool = {} if BeOwner else None
         self._recs = {} if BeOwner else None
+        # Highest numID per prefix and prefixes with detached records
+        self._recs_top = {} if BeOwner else None
+        self._recs_dirty = {} if BeOwner else None
 
     def _new_ptypy_object(self, obj):
         """
@@ -172,21 +175,53 @@ class Base(object):
                     idx += 1
                     nID = prefix + self._num_to_id(idx)
             
-        d[nID] = obj
-        obj.ID = nID
-        idx = len(d)
-        obj.numID = idx
+        # numIDs are not reused, so objects added after others were
+        # removed from the pool do not share their records
+        if prefix in self._recs_dirty:
+            self._record_table(prefix)
+        idx = self._recs_top.get(prefix, 0) + 1
+        self._recs_top[prefix] = idx
         recs = self._recs[prefix]
         l = len(recs)
         if idx >= l:
-            nl = l + 8192 if idx > 10000 else 2*l
-            recs = np.resize(recs,(nl,))
+            # Grow geometrically, the records of all objects move along
+            new = np.zeros((max(idx + 1, l + max(l // 2, 8)),), dtype=recs.dtype)
+            new[:l] = recs
+            for o in d.values():
+                if o._record.base is recs:
+                    o._record = new[o.numID]
+            recs = new
             self._recs[prefix] = recs
+        d[nID] = obj
+        obj.ID = nID
+        obj.numID = idx
         rec = recs[idx] 
         obj._record = rec
         rec['ID'] = nID
         
         return
+
+    def _record_table(self, prefix):
+        """
+        Structured array with the records of all ptypy objects in the
+        pool with ID prefix `prefix`. The record of the object with
+        numID `i` is row `i` (row 0 and rows of removed objects are
+        unused). Records that are not rows of the table (after loading
+        from file) are moved back in on the first call.
+        """
+        recs = self._recs.get(prefix) if self._recs is not None else None
+        if recs is None:
+            return None
+        if prefix in self._recs_dirty:
+            top = self._recs_top.get(prefix, 0)
+            for obj in self._pool[prefix].values():
+                if obj._record.base is not recs:
+                    recs[obj.numID] = obj._record
+                    obj._record = recs[obj.numID]
+                top = max(top, obj.numID)
+            self._recs_top[prefix] = top
+            self._recs_dirty.pop(prefix, None)
+        return recs[:self._recs_top.get(prefix, 0) + 1]
         
     @staticmethod
     def _num_to_id(num):
@@ -209,6 +244,15 @@ class Base(object):
                 setattr(inst,k ,dct[k])
         if hasattr(inst,'__dict__'):
             inst.__dict__.update(dct)
+
+        # The records of loaded objects are copies, not rows of the tables
+        if getattr(inst, '_recs', None) is not None:
+            if getattr(inst, '_recs_top', None) is None:
+                inst._recs_top = {}
+            inst._recs_dirty = dict.fromkeys(inst._recs, True)
+        else:
+            inst._recs_top = None
+            inst._recs_dirty = None
         
         # Calling post dictionary import routine (empty in base)
         inst._post_dict_import()
@@ -455,6 +499,10 @@ class Storage(Base):
         # MPI flag: is the storage distributed across nodes or are all nodes holding the same copy?
         self._is_scattered = container._is_scattered
 
+        # MPI flag: does each node hold only the tile covered by its active views?
+        self._is_tiled = container._is_tiled
+        self._tile_cache = {}
+
         # Instance attributes
         # self._psize = None
         # SC: defining _psize here leads to failure of the code,
@@ -568,8 +616,7 @@ class Storage(Base):
             the view is actually on self. Use cautiously.
         """
         if v is None:
-            for v in self.views:
-                self.update_views(v)
+            self._update_all_views(self.views)
             return
 
         if not self.ndim == v.ndim:
@@ -597,6 +644,96 @@ class Storage(Base):
         # else:
         #     v.slayer = self.layermap.index(v.layer)
 
+    def _view_rows(self, views):
+        """
+        Rows of `views` in the view table of the owning container.
+        """
+        return np.fromiter((v.numID for v in views), dtype=int, count=len(views))
+
+    def _update_all_views(self, views):
+        """
+        Vectorised :py:meth:`update_views` for a list of views.
+        """
+        if not views:
+            return
+        nd = self.ndim
+        for v in views:
+            if v.ndim != nd:
+                raise ValueError(
+                    'Storage %s(ndim=%d) and View %s(ndim=%d) have conflicting '
+                    'data dimensions' % (self.ID, nd, v.ID, v.ndim))
+
+        table = self.owner.view_table
+        rows = self._view_rows(views)
+
+        # Same operations as in update_views, for all views at once
+        table['psize'][rows, :nd] = self.psize
+        pcoord = self._to_pix(table['coord'][rows, :nd])
+        dcoord = np.round(pcoord + 0.00001).astype(int)
+        shape = table['shape'][rows, :nd]
+        table['dcoord'][rows, :nd] = dcoord
+        table['dlow'][rows, :nd] = dcoord - shape // 2
+        table['dhigh'][rows, :nd] = dcoord + (shape + 1) // 2
+        table['sp'][rows, :nd] = pcoord - dcoord
+
+    def _stacked_data(self, views):
+        """
+        Data of `views` stacked along a new first axis. Views covering
+        whole layers are gathered with a single indexing operation.
+        """
+        table = self.owner.view_table
+        rows = self._view_rows(views)
+        nd = self.ndim
+        full = (not table['dlow'][rows, :nd].any()
+                and (table['dhigh'][rows, :nd] == self.shape[1:]).all())
+        if full:
+            return self.data[table['dlayer'][rows]]
+        return np.array([v.data for v in views])
+
+    def _relayout(self, data, layermap):
+        """
+        Rearrange the buffer `data` (with layers ordered as in
+        self.layermap) for the layers in `layermap`. New layers are
+        filled with self.fill_value.
+
+        If `layermap` only appends layers, the data stays in a buffer
+        whose capacity doubles, so that appending a chunk of layers
+        costs time proportional to the chunk. Unused capacity is
+        allocated but never written.
+        """
+        old = np.asarray(self.layermap, dtype=int)
+        new = np.asarray(layermap, dtype=int)
+        nold, nnew = len(old), len(new)
+
+        if 0 < nold <= nnew and np.array_equal(new[:nold], old):
+            buf = getattr(self, '_buffer', None)
+            if buf is None or data.base is not buf or len(buf) < nnew:
+                buf = np.empty((max(nnew, 2 * nold),) + data.shape[1:], self.dtype)
+                buf[:nold] = data
+                self._buffer = buf
+            out = buf[:nnew]
+            out[nold:].fill(self.fill_value)
+            return out
+
+        out = np.empty((nnew,) + data.shape[1:], self.dtype)
+        found = np.zeros(nnew, dtype=bool)
+        if nold:
+            # Position of the new layers in the old buffer
+            order = np.argsort(old, kind='stable')
+            pos = np.minimum(np.searchsorted(old, new, sorter=order), nold - 1)
+            src = order[pos]
+            found = (old[src] == new)
+            out[found] = data[src[found]]
+        out[~found] = self.fill_value
+        self._buffer = None
+        return out
+
+    def _to_dict(self):
+        # The layer buffer is only an allocation helper for reformat
+        res = super(Storage, self)._to_dict()
+        res.pop('_buffer', None)
+        return res
+
     def reformat(self, newID=None, update=True):
         """
         Crop or pad if required.
@@ -637,31 +774,25 @@ class Storage(Base):
 
         sh = self.data.shape
 
-        # Loop through all active views to get individual boundaries
+        # Bounding box of all active views and their (unique) layers
         dlow_fov = [np.inf] * self.ndim
         dhigh_fov = [-np.inf] * self.ndim
-        layers = []
         dims = list(range(self.ndim))
-        for v in views:
-            if not v.active:
-                continue
-
-            # Accumulate the regions of interest to
-            # compute the full field of view
-            for d in dims:
-                dlow_fov[d] = min(dlow_fov[d], v.dlow[d])
-                dhigh_fov[d] = max(dhigh_fov[d], v.dhigh[d])
-                
-            # Gather a (unique) list of layers
-            if v.layer not in layers:
-                layers.append(v.layer)
+        new_layermap = []
+        if views:
+            table = self.owner.view_table
+            rows = self._view_rows(views)
+            active = rows[table['active'][rows]]
+            if active.size:
+                dlow_fov = table['dlow'][active, :self.ndim].min(0).tolist()
+                dhigh_fov = table['dhigh'][active, :self.ndim].max(0).tolist()
+                new_layermap = np.unique(table['layer'][active]).tolist()
 
         # Check if storage is scattered
         # A storage is "scattered" if and only if layer maps are different across nodes.
-        new_layermap = sorted(layers)
 
-        # Update boundaries
-        if not self._is_scattered and u.parallel.MPIenabled:
+        # Update boundaries, tiles only cover the local views
+        if not self._is_scattered and not self._is_tiled and u.parallel.MPIenabled:
             dlow_fov[:]  = u.parallel.comm.allreduce(dlow_fov,  u.parallel.MPI.MIN)
             dhigh_fov[:] = u.parallel.comm.allreduce(dhigh_fov, u.parallel.MPI.MAX)
 
@@ -669,6 +800,11 @@ class Storage(Base):
         if not views:
             return self
 
+        # A tile without active views stays as it is, its (consistent)
+        # content does not bias the reduction with the other tiles
+        if self._is_tiled and np.isinf(dlow_fov).any():
+            return self
+
         sh = self.data.shape
 
         # Compute Nd misfit (distance between the buffer boundaries and the
@@ -728,26 +864,17 @@ class Storage(Base):
             new_center = self.center
         
         # Deal with layermap
-        if self.layermap != new_layermap:
-            relaid_data = []
-            for i in new_layermap:
-                if i in self.layermap:
-                    # This layer already exists
-                    d = new_data[self.layermap.index(i)]
-                else:
-                    # A new layer
-                    d = np.empty(new_shape[-self.ndim:], self.dtype)
-                    d.fill(self.fill_value)
-                relaid_data.append(d)
-            new_data = np.array(relaid_data)
+        if list(self.layermap) != new_layermap:
+            new_data = self._relayout(new_data, new_layermap)
             new_shape = new_data.shape
             self.layermap = new_layermap
 
         self.nlayers = len(new_layermap)
         
         # set layer index in the view
-        for v in views:
-            v.dlayer = self.layermap.index(v.layer)
+        lm = np.asarray(self.layermap, dtype=int)
+        order = np.argsort(lm, kind='stable')
+        table['dlayer'][rows] = order[np.searchsorted(lm, table['layer'][rows], sorter=order)]
 
         logger.debug('%s[%s] :: shape: %s -> %s'
                      % (self.owner.ID, self.ID, str(sh), str(new_shape)))
@@ -842,18 +969,100 @@ class Storage(Base):
         Performs MPI parallel ``allreduce`` with a default sum as
         reduction operation for internal data buffer ``self.data``.
         This method does nothing if the storage is distributed across
-        nodes.
+        nodes. Tiles of a tiled storage are reduced with their
+        neighbours only, over the regions where they overlap.
 
         :param op: Reduction operation. If ``None`` uses sum.
 
         See also
         --------
         ptypy.utils.parallel.allreduce
+        ptypy.utils.parallel.halo_reduce
         Container.allreduce
         """
-        if not self._is_scattered:
+        if self._is_tiled:
+            u.parallel.halo_reduce(self.data, self.tile_corner, op=op)
+        elif not self._is_scattered:
             u.parallel.allreduce(self.data, op=op)
 
+    @property
+    def tiled(self):
+        """
+        True if each node only holds the tile of this storage that is
+        covered by its active views.
+        """
+        return self._is_tiled
+
+    @property
+    def tile_corner(self):
+        """
+        Position of the upper-left pixel of this storage on the pixel grid
+        shared by the tiles of all nodes.
+        """
+        return tuple(np.floor(0.5 - np.asarray(self.center)).astype(int))
+
+    def _tile_map(self, name):
+        """
+        Coverage or ownership map of this tile, recomputed (collectively)
+        when the extent of any tile has changed.
+        """
+        extent = (tuple(self.shape[1:]), self.tile_corner)
+        if u.parallel.MPIenabled:
+            extent = tuple(u.parallel.comm.allgather(extent))
+        if self._tile_cache.get('extent') != extent:
+            self._tile_cache = {'extent': extent}
+        m = self._tile_cache.get(name)
+        if m is None:
+            if name == 'coverage':
+                m = np.ones(self.shape[1:], dtype=int)
+                u.parallel.halo_reduce(m, self.tile_corner)
+            else:
+                m = np.full(self.shape[1:], u.parallel.rank, dtype=int)
+                op = u.parallel.MPI.MIN if u.parallel.MPIenabled else None
+                u.parallel.halo_reduce(m, self.tile_corner, op=op)
+                m = (m == u.parallel.rank)
+            self._tile_cache[name] = m
+        return m
+
+    def tile_coverage(self):
+        """
+        Number of nodes whose tiles cover each pixel of this storage
+        (without the layer axis). All ones for storages that are not tiled.
+        """
+        if not self._is_tiled:
+            return np.ones(self.shape[1:], dtype=int)
+        return self._tile_map('coverage')
+
+    def tile_owned(self):
+        """
+        Boolean mask of the pixels of this storage (without the layer
+        axis) that are owned by this node, i.e. the pixels for which it
+        has the lowest rank among the nodes covering them. Each pixel of
+        the full storage is owned by exactly one node.
+        """
+        if not self._is_tiled:
+            return np.ones(self.shape[1:], dtype=bool)
+        return self._tile_map('owned')
+
+    def gather_tiles(self):
+        """
+        Assemble the tiles of all nodes at the master node.
+
+        Returns
+        -------
+        data, center : ndarray, ndarray
+            Data buffer covering all tiles and its :py:attr:`center` at
+            the master node, ``(None, None)`` elsewhere. The storage's
+            own buffer and center for storages that are not tiled.
+        """
+        if not self._is_tiled:
+            return self.data, self.center
+        data, corner = u.parallel.gather_tiles(self.data, self.tile_corner,
+                                               fill=self.fill_value)
+        if data is None:
+            return None, None
+        return data, self.center + (np.array(self.tile_corner) - corner)
+
     def zoom_to_psize(self, new_psize, **kwargs):
         """
         Changes pixel size and zooms the data buffer along last two axis
@@ -1289,7 +1498,9 @@ class View(Base):
 
     def copy(self,ID=None, update = True):
         nView = View(self.owner, ID)
-        nView._record = self._record.copy()
+        nID = nView.ID
+        self.owner._recs[VIEW_PREFIX][nView.numID] = self._record
+        nView._record['ID'] = nID
         nView._ndim = self._ndim
         nView.storage = self.storage
         nView.storageID = self.storageID
@@ -1567,7 +1778,9 @@ class Container(Base):
             dimension of data, can be 2 or 3
 
         distribution : str
-            Indicates if the data is "cloned" in all MPI processes or "scattered"
+            Indicates if the data is "cloned" in all MPI processes, "scattered"
+            or "tiled", i.e. each process only holds the region of each storage
+            covered by its active views, see :py:meth:`Storage.allreduce`
 
         """
 
@@ -1584,8 +1797,9 @@ class Container(Base):
         # self.original = original if original is not None else self
         self.original = self
 
-        # boolean parameter for distributed containers
+        # boolean parameters for distributed containers
         self._is_scattered = (distribution == "scattered")
+        self._is_tiled = (distribution == "tiled")
 
     @property
     def copies(self):
@@ -1665,6 +1879,20 @@ class Container(Base):
         """
         return self._pool.get(VIEW_PREFIX, {})
 
+    @property
+    def view_table(self):
+        """
+        A property that returns the records of all :any:`View` instances
+        in this :any:`Container` as a numpy structured array.
+
+        Row ``v.numID`` holds the fields `active`, `dlayer`, `layer`,
+        `dlow`, `dhigh`, `shape`, `dcoord`, `psize`, `coord` and `sp` of
+        View `v` (padded to 5 dimensions). Views store their attributes
+        in these rows, so the table can be used for vectorised access
+        and assignments to it act on the views.
+        """
+        return self.original._record_table(VIEW_PREFIX)
+
     @property
     def Vp(self):
         """
@@ -1710,8 +1938,9 @@ class Container(Base):
                  If True (default), return only active views.
         """
         if active_only:
+            active = self.view_table['active'] if self.original.V else None
             return [v for v in self.original.V.values()
-                    if v.active and (v.storageID == s.ID)]
+                    if v.storageID == s.ID and active[v.numID]]
         else:
             return [v for v in self.original.V.values()
                     if (v.storage.ID == s.ID)]
@@ -1741,6 +1970,8 @@ class Container(Base):
                               ID=ID,
                               data_type=data_type)
         new_cont.original = self
+        # Copies of a tiled container hold the same tiles
+        new_cont._is_tiled = self._is_tiled
 
         # If changing data type, avoid casting by producing empty buffers
         if (dtype is not None) and (fill is None):
@@ -1763,6 +1994,14 @@ class Container(Base):
         for s in self.storages.values():
             s.fill(fill)
 
+    @property
+    def tiled(self):
+        """
+        True if the storages of this container are tiled across nodes,
+        see :py:attr:`Storage.tiled`.
+        """
+        return self._is_tiled
+
     def allreduce(self, op=None):
         """
         Performs MPI parallel ``allreduce`` with a sum as reduction
@@ -1812,6 +2051,97 @@ class Container(Base):
         # Return new storage
         return s
 
+    def new_views(self, storageID, coords=None, layers=0, shape=None,
+                  psize=DEFAULT_PSIZE, active=True):
+        """
+        Create many :any:`View` instances on the same storage at once.
+
+        Equivalent to creating a View with accessrule ``{'storageID':
+        storageID, 'shape': shape, 'psize': psize, 'coord': coords[i],
+        'layer': layers[i], 'active': active[i]}`` for every `i`, but the
+        attributes are written to the view table and the pixel
+        coordinates are computed for all views in one go.
+
+        Parameters
+        ----------
+        storageID : str
+            ID of the storage. It is created if it does not exist.
+
+        coords : array-like or None
+            Physical coordinates of the view centers, ``(N, ndim)`` or a
+            single coordinate for all views.
+
+        layers : int or array-like
+            Layer index of each view, or one layer for all views.
+
+        shape : int or tuple of int
+            Shape of the views in pixels, None for full frame.
+
+        psize : float or tuple of float
+            Pixel size of the views.
+
+        active : bool or array-like of bool
+            Active state of each view, or one state for all views.
+
+        Returns
+        -------
+        views : list of View
+        """
+        layers = np.atleast_1d(np.asarray(layers, dtype=int))
+        active = np.atleast_1d(np.asarray(active, dtype=bool))
+        n = max(len(layers), len(active))
+        if coords is not None:
+            coords = np.asarray(coords, dtype=float)
+            if coords.ndim == 2:
+                n = max(n, len(coords))
+            else:
+                coords = coords.reshape((1, -1))
+        layers = np.broadcast_to(layers, (n,))
+        active = np.broadcast_to(active, (n,))
+        if n == 0:
+            return []
+
+        if coords is None:
+            coord = None
+        elif coords.shape[1] == 1:
+            coord = float(coords[0, 0])
+        else:
+            coord = coords[0]
+
+        # The first view creates the storage if needed and sets the
+        # common attributes
+        first = View(self, accessrule={'storageID': storageID,
+                                       'shape': shape,
+                                       'psize': psize,
+                                       'coord': coord,
+                                       'layer': layers[0],
+                                       'active': active[0]})
+        views = [first]
+        for i in range(1, n):
+            v = View(self)
+            v._ndim = first._ndim
+            v.storage = first.storage
+            v.storageID = first.storageID
+            views.append(v)
+        if n == 1:
+            return views
+
+        table = self.view_table
+        rows = first.storage._view_rows(views[1:])
+        IDs = table['ID'][rows]
+        table[rows] = table[first.numID]
+        table['ID'][rows] = IDs
+        nd = first._ndim
+        if coords is not None:
+            table['coord'][rows, :nd] = np.broadcast_to(coords, (n, nd))[1:]
+        table['layer'][rows] = layers[1:]
+        table['active'][rows] = active[1:]
+
+        # As in View.__init__, only active views are placed in the storage
+        first.storage._update_all_views(
+            [v for v, act in zip(views, active) if act])
+        return views
+
     def reformat(self, also_in_copies=False):
         """
         Reformats all storages in this container.
@@ -19,7 +19,10 @@ This file is part of the PTYPY package.
 """
 import numpy as np
 import os
+import time
+import threading
 import h5py
+from collections.abc import Mapping
 from . import geometry
 from . import xy
 from .. import utils as u
@@ -49,6 +52,62 @@ __all__ = ['PtyScan', 'PTYD', 'PtydScan',
            'MoonFlowerScan']
 
 
+def h5py_mpio_available():
+    """
+    True if several MPI processes run and h5py supports parallel HDF5.
+    """
+    return parallel.MPIenabled and h5py.get_config().mpi
+
+
+class FrameBlock(Mapping):
+    """
+    Read-only mapping of scan point indices to the frames of a single
+    array, frames along its first axis.
+
+    Used in place of a dict of frames, so that a chunk can be
+    preprocessed and stored as a whole without stacking, copying or
+    splitting single frames. Frames are views into :py:attr:`array`.
+    """
+
+    def __init__(self, indices, array):
+        self.indices = list(indices)
+        self.array = array
+        if len(self.indices) != len(array):
+            raise ValueError('Got %d indices for %d frames.'
+                             % (len(self.indices), len(array)))
+        self._rows = dict((index, row) for row, index in enumerate(self.indices))
+
+    def __getitem__(self, index):
+        return self.array[self._rows[index]]
+
+    def __iter__(self):
+        return iter(self.indices)
+
+    def __len__(self):
+        return len(self.indices)
+
+
+def _as_frames(frames, indices):
+    """
+    Frames as returned by :py:meth:`PtyScan.load`, as a mapping from scan
+    point index to frame. Arrays holding one frame per index are wrapped
+    in a :py:class:`FrameBlock` without copying.
+    """
+    if isinstance(frames, np.ndarray):
+        return FrameBlock(indices, frames) if len(frames) else {}
+    return frames
+
+
+def _stack_frames(frames, indices):
+    """
+    Frames of mapping `frames` for `indices`, stacked into one array.
+    The array of a matching :py:class:`FrameBlock` is returned as it is.
+    """
+    if isinstance(frames, FrameBlock) and frames.indices == list(indices):
+        return frames.array
+    return np.array([frames[ind] for ind in indices])
+
+
 @defaults_tree.parse_doc('scandata.PtyScan')
 class PtyScan(object):
     """
@@ -99,6 +158,17 @@ class PtyScan(object):
         in the path given by the link. Links file paths are relative to master file.
     userlevel = 1
 
+    [save_parallel]
+    type = bool
+    default = False
+    help = Write saved chunks with parallel HDF5
+    doc = If ``True`` and h5py is built against parallel HDF5, each process
+       writes its own frames collectively into the chunk file (h5py
+       ``driver='mpio'``) for the ``'append'`` and ``'link'`` modes, instead
+       of gathering all frames at the master node. Falls back to gathering
+       if parallel HDF5 is not available. Frames are stored uncompressed.
+    userlevel = 2
+
     [auto_center]
     type = bool
     default = None
@@ -115,6 +185,22 @@ class PtyScan(object):
     help = Determines what will be loaded in parallel
     doc = Choose from ``None``, ``'data'``, ``'common'``, ``'all'``
 
+    [mpi_distribution]
+    type = str
+    default = index
+    help = How frames are distributed among the MPI processes
+    doc = Choose
+       <newline>
+       - ``'index'``: each chunk is split into contiguous blocks of frame indices
+       - ``'hilbert'``: contiguous sections of a Hilbert curve through the scan positions
+       - ``'morton'``: contiguous sections of a Morton (Z-order) curve through the scan positions
+       <newline>
+       The space-filling curves give each process a spatially compact set of frames, so its
+       object storage stays small. They need all scan positions at initialization
+       (``positions_theory`` or :py:meth:`load_positions`), otherwise frames are
+       distributed by index.
+    userlevel = 2
+
     [rebin]
     type = int
     default = None
@@ -288,6 +374,12 @@ class PtyScan(object):
         self.load_common_in_parallel = (lp == 'all' or lp == 'common')
         self.load_in_parallel = (lp == 'all' or lp == 'data')
 
+        # Rank of each frame, if distributed along a space-filling curve
+        self._frame_ranks = None
+
+        # Number of data packages prepared ahead by a PtyScanPrefetcher
+        self.prefetch_depth = 0
+
         # Set data chunk and frame counters to zero
         self.framestart = 0
         self.chunknum = 0
@@ -424,6 +516,21 @@ class PtyScan(object):
             logger.warning(
                 'Number of frames `num_frames` not specified at this stage.')
 
+        curve = self.info.mpi_distribution
+        if curve is not None and str(curve) != 'index':
+            pos = self.info.positions_theory
+            if pos is None and self.has_positions:
+                pos = positions
+            if pos is None or np.shape(pos)[-1] != 2:
+                logger.warning('Distribution of frames along a %s curve needs '
+                               'all 2D scan positions. Distributing by index.'
+                               % curve)
+            else:
+                pos = np.asarray(pos)[:self.num_frames]
+                self._frame_ranks = parallel.space_filling_ranks(pos, curve)
+                logger.info('Frames are distributed along a %s curve '
+                            'through the scan positions.' % curve)
+
         # A note about how much this scan class knows about the number
         # of frames expected. PtydScan uses this information.
         self.meta.num_frames = self.num_frames
@@ -634,7 +741,12 @@ class PtyScan(object):
         indices.chunk = list(range(start, start + step))
 
         # Let parallel.loadmanager take care of assigning indices to nodes
-        indices.lm = parallel.loadmanager.assign(indices.chunk)
+        ranks = self._frame_ranks
+        if ranks is not None and start + step <= len(ranks):
+            indices.lm = parallel.loadmanager.assign_ranks(
+                indices.chunk, ranks[start:start + step])
+        else:
+            indices.lm = parallel.loadmanager.assign(indices.chunk)
         # This one contains now a list of indices listed after rank
 
         # Index list (node specific)
@@ -688,7 +800,11 @@ class PtyScan(object):
                     altweight = self.info.weight2d
                 except:
                     altweight = np.ones(dsh)
-            weights = dict.fromkeys(data.keys(), altweight)
+            if isinstance(data, FrameBlock):
+                weights = FrameBlock(data.indices, np.broadcast_to(
+                    altweight, (len(data),) + np.shape(altweight)))
+            else:
+                weights = dict.fromkeys(data.keys(), altweight)
 
         assert len(weights) == len(data), (
             'Data and Weight frames unbalanced %d vs %d'
@@ -761,11 +877,11 @@ class PtyScan(object):
                 '(crop/pad %s, rebin %s, flip/rotate %s) ... \n'
                 % (str(do_crop), str(do_rebin), str(do_flip)))
 
-            # We proceed with numpy arrays.That is probably now more memory
-            # intensive but shorter in writing
+            # We proceed with numpy arrays, frames loaded as one block
+            # are used without copying
             if has_data:
-                d = np.array([data[ind] for ind in indices.node])
-                w = np.array([weights[ind] for ind in indices.node])
+                d = _stack_frames(data, indices.node)
+                w = _stack_frames(weights, indices.node)
             else:
                 d = np.ones((1,) + tuple(dsh))
                 w = np.ones((1,) + tuple(dsh))
@@ -817,9 +933,9 @@ class PtyScan(object):
             w = np.ascontiguousarray(w)
 
             if has_data:
-                # Translate back to dictionaries
-                data = dict(zip(indices.node, d))
-                weights = dict(zip(indices.node, w))
+                # Keep the frames in one block
+                data = FrameBlock(indices.node, d)
+                weights = FrameBlock(indices.node, w)
 
         # Adapt geometric info
         self.meta.center = cen / float(self.rebin)
@@ -928,6 +1044,10 @@ class PtyScan(object):
         out['chunk'] = chunk
         
         # The "iterable" part
+        masks = chunk.weights
+        if isinstance(masks, FrameBlock):
+            # All masks at once, frames are views
+            masks = FrameBlock(masks.indices, masks.array > 0)
         iterables = []
         for pos, index in zip(chunk.positions, chunk.indices):
             frame = {'index': index,
@@ -945,8 +1065,11 @@ class PtyScan(object):
                     fallback = self.weight2d
                 except AttributeError:
                     fallback = np.ones_like(frame['data'])
-                w = chunk.weights.get(index, fallback)
-                frame['mask'] = (w > 0)
+                if isinstance(masks, FrameBlock) and index in masks:
+                    frame['mask'] = masks[index]
+                else:
+                    w = chunk.weights.get(index, fallback)
+                    frame['mask'] = (w > 0)
 
             iterables.append(frame)
 
@@ -968,26 +1091,34 @@ class PtyScan(object):
         if self.load_in_parallel:
             # All nodes load raw_data and slice according to indices
             raw, pos, weights = self.load(indices=indices.node)
+            raw = _as_frames(raw, indices.node)
+            weights = _as_frames(weights, indices.node)
 
             # Gather position information as every node needs it later
             pos = parallel.gather_dict(pos)
         else:
             if parallel.master:
                 raw, pos, weights = self.load(indices=indices.chunk)
+                raw = _as_frames(raw, indices.chunk)
+                weights = _as_frames(weights, indices.chunk)
             else:
                 raw = {}
                 pos = {}
                 weights = {}
             # Distribute raw data across nodes according to indices
-            raw = parallel.bcast_dict(raw, indices.node)
-            weights = parallel.bcast_dict(weights, indices.node)
+            if parallel.MPIenabled:
+                raw = parallel.bcast_dict(raw, indices.node)
+                weights = parallel.bcast_dict(weights, indices.node)
 
         # (re)distribute position information - every node should now be
         # aware of all positions
         pos = parallel.bcast_dict(pos)
 
         # Prepare data across nodes
+        keys = list(raw.keys())
         data, weights = self.correct(raw, weights, self.common)
+        data = _as_frames(data, keys)
+        weights = _as_frames(weights, keys)
 
         return data, pos, weights
 
@@ -1077,6 +1208,10 @@ class PtyScan(object):
             and whose values are the respective frame / position according
             to the scan point index. `weight` and `positions` may be empty
 
+            `raw` and `weight` may also be arrays with the frames for
+            `indices` along the first axis. Such blocks are preprocessed
+            and stored without splitting them into single frames.
+
         Note
         ----
         This is the *most* important method to change when subclassing
@@ -1178,6 +1313,12 @@ class PtyScan(object):
         # Gather all distributed dictionary data.
         c = chunk if chunk is not None else self.chunk
 
+        # Let every node write its own frames if we can
+        if (self.info.get('save_parallel') and str(kind) in ['append', 'link']
+                and h5py_mpio_available()):
+            if self._mpio_save_chunk(kind, c):
+                return
+
         # Shallow copy
         todisk = dict(c)
         num = todisk.pop('num')
@@ -1206,7 +1347,9 @@ class PtyScan(object):
             elif str(kind) == 'link':
                 h5address = 'chunks/%d' % num
                 hddaddress = self.dfile + '.part%03d' % num
-                io.h5write(hddaddress, todisk)
+                # Frame stacks are at the root of the linked file
+                chunks = {'chunks': io.h5options['CHUNKS']}
+                io.h5write(hddaddress, todisk, h5layout={'data': chunks, 'weights': chunks})
 
                 with h5py.File(self.dfile, 'a') as f:
                     f[h5address] = h5py.ExternalLink(hddaddress, '/')
@@ -1217,6 +1360,237 @@ class PtyScan(object):
                                           'is not yet implemented.')
         parallel.barrier()
 
+    def _mpio_save_chunk(self, kind, chunk):
+        """
+        Collective variant of :py:meth:`_mpi_save_chunk`. Each node writes
+        its frames of `chunk` into the chunk file opened with the 'mpio'
+        driver, nothing is gathered at the master node. The file layout
+        is the same as with h5append/h5write (without compression).
+
+        Returns False, before touching the file, if the chunk contains
+        items that cannot be written this way.
+        """
+        num = chunk['num']
+        ind = chunk['indices_node']
+
+        frames = {}
+        other = {}
+        for k, v in chunk.items():
+            if k in ['num', 'indices_node']:
+                continue
+            elif k in ['data', 'weights']:
+                frames[k] = v if hasattr(v, 'items') else dict(zip(ind, np.asarray(v)))
+            else:
+                other[k] = v
+
+        # Everything but the frames is written by the master node
+        other = parallel.bcast_dict(other)
+        for k, v in other.items():
+            if np.asarray(v).dtype.kind in 'OUS':
+                logger.info('Cannot write %s collectively, gathering chunk '
+                            'at master node instead.' % k)
+                return False
+
+        # Frame shapes and the global frame order
+        layout = {}
+        for k, v in frames.items():
+            info = {}
+            for j, a in v.items():
+                a = np.asarray(a)
+                info[j] = (a.shape, a.dtype.str)
+            parallel.allgather_dict(info)
+            keys = sorted(info.keys())
+            if keys:
+                sh, dt = info[keys[0]]
+            else:
+                sh, dt = (0,), np.dtype(float).str
+            layout[k] = (keys, (len(keys),) + tuple(sh), dt)
+
+        if str(kind) == 'append':
+            filename = self.dfile
+            h5address = 'chunks/%d' % num
+            mode = 'a'
+        else:
+            filename = self.dfile + '.part%03d' % num
+            h5address = None
+            mode = 'w'
+
+        if parallel.master:
+            base = os.path.split(os.path.abspath(filename))[0]
+            if not os.path.exists(base):
+                os.makedirs(base)
+        parallel.barrier()
+
+        # All metadata operations are collective, data writes independent
+        kw = dict(driver='mpio', comm=parallel.comm) if parallel.MPIenabled else {}
+        with h5py.File(filename, mode, **kw) as f:
+            if h5address is None:
+                group = f
+                ctime = parallel.bcast_dict({'t': time.asctime()})['t']
+                f.attrs['h5rw_version'] = io.h5options['H5RW_VERSION']
+                f.attrs['ctime'] = ctime
+                f.attrs['mtime'] = ctime
+            else:
+                if h5address in f:
+                    del f[h5address]
+                group = f.create_group(h5address)
+                group.attrs['type'] = 'dict'
+
+            for k, v in other.items():
+                a = np.asarray(v)
+                dset = group.create_dataset(k, shape=a.shape, dtype=a.dtype)
+                dset.attrs['type'] = 'arraylist' if type(v) is list else 'array'
+                if parallel.master:
+                    dset[...] = a
+
+            for k, (keys, sh, dt) in layout.items():
+                dset = group.create_dataset(k, shape=sh, dtype=dt)
+                dset.attrs['type'] = 'array'
+                rows = dict(zip(keys, range(len(keys))))
+                for j, a in frames[k].items():
+                    dset[rows[j]] = a
+
+        if parallel.master and h5address is None:
+            with h5py.File(self.dfile, 'a') as f:
+                f['chunks/%d' % num] = h5py.ExternalLink(filename, '/')
+
+        parallel.barrier()
+        return True
+
+
+class PtyScanPrefetcher(object):
+    """
+    Prepare data packages of a :py:class:`PtyScan` in a background thread.
+
+    :py:meth:`auto` replaces ``ptyscan.auto``. The thread calls
+    ``ptyscan.auto`` ahead of the requests, with the number of frames of
+    the latest request, and keeps up to `depth` data packages ready.
+    If `max_memory` (bytes) is given, no further package is prepared
+    while the ready ones hold at least that many bytes of frames.
+
+    :py:meth:`auto` returns a ready package if there is one. Otherwise
+    it waits for the package in preparation, unless the scan has
+    signalled WAIT, in which case WAIT is returned at once while the
+    thread keeps polling every `poll` seconds.
+
+    ``PtyScan.auto`` uses collective MPI calls, so the prefetcher is only
+    meant for single-process runs.
+
+    The depth is stored as ``ptyscan.prefetch_depth``, so that scans which
+    return frames in reused buffers can keep enough of them: up to `depth`
+    ready packages, the one being loaded and the one being consumed.
+    """
+
+    def __init__(self, ptyscan, depth=2, max_memory=None, poll=0.5):
+        self.ptyscan = ptyscan
+        self.depth = max(int(depth), 1)
+        self.max_memory = max_memory
+        self.poll = poll
+        self._frames = None
+        self._ready = []
+        self._nbytes = 0
+        self._waiting = False
+        self._done = False
+        self._stop = False
+        self._error = None
+        self._thread = None
+        self._cond = threading.Condition()
+        ptyscan.prefetch_depth = self.depth
+
+    @staticmethod
+    def _package_nbytes(dp):
+        """
+        Bytes held by the frames of data package `dp`.
+        """
+        nbytes = 0
+        for k in ['data', 'weights']:
+            frames = dp['chunk'].get(k)
+            if isinstance(frames, FrameBlock):
+                nbytes += frames.array.nbytes
+            elif frames:
+                nbytes += sum(np.asarray(f).nbytes for f in frames.values())
+        return nbytes
+
+    def _full(self):
+        if len(self._ready) >= self.depth:
+            return True
+        return (self.max_memory is not None and len(self._ready) > 0
+                and self._nbytes >= self.max_memory)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stop and self._full():
+                    self._cond.wait()
+                if self._stop:
+                    return
+                frames = self._frames
+
+            try:
+                msg = self.ptyscan.auto(frames)
+            except Exception as e:
+                logger.error('Prefetching data failed: %s' % e)
+                with self._cond:
+                    self._error = e
+                    self._done = True
+                    self._cond.notify_all()
+                return
+
+            with self._cond:
+                if msg == WAIT:
+                    self._waiting = True
+                    self._cond.notify_all()
+                    self._cond.wait(self.poll)
+                elif msg == EOS:
+                    self._done = True
+                    self._cond.notify_all()
+                    return
+                else:
+                    nbytes = self._package_nbytes(msg)
+                    self._ready.append((msg, nbytes))
+                    self._nbytes += nbytes
+                    self._waiting = False
+                    self._cond.notify_all()
+
+    @property
+    def pending(self):
+        """ Number of data packages ready to be picked up. """
+        return len(self._ready)
+
+    def auto(self, frames):
+        """
+        Prefetching version of :py:meth:`PtyScan.auto`.
+        """
+        with self._cond:
+            self._frames = frames
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            while not (self._ready or self._done or self._waiting):
+                self._cond.wait()
+            if self._ready:
+                dp, nbytes = self._ready.pop(0)
+                self._nbytes -= nbytes
+                self._cond.notify_all()
+                return dp
+            if self._error is not None:
+                e, self._error = self._error, None
+                raise e
+            return EOS if self._done else WAIT
+
+    def close(self):
+        """
+        Stop the background thread after its current call. Ready
+        packages are dropped.
+        """
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self._ready = []
+        self._nbytes = 0
+
 
 @defaults_tree.parse_doc('scandata.PtydScan')
 class PtydScan(PtyScan):
@@ -1245,8 +1619,20 @@ class PtydScan(PtyScan):
     help = Alternate source file path if data is meant to be reprocessed.
     doc = `None` for input shall be deprecated in future
 
+    [memmap]
+    default = True
+    type = bool
+    help = Memory-map uncompressed datasets of the source file
+    doc = Datasets of the source chunks that are stored contiguously, or one frame per chunk
+      without any filter (e.g. written with ``io.h5options['COMPRESSION'] = 'none'``), are not
+      read through h5py. Their frames are read-only views into a memory map of the file, so
+      each process only touches the pages of the frames it loads. Other datasets are read
+      with h5py.
+
     """
 
+    LOADED_KEYS = ['data', 'positions', 'weights']
+
     def __init__(self, pars=None, **kwargs):
         """
         PtyScan provided by native "ptyd" file format.
@@ -1351,6 +1737,12 @@ class PtydScan(PtyScan):
         # Other instance attributes
         self._checked = {}
         self._ch_frame_ind = None
+        # key -> chunk number -> (filename, dtype, frame shape, frame offsets)
+        self._layout = {}
+        # Layouts found by check() since the last load, to be broadcast
+        self._layout_new = {}
+        # filename -> memory map of the whole file
+        self._maps = {}
 
     def check(self, frames=None, start=None):
         """
@@ -1381,6 +1773,20 @@ class PtydScan(PtyScan):
                 d[ch_key] = np.array([(int(k),) + v[ch_key].shape
                                       for k, v in ch_items if v is not None])
 
+            # Locate the frames of new chunks in their files
+            if self.info.memmap:
+                for ch_key in self.LOADED_KEYS:
+                    layout = self._layout.setdefault(ch_key, {})
+                    for k, v in ch_items:
+                        if k in layout or ch_key not in v:
+                            continue
+                        dset = v[ch_key]
+                        offsets = self._frame_offsets(dset)
+                        layout[k] = None if offsets is None else (
+                            dset.file.filename, dset.dtype.str,
+                            dset.shape[1:], offsets)
+                        self._layout_new.setdefault(ch_key, {})[k] = layout[k]
+
             f.close()
 
         self._checked = d
@@ -1400,6 +1806,70 @@ class PtydScan(PtyScan):
     def _coord_to_h5_calls(self, key, coord):
         return 'chunks/%d/%s' % (coord[0], key), slice(coord[1], coord[1] + 1)
 
+    @staticmethod
+    def _frame_offsets(dset):
+        """
+        Byte offsets of the frames of `dset` (entries along its first
+        axis) in its file. None if the dataset cannot be memory-mapped,
+        because it is filtered, not chunked frame by frame or not
+        fully allocated.
+        """
+        if (dset.ndim == 0 or dset.dtype.kind not in 'biufc'
+                or dset.is_virtual or dset.external):
+            return None
+        n = dset.shape[0]
+        frame_bytes = int(np.prod(dset.shape[1:])) * dset.dtype.itemsize
+        if dset.chunks is None:
+            offset = dset.id.get_offset()
+            if offset is None:
+                return None
+            return offset + frame_bytes * np.arange(n, dtype=np.int64)
+
+        if (dset.id.get_create_plist().get_nfilters() > 0
+                or dset.chunks != (1,) + dset.shape[1:]
+                or dset.id.get_num_chunks() != n):
+            return None
+        offsets = np.empty(n, dtype=np.int64)
+        for i in range(n):
+            info = dset.id.get_chunk_info(i)
+            offsets[info.chunk_offset[0]] = info.byte_offset
+        return offsets
+
+    def _mapped_frames(self, key, coords):
+        """
+        Read-only views of the frames at chunk coordinates `coords` of
+        dataset `key`, as one array if the frames follow each other in
+        the same file, else as a list. None if a frame is not memory-mapped.
+        """
+        layout = self._layout.get(key, {})
+        frames = []
+        block = None
+        for ch, fr in coords:
+            lay = layout.get(ch)
+            if lay is None:
+                return None
+            filename, dtype, shape, offsets = lay
+            dtype = np.dtype(dtype)
+            frame_bytes = int(np.prod(shape)) * dtype.itemsize
+            offset = int(offsets[fr])
+            buf = self._maps.get(filename)
+            if buf is None or len(buf) < offset + frame_bytes:
+                # New file, or one that has grown since it was mapped
+                buf = self._maps[filename] = np.memmap(filename, np.uint8, mode='r')
+            frame = (buf, dtype, shape, offset)
+            if block is None:
+                block = frame
+            elif block and (buf is not block[0] or dtype != block[1]
+                            or shape != block[2]
+                            or offset != block[3] + len(frames) * frame_bytes):
+                block = False
+            frames.append(np.ndarray(shape, dtype, buf, offset))
+
+        if block:
+            buf, dtype, shape, offset = block
+            return np.ndarray((len(frames),) + tuple(shape), dtype, buf, offset)
+        return frames
+
     def load_weight(self):
         if 'weight2d' in self.info:
             return self.info.weight2d
@@ -1421,30 +1891,44 @@ class PtydScan(PtyScan):
         parallel.barrier()
         self._checked = parallel.bcast_dict(self._checked)
 
+        # Only the layouts of chunks that are new since the last load
+        new = parallel.bcast(self._layout_new)
+        self._layout_new = {}
+        if not parallel.master:
+            for key, layout in new.items():
+                self._layout.setdefault(key, {}).update(layout)
+
         # Get the coordinates in the chunks
         coords = self._ch_frame_ind[indices]
         calls = {}
+        out = {}
 
-        for key in self._checked.keys():
-            calls[key] = [self._coord_to_h5_calls(key, c) for c in coords]
+        for key in self.LOADED_KEYS:
+            if key not in self._checked:
+                continue
+            frames = self._mapped_frames(key, coords) if len(coords) else None
+            if frames is None:
+                calls[key] = [self._coord_to_h5_calls(key, c) for c in coords]
+            elif isinstance(frames, np.ndarray) and key != 'positions':
+                # A block of frames, wrapped by the pipeline
+                out[key] = frames
+            else:
+                out[key] = dict(zip(indices, frames))
 
-        # Get our data from the ptyd file
-        out = {}
-        with h5py.File(self.source, 'r') as f:
-            for array, call in calls.items():
-                out[array] = [np.squeeze(f[path][slce]) for path, slce in call]
+        # Get the rest of our data from the ptyd file
+        if calls:
+            with h5py.File(self.source, 'r') as f:
+                for array, call in calls.items():
+                    out[array] = dict(zip(indices, [np.squeeze(f[path][slce])
+                                                    for path, slce in call]))
 
-            f.close()
+                f.close()
 
         # If the chunk provided indices, we use those instead of our own
         # Dangerous and not yet implemented
         # indices = out.get('indices', indices)
 
-        # Wrap in a dict
-        for k, v in out.items():
-            out[k] = dict(zip(indices, v))
-
-        return (out.get(key, {}) for key in ['data', 'positions', 'weights'])
+        return (out.get(key, {}) for key in self.LOADED_KEYS)
 
 
 @defaults_tree.parse_doc('scandata.MoonFlowerScan')
@@ -1588,14 +2072,14 @@ class MoonFlowerScan(PtyScan):
     def load(self, indices):
         p = self.pixel
         s = self.geo.shape
-        raw = {}
+        raw = np.empty((len(indices),) + tuple(s), dtype=np.int32)
 
         if self.p.add_poisson_noise:
             logger.info("Generating data with poisson noise.")
         else:
             logger.info("Generating data without poisson noise.")
 
-        for k in indices:
+        for j, k in enumerate(indices):
             intensity_j = u.abs2(self.geo.propagator.fw(
                 self.pr * self.obj[p[k][0]:p[k][0] + s[0],
                                    p[k][1]:p[k][1] + s[1]]))
@@ -1604,9 +2088,9 @@ class MoonFlowerScan(PtyScan):
                 intensity_j = u.gf(intensity_j, self.p.psf)
 
             if self.p.add_poisson_noise:
-                raw[k] = np.random.poisson(intensity_j).astype(np.int32)
+                raw[j] = np.random.poisson(intensity_j)
             else:
-                raw[k] = intensity_j.astype(np.int32)
+                raw[j] = intensity_j
 
 
         return raw, {}, {}
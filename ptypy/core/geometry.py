@@ -6,7 +6,11 @@ This file is part of the PTYPY package.
     :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
     :license: see LICENSE for details.
 """
+import os
+import pickle
+import threading
 import numpy as np
+from collections import OrderedDict
 from scipy import fftpack
 
 from .. import utils as u
@@ -14,14 +18,19 @@ from ..utils.verbose import logger
 from .classes import Base, GEO_PREFIX
 from ..utils.descriptor import EvalDescriptor
 
+try:
+    import scipy.fft as scipy_fft
+except ImportError:
+    scipy_fft = None
+
 try:
     import pyfftw
-    import pyfftw.interfaces.numpy_fft as fftw_np
 except ImportError:
-    pass
+    pyfftw = None
     #logger.warning("Unable to import pyFFTW! Will use a slower FFT method.")
 
-__all__ = ['Geo', 'BasicNearfieldPropagator', 'BasicFarfieldPropagator']
+__all__ = ['Geo', 'BasicNearfieldPropagator', 'BasicFarfieldPropagator',
+           'FFT_BACKENDS', 'register_fft']
 
 
 _old2new = u.Param(
@@ -116,6 +125,23 @@ class Geo(Base):
     choices = 'numpy', 'scipy', 'fftw'
     userlevel = 1
 
+    [fftworkers]
+    type = int
+    default = 1
+    help = Number of threads for each FFT
+    doc = Passed as ``workers`` to scipy.fft and as ``threads`` to pyFFTW. Ignored by numpy.
+    lowlim = 1
+    userlevel = 2
+
+    [fftw_wisdom]
+    type = str
+    default = None
+    help = File to keep FFTW wisdom in between runs
+    doc = If set, FFTW wisdom is imported from this file the first time a plan is
+      needed and written back whenever new plans have been created. Only used if
+      ``ffttype`` is ``'fftw'``.
+    userlevel = 2
+
     [shape]
     type = int, tuple
     default = 256
@@ -437,10 +463,152 @@ def get_propagator(geo_dct, **kwargs):
     """
     Helper function to determine propagator to be attached to Geometry class.
     """
+    fft_kwargs = dict(ffttype=geo_dct["ffttype"],
+                      fftworkers=geo_dct.get("fftworkers", 1),
+                      fftw_wisdom=geo_dct.get("fftw_wisdom", None))
     if geo_dct['propagation'] == 'farfield':
-        return BasicFarfieldPropagator(geo_dct, ffttype=geo_dct["ffttype"], **kwargs)
+        return BasicFarfieldPropagator(geo_dct, **fft_kwargs, **kwargs)
     else:
-        return BasicNearfieldPropagator(geo_dct, ffttype=geo_dct["ffttype"], **kwargs)
+        return BasicNearfieldPropagator(geo_dct, **fft_kwargs, **kwargs)
+
+
+FFT_BACKENDS = dict()
+
+
+def register_fft(name):
+    """
+    FFT backend registration decorator.
+
+    The decorated factory is called as ``factory(workers, wisdom)`` and
+    returns a pair of 2D transforms ``(fft, ifft)`` over the last two axes,
+    with call signature ``f(x, out=None)``. The inverse is normalised like
+    numpy's. If `out` is given, the result is written to it (`out` may be
+    `x` itself) and returned, otherwise a new array of the same dtype as
+    `x` is returned.
+    """
+    def decorator(factory):
+        FFT_BACKENDS[name] = factory
+        return factory
+    return decorator
+
+
+def _to_out(y, x, out):
+    if out is None:
+        return np.ascontiguousarray(y.astype(x.dtype, copy=False))
+    if y is not out:
+        out[...] = y
+    return out
+
+
+@register_fft('numpy')
+def _numpy_fft(workers=1, wisdom=None):
+    def fft(x, out=None):
+        return _to_out(np.fft.fft2(x), x, out)
+
+    def ifft(x, out=None):
+        return _to_out(np.fft.ifft2(x), x, out)
+    return fft, ifft
+
+
+@register_fft('scipy')
+def _scipy_fft(workers=1, wisdom=None):
+    if scipy_fft is None:
+        def fft(x, out=None):
+            return _to_out(fftpack.fft2(x), x, out)
+
+        def ifft(x, out=None):
+            return _to_out(fftpack.ifft2(x), x, out)
+        return fft, ifft
+
+    def fft(x, out=None):
+        return _to_out(scipy_fft.fft2(x, workers=workers, overwrite_x=out is x), x, out)
+
+    def ifft(x, out=None):
+        return _to_out(scipy_fft.ifft2(x, workers=workers, overwrite_x=out is x), x, out)
+    return fft, ifft
+
+
+# FFTW plans keyed by shape, dtype, direction, in-place and threads, kept
+# per calling thread (executing a plan on new arrays rebinds the plan).
+# The plans of a thread go with it, and only the most recently used
+# FFTW_MAX_PLANS are kept.
+FFTW_MAX_PLANS = 16
+_fftw_local = threading.local()
+_fftw_lock = threading.Lock()
+_fftw_wisdom_loaded = set()
+
+
+def _fftw_load_wisdom(path):
+    path = os.path.expanduser(path)
+    if path in _fftw_wisdom_loaded:
+        return
+    _fftw_wisdom_loaded.add(path)
+    if not os.path.exists(path):
+        return
+    try:
+        with open(path, 'rb') as f:
+            pyfftw.import_wisdom(pickle.load(f))
+        logger.info('Imported FFTW wisdom from %s' % path)
+    except Exception as e:
+        logger.warning('Could not import FFTW wisdom from %s (%s)' % (path, e))
+
+
+def _fftw_save_wisdom(path):
+    path = os.path.expanduser(path)
+    try:
+        d = os.path.dirname(path)
+        if d and not os.path.exists(d):
+            os.makedirs(d)
+        tmp = path + '.%d.tmp' % os.getpid()
+        with open(tmp, 'wb') as f:
+            pickle.dump(pyfftw.export_wisdom(), f)
+        os.replace(tmp, path)
+    except Exception as e:
+        logger.warning('Could not save FFTW wisdom to %s (%s)' % (path, e))
+
+
+def _fftw_plan(x, inplace, direction, workers, wisdom):
+    key = (x.shape, x.dtype.str, inplace, direction, workers)
+    plans = getattr(_fftw_local, 'plans', None)
+    if plans is None:
+        plans = _fftw_local.plans = OrderedDict()
+    plan = plans.get(key)
+    if plan is not None:
+        plans.move_to_end(key)
+        return plan
+    # The FFTW planner is not thread-safe
+    with _fftw_lock:
+        if wisdom:
+            _fftw_load_wisdom(wisdom)
+        a = pyfftw.empty_aligned(x.shape, dtype=x.dtype)
+        b = a if inplace else pyfftw.empty_aligned(x.shape, dtype=x.dtype)
+        plan = pyfftw.FFTW(a, b, axes=(-2, -1), direction=direction,
+                           flags=('FFTW_MEASURE', 'FFTW_UNALIGNED'), threads=workers)
+        if wisdom:
+            _fftw_save_wisdom(wisdom)
+    plans[key] = plan
+    if len(plans) > FFTW_MAX_PLANS:
+        plans.popitem(last=False)
+    return plan
+
+
+@register_fft('fftw')
+def _fftw_fft(workers=1, wisdom=None):
+    def transform(x, out, direction):
+        if x.dtype not in (np.complex64, np.complex128) or not x.flags.c_contiguous:
+            x = np.ascontiguousarray(x, dtype=np.result_type(x.dtype, np.complex64))
+        inplace = out is x
+        plan = _fftw_plan(x, inplace, direction, workers, wisdom)
+        if out is None:
+            out = np.empty_like(x)
+        return plan(x, out)
+
+    def fft(x, out=None):
+        return transform(x, out, 'FFTW_FORWARD')
+
+    def ifft(x, out=None):
+        return transform(x, out, 'FFTW_BACKWARD')
+    return fft, ifft
 
 
 class FFTchooser(object):
@@ -448,7 +616,7 @@ class FFTchooser(object):
     Chooses the desired FFT algo, and assigns scaling.
     If pyFFTW is not available, falls back to scipy.
     """
-    def __init__(self, ffttype='scipy'):
+    def __init__(self, ffttype='scipy', workers=1, wisdom=None):
         """
         Parameters
         ----------
@@ -458,25 +626,28 @@ class FFTchooser(object):
             - 'fftw' for pyFFTW
             - 'numpy' for numpy.fft.fft2
             - 'scipy' for scipy.fft.fft2
+            - any other name registered with :py:func:`register_fft`
             - 2 or 4-tuple of (forward_fft2(), inverse_fft2(),
               [scaling, inverse_scaling])
+
+        workers : int
+            Number of threads for each transform, if supported by the library.
+
+        wisdom : str or None
+            File to load and save FFTW wisdom.
         """
         self.ffttype = ffttype
+        self.workers = workers
+        self.wisdom = wisdom
 
     def _FFTW_fft(self):
-        pyfftw.interfaces.cache.enable()
-        pyfftw.interfaces.cache.set_keepalive_time(15.0)
-        pe = 'FFTW_MEASURE'
-        self.fft = lambda x: fftw_np.fft2(x, planner_effort=pe)
-        self.ifft = lambda x: fftw_np.ifft2(x, planner_effort=pe)
+        self.fft, self.ifft = FFT_BACKENDS['fftw'](self.workers, self.wisdom)
 
     def _scipy_fft(self):
-        self.fft = lambda x: fftpack.fft2(x).astype(x.dtype)
-        self.ifft = lambda x: fftpack.ifft2(x).astype(x.dtype)
+        self.fft, self.ifft = FFT_BACKENDS['scipy'](self.workers, self.wisdom)
 
     def _numpy_fft(self):
-        self.fft = lambda x: np.ascontiguousarray(np.fft.fft2(x).astype(x.dtype))
-        self.ifft = lambda x: np.ascontiguousarray(np.fft.ifft2(x).astype(x.dtype))
+        self.fft, self.ifft = FFT_BACKENDS['numpy'](self.workers, self.wisdom)
 
     def assign_scaling(self, shape):
         if isinstance(self.ffttype, tuple) and len(self.ffttype) > 2:
@@ -490,17 +661,20 @@ class FFTchooser(object):
 
     def assign_fft(self):
         if str(self.ffttype) == 'fftw':
-            try:
+            if pyfftw is not None:
                 self._FFTW_fft()
-            except NameError:
+            else:
                 self._scipy_fft()
         elif str(self.ffttype) == 'scipy':
             self._scipy_fft()
         elif str(self.ffttype) == 'numpy':
             self._numpy_fft()
+        elif str(self.ffttype) in FFT_BACKENDS:
+            self.fft, self.ifft = FFT_BACKENDS[self.ffttype](self.workers, self.wisdom)
         elif isinstance(self.ffttype, tuple):
-            self.fft = self.ffttype[0]
-            self.ifft = self.ffttype[1]
+            fft, ifft = self.ffttype[0], self.ffttype[1]
+            self.fft = lambda x, out=None: _to_out(fft(x), x, out)
+            self.ifft = lambda x, out=None: _to_out(ifft(x), x, out)
 
         return (self.fft, self.ifft)
 
@@ -515,7 +689,7 @@ class BasicFarfieldPropagator(object):
     coordinates are rolled periodically, just like in the conventional fft case.
     """
 
-    def __init__(self, geo_pars=None, ffttype='scipy', **kwargs):
+    def __init__(self, geo_pars=None, ffttype='scipy', fftworkers=1, fftw_wisdom=None, **kwargs):
         """
         Parameters
         ----------
@@ -530,6 +704,12 @@ class BasicFarfieldPropagator(object):
             - 'scipy' for scipy.fft.fft2
             - 2 or 4-tuple of (forward_fft2(), inverse_fft2(),
               [scaling, inverse_scaling])
+
+        fftworkers : int
+            Number of threads for each FFT.
+
+        fftw_wisdom : str or None
+            File to load and save FFTW wisdom.
         """
         # Instance attributes
         self.crop_pad = None
@@ -542,6 +722,8 @@ class BasicFarfieldPropagator(object):
         self.post_fft = None
         self.pre_ifft = None
         self.post_ifft = None
+        self.post_fft_sc = None
+        self.post_ifft_isc = None
 
         # Get default parameters and update
         self.p = u.Param(Geo.DEFAULT)
@@ -549,7 +731,7 @@ class BasicFarfieldPropagator(object):
             self.dtype = kwargs['dtype']
         else:
             self.dtype = np.complex128
-        self.FFTch = FFTchooser(ffttype)
+        self.FFTch = FFTchooser(ffttype, fftworkers, fftw_wisdom)
         self.fft, self.ifft = self.FFTch.assign_fft()
         self.update(geo_pars, **kwargs)
 
@@ -631,45 +813,51 @@ class BasicFarfieldPropagator(object):
         self.post_ifft = self.pre_fft.conj()
         self.sc, self.isc = self.FFTch.assign_scaling(self.sh)
 
+        # Fused post-fft factors including the scaling
+        self.post_fft_sc = self.post_fft * self.sc
+        self.post_ifft_isc = self.post_ifft * self.isc
 
-    def fw(self, W):
+    def fw(self, W, out=None):
         """
         Computes forward propagated wavefront of input wavefront W.
+        If `out` is given (it may be `W` itself), the result is stored there.
         """
         # Check for cropping
-
         if (self.crop_pad != 0).any():
             w = u.crop_pad(W, self.crop_pad)
-        else:
-            w = W
-
-        w = self.post_fft * self.sc * self.fft(self.pre_fft * w)
-
-        # Cropping again
-        if (self.crop_pad != 0).any():
-            return u.crop_pad(w, -self.crop_pad)
-        else:
+            w = self.post_fft_sc * self.fft(self.pre_fft * w)
+            w = u.crop_pad(w, -self.crop_pad)
+            if out is not None:
+                out[...] = w
+                return out
             return w
 
-    def bw(self, W):
+        # Phase ramps are applied in place, around an in-place fft
+        w = np.multiply(self.pre_fft, W, out=out)
+        self.fft(w, out=w)
+        return np.multiply(self.post_fft_sc, w, out=w)
+
+    def bw(self, W, out=None):
         """
         Computes backward propagated wavefront of input wavefront W.
+        If `out` is given (it may be `W` itself), the result is stored there.
         """
         # Check for cropping
         if (self.crop_pad != 0).any():
             w = u.crop_pad(W, self.crop_pad)
-        else:
-            w = W
-
-        # Compute transform
-        w = self.ifft(self.pre_ifft * w) * self.isc * self.post_ifft
-
-        # Cropping again
-        if (self.crop_pad != 0).any():
-            return u.crop_pad(w, -self.crop_pad)
-        else:
+            w = self.ifft(self.pre_ifft * w) * self.post_ifft_isc
+            w = u.crop_pad(w, -self.crop_pad)
+            if out is not None:
+                out[...] = w
+                return out
             return w
 
+        # Phase ramps are applied in place, around an in-place ifft
+        w = np.multiply(self.pre_ifft, W, out=out)
+        self.ifft(w, out=w)
+        w *= self.post_ifft_isc
+        return w
+
 
 def translate_to_pix(sh, center):
     """
@@ -694,7 +882,7 @@ class BasicNearfieldPropagator(object):
     Basic two step (i.e. two ffts) Nearfield Propagator.
     """
 
-    def __init__(self, geo_pars=None, ffttype='scipy', **kwargs):
+    def __init__(self, geo_pars=None, ffttype='scipy', fftworkers=1, fftw_wisdom=None, **kwargs):
         """
         Parameters
         ----------
@@ -709,6 +897,12 @@ class BasicNearfieldPropagator(object):
             - 'scipy' for scipy.fft.fft2
             - 2 or 4-tuple of (forward_fft2(),inverse_fft2(),
               [scaling,inverse_scaling])
+
+        fftworkers : int
+            Number of threads for each FFT.
+
+        fftw_wisdom : str or None
+            File to load and save FFTW wisdom.
         """
         # Instance attributes
         self.sh = None
@@ -721,7 +915,7 @@ class BasicNearfieldPropagator(object):
         self.p = u.Param(Geo.DEFAULT)
         self.dtype = kwargs['dtype'] if 'dtype' in kwargs else np.complex128
         self.update(geo_pars, **kwargs)
-        self.FFTch = FFTchooser(ffttype)
+        self.FFTch = FFTchooser(ffttype, fftworkers, fftw_wisdom)
         self.fft, self.ifft = self.FFTch.assign_fft()
 
     def update(self, geo_pars=None, **kwargs):
@@ -759,17 +953,23 @@ class BasicNearfieldPropagator(object):
         # self.kernel = np.fft.fftshift(self.kernel)
         self.ikernel = self.kernel.conj()
 
-    def fw(self, W):
+    def fw(self, W, out=None):
         """
         Computes forward propagated wavefront of input wavefront W.
+        If `out` is given (it may be `W` itself), the result is stored there.
         """
-        return self.ifft(self.fft(W) * self.kernel)
+        w = self.fft(W, out=out)
+        w *= self.kernel
+        return self.ifft(w, out=w)
 
-    def bw(self, W):
+    def bw(self, W, out=None):
         """
         Computes backward propagated wavefront of input wavefront W.
+        If `out` is given (it may be `W` itself), the result is stored there.
         """
-        return self.ifft(self.fft(W) * self.ikernel)
+        w = self.fft(W, out=out)
+        w *= self.ikernel
+        return self.ifft(w, out=w)
 
 
 ############
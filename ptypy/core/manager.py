@@ -35,6 +35,9 @@ from .. import defaults_tree
 FType = np.float64
 CType = np.complex128
 
+# Number of frames stacked at a time for the diffraction statistics
+STATS_BLOCK = 64
+
 __all__ = ['ModelManager', 'ScanModel', 'Full', 'Vanilla', 'Bragg3dModel', 'OPRModel', 'BlockScanModel',
            'BlockVanilla', 'BlockFull', 'BlockOPRModel']
 
@@ -80,6 +83,22 @@ class ScanModel(object):
     doc = Choose from "numpy", "scipy" or "fftw"
     userlevel = 1
 
+    [fftworkers]
+    type = int
+    default = 1
+    help = Number of threads for each FFT
+    doc = Passed as ``workers`` to scipy.fft and as ``threads`` to pyFFTW. Ignored by numpy.
+    lowlim = 1
+    userlevel = 2
+
+    [fftw_wisdom]
+    type = str
+    default = None
+    help = File to keep FFTW wisdom in between runs
+    doc = If set, FFTW wisdom is imported from this file and updated whenever new plans have been
+      created. Only used if ``ffttype`` is ``'fftw'``.
+    userlevel = 2
+
     [data]
     default =
     type = @scandata.*
@@ -107,6 +126,24 @@ class ScanModel(object):
     help = Resampling fraction of the image frames w.r.t. diffraction frames
     doc = A resampling of 2 means that the image frame is to be sampled (in the detector plane) twice
           as densely as the raw diffraction data.
+
+    [prefetch]
+    type = int
+    default = 0
+    help = Number of data chunks prepared ahead in a background thread
+    doc = If larger than 0, the data of this scan is read and preprocessed in a background
+          thread, so that loading overlaps with engine iterations. At most this many
+          prepared chunks wait to be picked up. Not available in MPI runs.
+    lowlim = 0
+    userlevel = 2
+
+    [prefetch_memory]
+    type = float
+    default = None
+    help = Memory limit for prefetched chunks in MB
+    doc = No further chunk is prepared ahead while the waiting chunks hold this much
+          data. ``None`` means no limit.
+    userlevel = 2
     """
     _PREFIX = MODEL_PREFIX
 
@@ -135,6 +172,7 @@ class ScanModel(object):
 
         # Create Associated PtyScan object
         self.ptyscan = self.makePtyScan(self.p.data)
+        self._prefetcher = None
 
         # Initialize instance attributes
         self.mask = None
@@ -209,16 +247,8 @@ class ScanModel(object):
 
         report_time('ptyscan init')
 
-        # Get data
-        logger.info('Importing data from scan %s.' % self.label)
-
-        dp = self.ptyscan.auto(max_frames)
-        #dp = self.ptyscan.auto(self.frames_per_call)
-
-        self.data_available = (dp != data.EOS)
-        logger.debug(u.verbose.report(dp))
-
-        if dp == data.WAIT or not self.data_available:
+        dp = self._get_data(max_frames)
+        if dp is None:
             return None
 
         label = self.label
@@ -329,17 +359,17 @@ class ScanModel(object):
         report_time('creating views and storages')
         logger.info('Inserting data in diff and mask storages')
 
-        # Second pass: copy the data 
-        # Benchmark: scales quadratic (!!) with number of frames per node.
+        # Second pass: copy the data
+        diff_layer = {idx: l for l, idx in enumerate(self.diff.layermap)}
+        mask_layer = {idx: l for l, idx in enumerate(self.mask.layermap)}
         for dct in dp['iterable']:
             if dct['data'] is None:
                 continue
             diff_data = dct['data']
             idx = dct['index']
 
-            # FIXME: Find a more transparent way than this.
-            self.diff.data[self.diff.layermap.index(idx)][:] = diff_data
-            self.mask.data[self.mask.layermap.index(idx)][:] = dct.get('mask', np.ones_like(diff_data))
+            self.diff.data[diff_layer[idx]][:] = diff_data
+            self.mask.data[mask_layer[idx]][:] = dct.get('mask', np.ones_like(diff_data))
 
         # Update maximum nr. of frames in a block
         self.max_frames_per_block = self.diff.nlayers
@@ -430,17 +460,26 @@ class ScanModel(object):
         mean_frame = np.zeros_like(max_frame)
         norm = np.zeros_like(max_frame)
 
-        for maview, diview in zip(mask_views, diff_views):
+        # Work on blocks of consecutive active views sharing storages,
+        # which bounds the memory for the stacked frames
+        runs = []
+        for diview, maview in zip(diff_views, mask_views):
             if not diview.active:
                 continue
-            dv = diview.data
-            m = maview.data
-            v = m * dv
-            Itotal.append(np.sum(v))
-            max_frame[max_frame < v] = v[max_frame < v]
-            min_frame[min_frame > v] = v[min_frame > v]
-            mean_frame += v
-            norm += m
+            key = (diview.storageID, maview.storageID)
+            if not runs or runs[-1][0] != key or len(runs[-1][1]) == STATS_BLOCK:
+                runs.append((key, [], []))
+            runs[-1][1].append(diview)
+            runs[-1][2].append(maview)
+
+        for key, dviews, mviews in runs:
+            m = mviews[0].storage._stacked_data(mviews)
+            v = m * dviews[0].storage._stacked_data(dviews)
+            Itotal.extend(v.reshape(len(v), -1).sum(-1))
+            np.fmax(max_frame, np.fmax.reduce(v, axis=0), out=max_frame)
+            np.fmin(min_frame, np.fmin.reduce(v, axis=0), out=min_frame)
+            mean_frame += v.sum(0)
+            norm += m.sum(0)
 
         parallel.allreduce(mean_frame)
         parallel.allreduce(norm)
@@ -473,6 +512,43 @@ class ScanModel(object):
         """
         raise NotImplementedError
 
+    def _pop_new_views(self):
+        """
+        Take all (diff view, mask view) pairs waiting for pods out of
+        new_diff_views and new_mask_views.
+        """
+        pairs = list(zip(self.new_diff_views, self.new_mask_views))
+        del self.new_diff_views[:]
+        del self.new_mask_views[:]
+        return pairs
+
+    @staticmethod
+    def _group_by_storage(diff_views):
+        """
+        Indices of the (diff view, mask view) pairs in `diff_views`,
+        grouped by the storage of the diff view.
+        """
+        groups = OrderedDict()
+        for i, (dv, mv) in enumerate(diff_views):
+            groups.setdefault(dv.storageID, []).append(i)
+        return groups
+
+    @staticmethod
+    def _adopt_frames(storage, frames, layermap):
+        """
+        Use the array of :py:class:`~ptypy.core.data.FrameBlock` `frames`
+        as data buffer of `storage` if its frames are ordered as in
+        `layermap` and cover the storage. The array is only copied if it
+        has to be cast or made contiguous. Returns True if the storage
+        holds the frames.
+        """
+        if not isinstance(frames, data.FrameBlock):
+            return False
+        if frames.indices != list(layermap) or frames.array.shape != storage.shape:
+            return False
+        storage.data = np.require(frames.array, storage.dtype, ['C', 'A', 'W'])
+        return True
+
     def _initialize_geo(self, common):
         """
         Initialize the geometry/geometries based on input data package
@@ -493,7 +569,21 @@ class ScanModel(object):
     def _get_data(self, max_frames):
         # Get data
         logger.info('Importing data from scan %s.' % self.label)
-        dp = self.ptyscan.auto(max_frames)
+        if self.p.prefetch > 0 and self._prefetcher is None:
+            if parallel.MPIenabled:
+                logger.warning('Prefetching data is not available with MPI, '
+                               'scan %s is loaded synchronously.' % self.label)
+                self.p.prefetch = 0
+            else:
+                max_memory = self.p.prefetch_memory
+                if max_memory is not None:
+                    max_memory = max_memory * 2**20
+                self._prefetcher = data.PtyScanPrefetcher(
+                    self.ptyscan, depth=self.p.prefetch, max_memory=max_memory)
+        if self._prefetcher is not None:
+            dp = self._prefetcher.auto(max_frames)
+        else:
+            dp = self.ptyscan.auto(max_frames)
 
         self.data_available = (dp != data.EOS)
 
@@ -505,6 +595,14 @@ class ScanModel(object):
         else:
             return dp
 
+    def close(self):
+        """
+        Stop the background prefetching of data, if any.
+        """
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+            self._prefetcher = None
+
 
 @defaults_tree.parse_doc('scan.BlockScanModel')
 class BlockScanModel(ScanModel):
@@ -557,52 +655,33 @@ class BlockScanModel(ScanModel):
         mask = self.Cmask.new_storage(shape=sh, psize=self.psize, padonly=True,
                                       fill=1.0, layermap=indices_node)
 
-        # Prepare for View generation
-        AR_diff = DEFAULT_ACCESSRULE.copy()
-        AR_diff.shape = self.diff_shape # this is None due to init
-        AR_diff.coord = 0.0
-        AR_diff.psize = self.psize
-        AR_mask = AR_diff.copy()
-        AR_diff.storageID = diff.ID
-        AR_mask.storageID = mask.ID
-
-        diff_views = []
-        mask_views = []
-        positions = []
-
-        dv = None
-        mv = None
-
         data = chunk['data']
         weights = chunk['weights']
 
-        # First pass: create or update views and reformat corresponding storage
-        for index in chunk['indices']:
-
-            if dv is None:
-                dv = View(self.Cdiff, accessrule=AR_diff)  # maybe use index here
-                mv = View(self.Cmask, accessrule=AR_mask)
-            else:
-                dv = dv.copy()
-                mv = mv.copy()
-
+        # Create all views at once, inactive for frames of other nodes
+        indices = list(chunk['indices'])
+        active = [data.get(index) is not None for index in indices]
+        diff_views = self.Cdiff.new_views(diff.ID, coords=0.0, layers=indices,
+                                          shape=self.diff_shape, psize=self.psize,
+                                          active=active)
+        mask_views = self.Cmask.new_views(mask.ID, coords=0.0, layers=indices,
+                                          shape=self.diff_shape, psize=self.psize,
+                                          active=active)
+
+        # Fill the storages, frame blocks are used as storage buffers
+        diff_filled = self._adopt_frames(diff, data, indices_node)
+        mask_filled = self._adopt_frames(mask, weights, indices_node)
+        dlayer = {index: l for l, index in enumerate(indices_node)}
+        for dv, mv, index in zip(diff_views, mask_views, indices):
             maybe_data = data.get(index)
-            active = maybe_data is not None
-
-            dv.active = active
-            mv.active = active
-            dv.layer = index
-            mv.layer = index
-
-            diff_views.append(dv)
-            mask_views.append(mv)
-
-            if active:
-                l = indices_node.index(index)
+            if maybe_data is not None:
+                l = dlayer[index]
                 dv.dlayer = l
                 mv.dlayer = l
-                dv.data[:] = maybe_data
-                mv.data[:] = weights.get(index, np.ones_like(maybe_data))
+                if not diff_filled:
+                    dv.data[:] = maybe_data
+                if not mask_filled:
+                    mv.data[:] = weights.get(index, np.ones_like(maybe_data))
 
                 # positions
         positions = chunk.positions
@@ -693,63 +772,37 @@ class _Vanilla(object):
 
         geometry = self.geometries[0]
 
-        pv = None
-        ev = None
-        ov = None
-        ndim = self.Cdiff.ndim
-
-        # Loop through diffraction patterns
-        for i in range(len(self.new_diff_views)):
-            dv, mv = self.new_diff_views.pop(0), self.new_mask_views.pop(0)
-
-            # Create views
-            # if True:
-            if pv is None:
-                pv = View(container=self.ptycho.probe,
-                      accessrule={'shape': self.probe_shape,
-                                  'psize': geometry.resolution,
-                                  'coord': u.expectN(0.0, ndim),
-                                  'storageID': ID,
-                                  'layer': 0,
-                                  'active': True})
-            else:
-                pv = pv.copy(update=False)
-                pv.coord = 0.0
-
-            # if True:
-            if ov is None:
-                ov = View(container=self.ptycho.obj,
-                      accessrule={'shape': self.object_shape,
-                                  'psize': geometry.resolution,
-                                  'coord': self.new_positions[i],
-                                  'storageID': ID,
-                                  'layer': 0,
-                                  'active': True})
-            else:
-                ov = ov.copy(update=False)
-                ov.coord = self.new_positions[i]
-
-            # if True:
-            if ev is None:
-                ev = View(container=self.ptycho.exit,
-                      accessrule={'shape': self.exit_shape,
-                                  'psize': geometry.resolution,
-                                  'coord': u.expectN(0.0, ndim),
-                                  'storageID': dv.storageID,
-                                  'layer': dv.layer,
-                                  'active': dv.active})
-            else: 
-                ev = ev.copy(update=False)
-                ev.storageID = dv.storageID
-                ev.layer = dv.layer
-                ev.active = dv.active
-                ev.coord = 0.0
-
-            views = {'probe': pv,
-                     'obj': ov,
+        diff_views = self._pop_new_views()
+        positions = np.asarray(self.new_positions)
+
+        # Create all probe, object and exit views at once, the exit
+        # views per diffraction storage
+        probe_views = self.ptycho.probe.new_views(
+            ID, coords=0.0, layers=np.zeros(len(diff_views), dtype=int),
+            shape=self.probe_shape, psize=geometry.resolution)
+        # Object views of other nodes' frames are inactive in a tiled
+        # object, so that the tiles only cover the local frames
+        object_views = self.ptycho.obj.new_views(
+            ID, coords=positions, layers=np.zeros(len(diff_views), dtype=int),
+            shape=self.object_shape, psize=geometry.resolution,
+            active=([dv.active for dv, mv in diff_views]
+                    if self.ptycho.obj.tiled else True))
+        exit_views = [None] * len(diff_views)
+        for sID, idx in self._group_by_storage(diff_views).items():
+            views = self.ptycho.exit.new_views(
+                sID, coords=0.0,
+                layers=[diff_views[i][0].layer for i in idx],
+                shape=self.exit_shape, psize=geometry.resolution,
+                active=[diff_views[i][0].active for i in idx])
+            for i, ev in zip(idx, views):
+                exit_views[i] = ev
+
+        for i, (dv, mv) in enumerate(diff_views):
+            views = {'probe': probe_views[i],
+                     'obj': object_views[i],
                      'diff': dv,
                      'mask': mv,
-                     'exit': ev}
+                     'exit': exit_views[i]}
 
             pod = POD(ptycho=self.ptycho,
                       ID=None,
@@ -784,6 +837,8 @@ class _Vanilla(object):
         geo_pars.center = center
         geo_pars.propagation = self.p.propagation
         geo_pars.ffttype = self.p.ffttype
+        geo_pars.fftworkers = self.p.fftworkers
+        geo_pars.fftw_wisdom = self.p.fftw_wisdom
         geo_pars.psize = psize
 
         # make a Geo instance and fix resolution
@@ -950,102 +1005,107 @@ class _Full(object):
         object_id = 'S' + self.label
         probe_id = 'S' + self.label
 
-        # Loop through diffraction patterns
-        for i in range(len(self.new_diff_views)):
-            dv, mv = self.new_diff_views.pop(0), self.new_mask_views.pop(0)
+        diff_views = self._pop_new_views()
+        if not diff_views:
+            return new_pods, new_probe_ids, new_object_ids
+        groups = self._group_by_storage(diff_views)
+
+        npm = self.p.coherence.num_probe_modes
+        nom = self.p.coherence.num_object_modes
+        nmodes = npm * nom
+
+        # Views of all pods, keyed by (diffraction frame, geometry)
+        pod_views = {}
+
+        # For multiwavelength reconstructions: loop here over
+        # geometries, and modify probe_id and object_id.
+        for ii, geometry in enumerate(self.geometries):
+            # Make new IDs and keep them in record
+            # sharing_rules is not aware of IDs with suffix
 
-            # For stochastic engines (e.g. ePIE) we only need one exit buffer
-            if self._single_exit_buffer_for_all_views:
-                index = 0
+            pdis = self.p.coherence.probe_dispersion
+
+            if pdis is None or str(pdis) == 'achromatic':
+                gind = 0
             else:
-                index = dv.layer
+                gind = ii
 
-            # Object and probe position
-            pos_pr = u.expect2(0.0)
-            pos_obj = self.new_positions[i] if 'empty' not in self.p.tags else 0.0
+            probe_id_suf = probe_id + 'G%02d' % gind
+            if (probe_id_suf not in new_probe_ids.keys()
+                    and probe_id_suf not in existing_probes):
+                new_probe_ids[probe_id_suf] = True
 
-            # For multiwavelength reconstructions: loop here over
-            # geometries, and modify probe_id and object_id.
-            for ii, geometry in enumerate(self.geometries):
-                # Make new IDs and keep them in record
-                # sharing_rules is not aware of IDs with suffix
+            odis = self.p.coherence.object_dispersion
 
-                pdis = self.p.coherence.probe_dispersion
+            if odis is None or str(odis) == 'achromatic':
+                gind = 0
+            else:
+                gind = ii
+
+            object_id_suf = object_id + 'G%02d' % gind
+            if (object_id_suf not in new_object_ids.keys()
+                    and object_id_suf not in existing_objects):
+                new_object_ids[object_id_suf] = True
+
+            for sID, idx in groups.items():
+                nf = len(idx)
+                # Probe and object mode of each view, modes vary fastest
+                pm = np.tile(np.repeat(np.arange(npm), nom), nf)
+                om = np.tile(np.arange(nom), nf * npm)
+
+                # Object position
+                if 'empty' in self.p.tags:
+                    pos_obj = 0.0
+                else:
+                    pos_obj = np.repeat(np.asarray(self.new_positions)[idx], nmodes, axis=0)
 
-                if pdis is None or str(pdis) == 'achromatic':
-                    gind = 0
+                # For stochastic engines (e.g. ePIE) we only need one exit buffer
+                if self._single_exit_buffer_for_all_views:
+                    index = np.zeros(nf * nmodes, dtype=int)
                 else:
-                    gind = ii
+                    index = np.repeat([diff_views[i][0].layer for i in idx], nmodes)
+
+                # Make a unique layer index for exit view
+                # The actual number does not matter due to the
+                # layermap access
+                exit_index = index * 10000 + pm * 100 + om
+
+                pvs = self.ptycho.probe.new_views(
+                    probe_id_suf, coords=0.0, layers=pm,
+                    shape=self.probe_shape, psize=geometry.resolution)
+                ovs = self.ptycho.obj.new_views(
+                    object_id_suf, coords=pos_obj, layers=om,
+                    shape=self.object_shape, psize=geometry.resolution,
+                    active=(np.repeat([diff_views[i][0].active for i in idx], nmodes)
+                            if self.ptycho.obj.tiled else True))
+                evs = self.ptycho.exit.new_views(
+                    sID + 'G%02d' % ii, coords=0.0, layers=exit_index,
+                    shape=self.exit_shape, psize=geometry.resolution,
+                    active=np.repeat([diff_views[i][0].active for i in idx], nmodes))
+
+                for k, i in enumerate(idx):
+                    sl = slice(k * nmodes, (k + 1) * nmodes)
+                    pod_views[(i, ii)] = (pvs[sl], ovs[sl], evs[sl])
+
+        # Create the pods in order of frames, geometries and modes
+        for i, (dv, mv) in enumerate(diff_views):
+            for ii, geometry in enumerate(self.geometries):
+                for pv, ov, ev in zip(*pod_views[(i, ii)]):
+                    views = {'probe': pv,
+                             'obj': ov,
+                             'diff': dv,
+                             'mask': mv,
+                             'exit': ev}
 
-                probe_id_suf = probe_id + 'G%02d' % gind
-                if (probe_id_suf not in new_probe_ids.keys()
-                        and probe_id_suf not in existing_probes):
-                    new_probe_ids[probe_id_suf] = True
+                    pod = POD(ptycho=self.ptycho,
+                              ID=None,
+                              views=views,
+                              geometry=geometry)  # , meta=meta)
 
-                odis = self.p.coherence.object_dispersion
+                    new_pods.append(pod)
 
-                if odis is None or str(odis) == 'achromatic':
-                    gind = 0
-                else:
-                    gind = ii
-
-                object_id_suf = object_id + 'G%02d' % gind
-                if (object_id_suf not in new_object_ids.keys()
-                        and object_id_suf not in existing_objects):
-                    new_object_ids[object_id_suf] = True
-
-                # Loop through modes
-                for pm in range(self.p.coherence.num_probe_modes):
-                    for om in range(self.p.coherence.num_object_modes):
-                        # Make a unique layer index for exit view
-                        # The actual number does not matter due to the
-                        # layermap access
-                        exit_index = index * 10000 + pm * 100 + om
-
-                        # Create views
-                        # Please note that mostly references are passed,
-                        # i.e. the views do mostly not own the accessrule
-                        # contents
-                        pv = View(container=self.ptycho.probe,
-                                  accessrule={'shape': self.probe_shape,
-                                              'psize': geometry.resolution,
-                                              'coord': pos_pr,
-                                              'storageID': probe_id_suf,
-                                              'layer': pm,
-                                              'active': True})
-
-                        ov = View(container=self.ptycho.obj,
-                                  accessrule={'shape': self.object_shape,
-                                              'psize': geometry.resolution,
-                                              'coord': pos_obj,
-                                              'storageID': object_id_suf,
-                                              'layer': om,
-                                              'active': True})
-
-                        ev = View(container=self.ptycho.exit,
-                                  accessrule={'shape': self.exit_shape,
-                                              'psize': geometry.resolution,
-                                              'coord': pos_pr,
-                                              'storageID': (dv.storageID +
-                                                            'G%02d' % ii),
-                                              'layer': exit_index,
-                                              'active': dv.active})
-
-                        views = {'probe': pv,
-                                 'obj': ov,
-                                 'diff': dv,
-                                 'mask': mv,
-                                 'exit': ev}
-
-                        pod = POD(ptycho=self.ptycho,
-                                  ID=None,
-                                  views=views,
-                                  geometry=geometry)  # , meta=meta)
-
-                        new_pods.append(pod)
-
-                        pod.probe_weight = 1.0
-                        pod.object_weight = 1.0
+                    pod.probe_weight = 1.0
+                    pod.object_weight = 1.0
 
         return new_pods, new_probe_ids, new_object_ids
 
@@ -1074,6 +1134,8 @@ class _Full(object):
         # Add propagation info from this scan model
         geo_pars.propagation = self.p.propagation
         geo_pars.ffttype = self.p.ffttype
+        geo_pars.fftworkers = self.p.fftworkers
+        geo_pars.fftw_wisdom = self.p.fftw_wisdom
 
         # The multispectral case will have multiple geometries
         for ii, fac in enumerate(self.p.coherence.energies):
@@ -1646,6 +1708,13 @@ class ModelManager(object):
     def data_available(self):
         return any(s.data_available for s in list(self.scans.values()))
 
+    def close(self):
+        """
+        Release the resources held by the scan models.
+        """
+        for scan in self.scans.values():
+            scan.close()
+
     def new_data(self):
         """
         Get all new diffraction patterns and create all views and pods
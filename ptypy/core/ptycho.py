@@ -88,7 +88,12 @@ class Ptycho(Base):
     default = 'single'
     help = Reconstruction floating number precision
     doc = Reconstruction floating number precision (``'single'`` or
-          ``'double'``)
+          ``'double'``). In ``'single'`` mode storages, propagators and
+          the temporary arrays of the numpy and serial engines are kept in
+          float32/complex64, while reductions (errors, norms, dot products
+          and line-search coefficients) are accumulated in double precision.
+          Use the ``'scipy'`` or ``'fftw'`` ffttype in this mode, ``'numpy'``
+          transforms internally in double precision.
     type = str
     userlevel = 1
 
@@ -109,6 +114,21 @@ class Ptycho(Base):
     lowlim = 1
     userlevel = 1
 
+    [object_distribution]
+    default = 'cloned'
+    help = Distribution of the object among MPI processes
+    doc = With ``'cloned'``, every process holds the whole object and it is allreduced
+          after each update. With ``'tiled'``, each process only holds the tile of the
+          object covered by its own views, and the regions where tiles overlap are
+          exchanged with the neighbouring processes only. Memory and communication per
+          process then scale with the tile size rather than the full field of view.
+          Supported by DM, RAAR and ML (without regularizer and smoothing preconditioner),
+          other engines raise an error. Combine with ``mpi_distribution = 'hilbert'`` in the
+          scan data for compact tiles. The probe is always cloned.
+    type = str
+    choices = ['cloned', 'tiled']
+    userlevel = 2
+
     [dry_run]
     default = False
     help = Dry run switch
@@ -151,6 +171,27 @@ class Ptycho(Base):
        - ``'dls'``:    Custom format for Diamond Light Source
     choices = 'minimal','dls'
 
+    [io.threaded_save]
+    default = True
+    type = bool
+    help = Write reconstruction files in the background
+    doc = If ``True``, autosave dumps and the final reconstruction file are
+       written by a background thread. Probe, object and runtime information
+       are copied before queueing, so the reconstruction continues while the
+       file is written. All pending files are written and synced to disk
+       before :py:meth:`run` returns.
+    userlevel = 2
+
+    [io.save_queue_size]
+    default = 1
+    type = int
+    help = Maximum number of pending background saves
+    doc = Bounds the number of copies waiting to be written when
+       ``threaded_save`` is active. Further saves wait until the writer
+       catches up.
+    lowlim = 1
+    userlevel = 2
+
     [io.interaction]
     default = None
     type = Param
@@ -320,6 +361,10 @@ class Ptycho(Base):
         # Create a parameter structure from the the class-level defaults
         self.p = self.DEFAULT.copy(99)
 
+        # Background writer for reconstruction files
+        self._writer = None
+        self._run_depth = 0
+
         # Abort if we load complete structure
         if level <= 0:
             return
@@ -506,7 +551,8 @@ class Ptycho(Base):
         :py:attr:`Ptycho.mask` for detectors masks
         """
         self.probe = Container(self, ID='Cprobe', data_type='complex')
-        self.obj = Container(self, ID='Cobj', data_type='complex')
+        self.obj = Container(self, ID='Cobj', data_type='complex',
+                             distribution=self.p.object_distribution)
         self.exit = Container(self, ID='Cexit', data_type='complex', distribution="scattered")
         self.diff = Container(self, ID='Cdiff', data_type='real', distribution="scattered")
         self.mask = Container(self, ID='Cmask', data_type='bool', distribution="scattered")
@@ -626,6 +672,20 @@ class Ptycho(Base):
             An engine instance that should be a subclass of
             :py:class:`BaseEngine` or have the same methods.
         """
+        # Background saves may overlap with the following engines,
+        # but are complete when the outermost call returns.
+        self._run_depth += 1
+        try:
+            self._run(label, epars, engine)
+        finally:
+            self._run_depth -= 1
+        if self._run_depth == 0:
+            self.flush_saves()
+
+    def _run(self, label=None, epars=None, engine=None):
+        """
+        Body of :py:meth:`run`.
+        """
         if engine is not None:
             # Work with that engine
             if self.runtime.get('start') is None:
@@ -682,7 +742,8 @@ class Ptycho(Base):
                     if engine.curiter % auto_save.interval == 0:
                         auto = self.paths.auto_file(self.runtime)
                         logger.info(headerline('Autosaving'))
-                        self.save_run(auto, 'dump')
+                        self.save_run(auto, 'dump',
+                                      threaded=self.p.io.threaded_save)
                         self.runtime.last_save = engine.curiter
                         logger.info(headerline())
 
@@ -725,7 +786,8 @@ class Ptycho(Base):
 
             # Save
             if self.p.io.rfile:
-                self.save_run(kind=self.p.io.rformat)
+                self.save_run(kind=self.p.io.rformat,
+                              threaded=self.p.io.threaded_save)
             else:
                 pass
             # Time the initialization
@@ -783,12 +845,28 @@ class Ptycho(Base):
         except BaseException:
             pass
 
+        # Wait for pending background saves
+        self.flush_saves()
+
+        # Stop background data loading
+        if self.model is not None:
+            self.model.close()
+
         # Hint at citations (for all log levels)
         citation_info = '\n'.join([headerline('This reconstruction relied on the following work', 'l', '='),
         str(self.citations),
         headerline('', 'l', '=')])
         log("CITATION", citation_info)
 
+    def flush_saves(self):
+        """
+        Block until all background saves are written and synced to disk.
+        """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        parallel.barrier()
+
     @classmethod
     def _from_dict(cls, dct):
         # This method will be called from save_load on linking
@@ -866,7 +944,8 @@ class Ptycho(Base):
             P.init_data()
         return P
 
-    def save_run(self, alt_file=None, kind='minimal', force_overwrite=True):
+    def save_run(self, alt_file=None, kind='minimal', force_overwrite=True,
+                 threaded=False):
         """
         Save run to file.
 
@@ -884,12 +963,36 @@ class Ptycho(Base):
                   storages, positions and runtime information is saved.
                 - *'full_flat'*, (almost) complete environment
 
+        threaded : bool
+            If ``True``, a copy of the content is written by a background
+            thread and this call returns right away, see
+            :py:meth:`flush_saves`. Ignored for *'fullflat'*.
         """
         from . import save_load
         from .. import io
 
         dest_file = None
 
+        # The tiles of a tiled object are assembled at the master node
+        obj_tiles = {}
+        if self.obj.tiled and kind != 'fullflat':
+            for ID, S in self.obj.storages.items():
+                obj_tiles[ID] = S.gather_tiles()
+
+        def obj_dict(ID, S, grids=False):
+            d = S._to_dict()
+            if ID in obj_tiles:
+                data, center = obj_tiles[ID]
+                d.update(data=data, shape=data.shape, _center=center,
+                         _origin=-center * S.psize)
+            if grids and ID not in obj_tiles:
+                d['grids'] = S.grids()
+            elif grids:
+                sh = d['data'].shape
+                pix = np.indices(sh)[1:].reshape((S.ndim, -1)).T
+                d['grids'] = tuple(((pix - d['_center']) * S.psize).T.reshape((S.ndim,) + sh))
+            return d
+
         if parallel.master:
 
             if alt_file is not None:
@@ -954,12 +1057,9 @@ class Ptycho(Base):
                 for ID, S in self.probe.storages.items():
                     dump.probe[ID]['grids'] = S.grids()
 
-                dump.obj = {ID: S._to_dict()
+                dump.obj = {ID: obj_dict(ID, S, grids=True)
                             for ID, S in self.obj.storages.items()}
 
-                for ID, S in self.obj.storages.items():
-                    dump.obj[ID]['grids'] = S.grids()
-
                 try:
                     defaults_tree['ptycho'].validate(self.p) # check the parameters are actually able to be read back in
                 except RuntimeError:
@@ -981,7 +1081,7 @@ class Ptycho(Base):
                 minimal.probe = {ID: S._to_dict()
                                  for ID, S in self.probe.storages.items()}
 
-                minimal.obj = {ID: S._to_dict()
+                minimal.obj = {ID: obj_dict(ID, S)
                                for ID, S in self.obj.storages.items()}
                 try:
                     defaults_tree['ptycho'].validate(self.p) # check the parameters are actually able to be read back in
@@ -999,7 +1099,7 @@ class Ptycho(Base):
                     content.probe[ID]['grids'] = S.grids()
 
                 for ID, S in self.obj.storages.items():
-                    content.obj[ID]['grids'] = S.grids()
+                    content.obj[ID]['grids'] = obj_dict(ID, S, grids=True)['grids']
 
             if kind in ['minimal', 'dls'] and self.record_positions:
                 content.positions = {}
@@ -1008,9 +1108,18 @@ class Ptycho(Base):
 
             h5opt = io.h5options['UNSUPPORTED']
             io.h5options['UNSUPPORTED'] = 'ignore'
-            logger.info('Saving to %s' % dest_file)
-            io.h5write(dest_file, header=header, content=content)
-            io.h5options['UNSUPPORTED'] = h5opt
+            if threaded and kind != 'fullflat':
+                if self._writer is None:
+                    self._writer = io.AsyncH5Writer(self.p.io.save_queue_size)
+                logger.info('Saving to %s in background' % dest_file)
+                try:
+                    self._writer.write(dest_file, header=header, content=content)
+                finally:
+                    io.h5options['UNSUPPORTED'] = h5opt
+            else:
+                logger.info('Saving to %s' % dest_file)
+                io.h5write(dest_file, header=header, content=content)
+                io.h5options['UNSUPPORTED'] = h5opt
         else:
             pass
         # We have to wait for all processes, just in case the script isn't
@@ -101,6 +101,8 @@ class DM_3dBragg(DM):
 
     """
 
+    SUPPORTS_TILED_OBJECT = False
+
     SUPPORTED_MODELS = [Bragg3dModel, ]
 
     def __init__(self, ptycho_parent, pars):
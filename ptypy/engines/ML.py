@@ -99,9 +99,59 @@ class ML(PositionCorrectionEngine):
     type = int
     lowlim = 0
     help = Number of iterations before probe update starts
+
+    [optimizer]
+    default = 'cg'
+    type = str
+    help = Method computing the search directions
+    choices = ['cg', 'lbfgs', 'adam']
+    doc = One of 'cg' (Polak-Ribiere nonlinear conjugate gradient), 'lbfgs' (limited-memory BFGS) or 'adam' (gradients normalised with Adam moment estimates). The step length along the direction is always found by the quadratic line minimization.
+
+    [lbfgs_memory]
+    default = 5
+    type = int
+    lowlim = 1
+    help = Number of past steps kept by the L-BFGS optimizer
+    doc = Each step costs two copies of the object and of the probe.
+
+    [adam_beta1]
+    default = 0.9
+    type = float
+    lowlim = 0.0
+    uplim = 1.0
+    help = Decay rate of the first moment (momentum) of the Adam optimizer
+
+    [adam_beta2]
+    default = 0.999
+    type = float
+    lowlim = 0.0
+    uplim = 1.0
+    help = Decay rate of the second moment of the Adam optimizer
+
+    [adam_epsilon]
+    default = 1e-3
+    type = float
+    lowlim = 0.0
+    help = Regularisation of the Adam normalisation
+    doc = Relative to the largest root mean square gradient of each storage, so that pixels with vanishing gradients are not moved.
+
+    [batch_size]
+    default = 16
+    type = int
+    lowlim = 0
+    help = Number of diffraction frames propagated together
+    doc = Frames of a diffraction storage that share a propagator are forward modelled as stacks of up to this many frames, with one batched FFT per stack. Set to 0 to loop over the pods one by one.
+
+    [cache_forward]
+    default = True
+    type = bool
+    help = Reuse the propagated exit waves of the gradient in the line search
+    doc = The line minimization then needs two instead of three FFTs per pod. Set to False to recompute them, which saves the memory of one propagated exit wave per pod.
     
     """
 
+    SUPPORTS_TILED_OBJECT = True
+
     SUPPORTED_MODELS = [Full, Vanilla, Bragg3dModel, BlockVanilla, BlockFull, GradFull, BlockGradFull]
 
     def __init__(self, ptycho_parent, pars=None):
@@ -135,6 +185,10 @@ class ML(PositionCorrectionEngine):
         # Other
         self.tmin = None
         self.ML_model = None
+        self.optimizer = None
+
+        # Factor applied to the step found by the line minimization
+        self.step_scale = 1.
         self.smooth_gradient = None
         self.scale_p_o = None
         self.scale_p_o_memory = .9
@@ -171,8 +225,19 @@ class ML(PositionCorrectionEngine):
         # Other options
         self.smooth_gradient = prepare_smoothing_preconditioner(
             self.p.smooth_gradient)
+        if self.smooth_gradient and self.ob.tiled:
+            logger.warning('The smoothing preconditioner is not supported with '
+                           'a tiled object and is switched off.')
+            self.smooth_gradient = None
+
+        # Tiles of a tiled object have to agree where they overlap
+        if self.ob.tiled:
+            for s in self.ob.storages.values():
+                s.allreduce()
+                s.data /= s.tile_coverage()
 
         self._initialize_model()
+        self._initialize_optimizer()
 
     def _initialize_model(self):
 
@@ -186,7 +251,13 @@ class ML(PositionCorrectionEngine):
         else:
             raise RuntimeError("Unsupported ML_type: '%s'" % self.p.ML_type)
 
+    def _initialize_optimizer(self):
 
+        # Create search direction method
+        try:
+            self.optimizer = OPTIMIZERS[self.p.optimizer.lower()](self)
+        except KeyError:
+            raise RuntimeError("Unsupported optimizer: '%s'" % self.p.optimizer)
 
     def engine_prepare(self):
         """
@@ -209,6 +280,9 @@ class ML(PositionCorrectionEngine):
         tc = 0.
         ta = time.time()
         for it in range(num):
+            # Allow for customized modifications at the start of each iteration
+            self._pre_iterate_update()
+
             t1 = time.time()
             error_dct = self.ML_model.new_grad()
             new_ob_grad, new_pr_grad = self.ob_grad_new, self.pr_grad_new
@@ -249,40 +323,11 @@ class ML(PositionCorrectionEngine):
                 self.scale_p_o = self.p.scale_probe_object
 
             ############################
-            # Compute next conjugate
+            # Compute next search direction
             ############################
-            if self.curiter == 0:
-                bt = 0.
-            else:
-                bt_num = (self.scale_p_o
-                          * (Cnorm2(new_pr_grad)
-                             - np.real(Cdot(new_pr_grad, self.pr_grad)))
-                          + (Cnorm2(new_ob_grad)
-                             - np.real(Cdot(new_ob_grad, self.ob_grad))))
-
-                bt_denom = self.scale_p_o*Cnorm2(self.pr_grad) + Cnorm2(self.ob_grad)
-
-                bt = max(0, bt_num/bt_denom)
-
-            # logger.info('Polak-Ribiere coefficient: %f ' % bt)
-
-            self.ob_grad << new_ob_grad
-            self.pr_grad << new_pr_grad
+            self.optimizer.direction(new_ob_grad, new_pr_grad)
 
             dt = self.ptycho.FType
-            # 3. Next conjugate
-            self.ob_h *= bt / self.tmin
-
-            # Smoothing preconditioner
-            if self.smooth_gradient:
-                for name, s in self.ob_h.storages.items():
-                    s.data[:] -= self.smooth_gradient(self.ob_grad.storages[name].data)
-            else:
-                self.ob_h -= self.ob_grad
-
-            self.pr_h *= bt / self.tmin
-            self.pr_grad *= self.scale_p_o
-            self.pr_h -= self.pr_grad
 
             # In principle, the way things are now programmed this part
             # could be iterated over in a real Newton-Raphson style.
@@ -296,7 +341,7 @@ class ML(PositionCorrectionEngine):
                 B[np.isinf(B)] = 0.
                 B[np.isnan(B)] = 0.
 
-            self.tmin = dt(-.5 * B[1] / B[2])
+            self.tmin = dt(-.5 * B[1] / B[2] * self.step_scale)
             self.ob_h *= self.tmin
             self.pr_h *= self.tmin
             self.ob += self.ob_h
@@ -316,6 +361,12 @@ class ML(PositionCorrectionEngine):
         logger.info('  ....  in coefficient calculation: %.2f' % tc)
         return error_dct  # np.array([[self.ML_model.LL[0]] * 3])
 
+    def _pre_iterate_update(self):
+        """
+        Enables modification at the start of each ML iteration.
+        """
+        pass
+
     def _post_iterate_update(self):
         """
         Enables modification at the end of each ML iteration.
@@ -339,12 +390,341 @@ class ML(PositionCorrectionEngine):
         del self.ptycho.containers[self.pr_h.ID]
         del self.pr_h
 
+        # Delete optimizer state
+        self.optimizer.finalize()
+        del self.optimizer
+
         # Save floating intensities into runtime
         self.ptycho.runtime["float_intens"] = parallel.gather_dict(self.ML_model.float_intens_coeff)
 
         # Delete model
         del self.ML_model
 
+
+def _axpy(a, x, y):
+    """
+    y += a * x for containers `x` and `y`.
+    """
+    for name, s in y.storages.items():
+        s.data += a * x.storages[name].data
+
+
+class ConjugateGradient(object):
+    """
+    Polak-Ribiere nonlinear conjugate gradient directions.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def direction(self, new_ob_grad, new_pr_grad):
+        """
+        Update the engine's search directions `ob_h` and `pr_h` from the
+        new gradients. The engine's `ob_grad` and `pr_grad` are set to the
+        new (preconditioned) gradients.
+        """
+        e = self.engine
+        if e.curiter == 0:
+            bt = 0.
+        else:
+            bt_num = (e.scale_p_o
+                      * (Cnorm2(new_pr_grad)
+                         - np.real(Cdot(new_pr_grad, e.pr_grad)))
+                      + (Cnorm2(new_ob_grad)
+                         - np.real(Cdot(new_ob_grad, e.ob_grad))))
+
+            bt_denom = e.scale_p_o*Cnorm2(e.pr_grad) + Cnorm2(e.ob_grad)
+
+            bt = max(0, bt_num/bt_denom)
+
+        # logger.info('Polak-Ribiere coefficient: %f ' % bt)
+
+        e.ob_grad << new_ob_grad
+        e.pr_grad << new_pr_grad
+
+        # 3. Next conjugate
+        e.ob_h *= bt / e.tmin
+
+        # Smoothing preconditioner
+        if e.smooth_gradient:
+            for name, s in e.ob_h.storages.items():
+                s.data[:] -= e.smooth_gradient(e.ob_grad.storages[name].data)
+        else:
+            e.ob_h -= e.ob_grad
+
+        e.pr_h *= bt / e.tmin
+        e.pr_grad *= e.scale_p_o
+        e.pr_h -= e.pr_grad
+
+    def _smooth(self, c):
+        """
+        Apply the smoothing preconditioner, if any, to container `c`.
+        """
+        sm = self.engine.smooth_gradient
+        if sm:
+            for name, s in c.storages.items():
+                s.data[:] = sm(s.data)
+
+    def finalize(self):
+        pass
+
+
+class LBFGS(ConjugateGradient):
+    """
+    Limited-memory BFGS directions.
+
+    The last `lbfgs_memory` steps and gradient changes are kept in copies
+    of the object and probe containers and enter the two-loop recursion.
+    The initial inverse Hessian is the probe/object scaling and the
+    smoothing preconditioner of the conjugate gradient, rescaled with
+    the most recent curvature pair.
+    """
+
+    def __init__(self, engine):
+        super(LBFGS, self).__init__(engine)
+        e = engine
+        m = e.p.lbfgs_memory
+        self.s = [[e.ob.copy(e.ob.ID + '_s%d' % i, fill=0.),
+                   e.pr.copy(e.pr.ID + '_s%d' % i, fill=0.)] for i in range(m)]
+        self.y = [[e.ob.copy(e.ob.ID + '_y%d' % i, fill=0.),
+                   e.pr.copy(e.pr.ID + '_y%d' % i, fill=0.)] for i in range(m)]
+        self.rho = [0.] * m
+
+        # Slots of the stored pairs, oldest first
+        self.pairs = []
+        self.has_step = False
+
+    @staticmethod
+    def _dot(a, b):
+        return np.real(Cdot(a[0], b[0]) + Cdot(a[1], b[1]))
+
+    def direction(self, new_ob_grad, new_pr_grad):
+        e = self.engine
+        g = [e.ob_grad, e.pr_grad]
+        h = [e.ob_h, e.pr_h]
+
+        # Curvature pair of the last step, which the engine left in h
+        if self.has_step:
+            free = [i for i in range(len(self.rho)) if i not in self.pairs]
+            i = free[0] if free else self.pairs.pop(0)
+            s, y = self.s[i], self.y[i]
+            s[0] << h[0]
+            s[1] << h[1]
+            y[0] << new_ob_grad
+            y[0] -= g[0]
+            y[1] << new_pr_grad
+            y[1] -= g[1]
+            sy = self._dot(s, y)
+            if sy > 0:
+                self.rho[i] = 1. / sy
+                self.pairs.append(i)
+            else:
+                logger.debug('L-BFGS: skipping step without positive curvature')
+        self.has_step = True
+
+        g[0] << new_ob_grad
+        g[1] << new_pr_grad
+
+        # Two-loop recursion, h holds q and then r
+        h[0] << g[0]
+        h[1] << g[1]
+        alpha = {}
+        for i in reversed(self.pairs):
+            alpha[i] = self.rho[i] * self._dot(self.s[i], h)
+            _axpy(-alpha[i], self.y[i][0], h[0])
+            _axpy(-alpha[i], self.y[i][1], h[1])
+
+        if self.pairs:
+            y = self.y[self.pairs[-1]]
+            gamma = 1. / (self.rho[self.pairs[-1]]
+                          * (Cnorm2(y[0]) + e.scale_p_o * Cnorm2(y[1])))
+        else:
+            gamma = 1.
+        self._smooth(h[0])
+        h[0] *= gamma
+        h[1] *= gamma * e.scale_p_o
+
+        for i in self.pairs:
+            beta = self.rho[i] * self._dot(self.y[i], h)
+            _axpy(alpha[i] - beta, self.s[i][0], h[0])
+            _axpy(alpha[i] - beta, self.s[i][1], h[1])
+
+        h[0] *= -1
+        h[1] *= -1
+
+        # Fall back to the scaled gradient if this is not a descent direction
+        if self.pairs and self._dot(g, h) >= 0:
+            logger.info('L-BFGS: resetting history')
+            self.pairs = []
+            h[0] << g[0]
+            self._smooth(h[0])
+            h[0] *= -1
+            h[1] << g[1]
+            h[1] *= -e.scale_p_o
+
+        if e.p.probe_update_start > e.curiter:
+            h[1].fill(0.)
+
+    def finalize(self):
+        for c in self.s + self.y:
+            for cont in c:
+                del self.engine.ptycho.containers[cont.ID]
+        del self.s
+        del self.y
+
+
+class Adam(ConjugateGradient):
+    """
+    Search directions from Adam moment estimates.
+
+    The gradients enter moving averages of their first and second moments
+    and the direction is the bias corrected first moment divided by the
+    root of the second one. The object part is smoothed with the smoothing
+    preconditioner, if any, and each part is rescaled to the norm of its
+    gradient, so that object and probe are balanced as in the conjugate
+    gradient. Averaging over iterations makes this suited to gradients
+    of subsets of the frames.
+    """
+
+    def __init__(self, engine):
+        super(Adam, self).__init__(engine)
+        e = engine
+        self.m = (e.ob.copy(e.ob.ID + '_m', fill=0.),
+                  e.pr.copy(e.pr.ID + '_m', fill=0.))
+        self.v = (e.ob.copy(e.ob.ID + '_v', fill=0., dtype='real'),
+                  e.pr.copy(e.pr.ID + '_v', fill=0., dtype='real'))
+        self.t = 0
+
+    def direction(self, new_ob_grad, new_pr_grad):
+        e = self.engine
+        b1, b2 = e.p.adam_beta1, e.p.adam_beta2
+        self.t += 1
+        e.ob_grad << new_ob_grad
+        e.pr_grad << new_pr_grad
+
+        for g, m, v, h, scale in zip((e.ob_grad, e.pr_grad), self.m, self.v,
+                                     (e.ob_h, e.pr_h), (1., e.scale_p_o)):
+            m *= b1
+            _axpy(1. - b1, g, m)
+            v *= b2
+            for name, s in v.storages.items():
+                s.data += (1. - b2) * u.abs2(g.storages[name].data)
+            for name, s in h.storages.items():
+                mhat = m.storages[name].data / (1. - b1**self.t)
+                den = np.sqrt(v.storages[name].data / (1. - b2**self.t))
+                den += e.p.adam_epsilon * den.max()
+                np.divide(mhat, den, out=s.data, where=den > 0)
+                s.data[den == 0] = 0.
+            if h is e.ob_h:
+                self._smooth(h)
+            hn = Cnorm2(h)
+            if hn > 0:
+                h *= -scale * np.sqrt(Cnorm2(g) / hn)
+
+        if e.p.probe_update_start > e.curiter:
+            e.pr_h.fill(0.)
+
+    def finalize(self):
+        for cont in self.m + self.v:
+            del self.engine.ptycho.containers[cont.ID]
+        del self.m
+        del self.v
+
+
+OPTIMIZERS = {'cg': ConjugateGradient,
+              'lbfgs': LBFGS,
+              'adam': Adam}
+
+
+class _PodBatch(object):
+    """
+    Active pods of a block of diffraction views that are forward modelled
+    together: all views are on one diffraction storage, have the same
+    number of pods, and the pods share object and probe storages and a
+    propagator. Pods are ordered frame by frame.
+    """
+
+    def __init__(self, names, diff_views, pods):
+        self.names = names
+        self.diff_views = diff_views
+        self.pods = pods
+        self.nmodes = len(pods) // len(diff_views)
+        self.propagator = pods[0].geometry.propagator
+        self.views = {'di': diff_views,
+                      'ma': [v.pod.ma_view for v in diff_views],
+                      'ob': [pod.ob_view for pod in pods],
+                      'pr': [pod.pr_view for pod in pods]}
+
+    def _index(self, kind):
+        """
+        Layers and corners of the views of `kind` in their storage, read
+        from the view table so that moved views are picked up.
+        """
+        views = self.views[kind]
+        s = views[0].storage
+        table = s.owner.view_table
+        rows = s._view_rows(views)
+        lo = table['dlow'][rows, :2]
+        hi = table['dhigh'][rows, :2]
+        full = not lo.any() and (hi == s.shape[1:]).all()
+        return s.ID, table['dlayer'][rows], lo, hi, full
+
+    def gather(self, container, kind):
+        """
+        Stack of the data of the views of `kind` in `container`.
+        """
+        ID, layers, lo, hi, full = self._index(kind)
+        data = container.storages[ID].data
+        if full:
+            return data[layers]
+        return np.array([data[l, a0:b0, a1:b1]
+                         for l, (a0, a1), (b0, b1) in zip(layers, lo, hi)])
+
+    def scatter_add(self, container, kind, stack):
+        """
+        Add a stack of arrays to the regions of the views of `kind` in
+        `container`. Views covering whole layers are summed layer-wise.
+        """
+        ID, layers, lo, hi, full = self._index(kind)
+        data = container.storages[ID].data
+        if full:
+            for l in np.unique(layers):
+                data[l] += stack[layers == l].sum(0)
+            return
+        for x, l, (a0, a1), (b0, b1) in zip(stack, layers, lo, hi):
+            data[l, a0:b0, a1:b1] += x
+
+    def forward(self, ob, pr, ob_h=None, pr_h=None, f=None):
+        """
+        Batched exit waves of all pods propagated to the detector, with
+        the probe and object stacks. With directions `ob_h` and `pr_h`,
+        returns instead the exit waves and the propagated first and second
+        order terms of the line search, reusing the exit waves `f` if given.
+        """
+        fw = self.propagator.fw
+        P = self.gather(pr, 'pr')
+        O = self.gather(ob, 'ob')
+        if ob_h is None:
+            f = P * O
+            return fw(f, out=f), P, O
+        if f is None:
+            f = fw(P * O)
+        Ph = self.gather(pr_h, 'pr')
+        Oh = self.gather(ob_h, 'ob')
+        a = P * Oh
+        a += Ph * O
+        Ph *= Oh
+        return f, fw(a, out=a), fw(Ph, out=Ph)
+
+    def frame_sum(self, a):
+        """
+        Sum of the per-pod stack `a` over the pods of each frame.
+        """
+        if self.nmodes == 1:
+            return a
+        return a.reshape((-1, self.nmodes) + a.shape[1:]).sum(1)
+
+
 class BaseModel(object):
     """
     Base class for log-likelihood models.
@@ -370,7 +750,11 @@ class BaseModel(object):
         else:
             self.Irenorm = self.p.intensity_renormalization
 
-        if self.p.reg_del2:
+        if self.p.reg_del2 and self.ob.tiled:
+            logger.warning('The del2 regularizer is not supported with a tiled '
+                           'object and is switched off.')
+            self.regularizer = None
+        elif self.p.reg_del2:
             self.regularizer = Regul_del2(self.p.reg_del2_amplitude)
         else:
             self.regularizer = None
@@ -378,6 +762,14 @@ class BaseModel(object):
         # Create working variables
         self.LL = 0.
 
+        # Stacks of frames for the batched gradient, see prepare()
+        self.batches = []
+        self.single_views = []
+
+        # Propagated exit waves of the last gradient computation, reused
+        # by the line minimization
+        self.fcache = {}
+
 
     def prepare(self):
         # Useful quantities
@@ -398,6 +790,53 @@ class BaseModel(object):
             # TODO remove usage of .p. access
             self.regularizer.amplitude = self.p.reg_del2_amplitude * reg_rescale
 
+    def _make_batches(self, views=None):
+        """
+        Group the active diffraction views into :py:class:`_PodBatch`
+        stacks of at most `batch_size` frames. Views that cannot be
+        stacked (3D data, resampled geometries, pods on several storages)
+        are kept in `self.single_views` for the per-pod loop.
+
+        Gradients and line minimization only cover the grouped views, a
+        list of (name, view) pairs in `views` restricts them to a subset.
+        """
+        self.batches = []
+        self.single_views = []
+        groups = {}
+        if views is None:
+            views = [(dname, diff_view) for dname, diff_view
+                     in self.di.views.items() if diff_view.active]
+        for dname, diff_view in views:
+            pods = [pod for pod in diff_view.pods.values() if pod.active]
+            key = None
+            if (self.p.batch_size and pods and diff_view.ndim == 2
+                    and tuple(diff_view.shape) == diff_view.storage.shape[1:]):
+                geo = pods[0].geometry
+                key = (diff_view.storage.ID, len(pods), id(geo.propagator),
+                       pods[0].ob_view.storage.ID, pods[0].pr_view.storage.ID,
+                       pods[0].ma_view.storage.ID)
+                for pod in pods:
+                    if (pod.geometry.resample != 1
+                            or pod.geometry.propagator is not geo.propagator
+                            or pod.ob_view.storage.ID != key[3]
+                            or pod.pr_view.storage.ID != key[4]
+                            or tuple(pod.ob_view.shape) != tuple(diff_view.shape)
+                            or tuple(pod.pr_view.shape) != tuple(diff_view.shape)):
+                        key = None
+                        break
+            if key is None:
+                self.single_views.append((dname, diff_view))
+            else:
+                groups.setdefault(key, []).append((dname, diff_view, pods))
+
+        size = self.p.batch_size
+        for members in groups.values():
+            for i in range(0, len(members), size):
+                block = members[i:i + size]
+                self.batches.append(_PodBatch(
+                    [m[0] for m in block], [m[1] for m in block],
+                    [pod for m in block for pod in m[2]]))
+
     def __del__(self):
         """
         Clean up routine
@@ -459,6 +898,10 @@ class GaussianModel(BaseModel):
         del self.engine.ptycho.containers[self.weights.ID]
         del self.weights
 
+    def prepare(self):
+        BaseModel.prepare(self)
+        self._make_batches()
+
     def new_grad(self):
         """
         Compute a new gradient direction according to a Gaussian noise model.
@@ -472,11 +915,14 @@ class GaussianModel(BaseModel):
         # We need an array for MPI
         LL = np.array([0.])
         error_dct = {}
+        self.fcache.clear()
 
-        # Outer loop: through diffraction patterns
-        for dname, diff_view in self.di.views.items():
-            if not diff_view.active:
-                continue
+        # Stacks of frames
+        for batch in self.batches:
+            LL += self._batch_grad(batch, error_dct)
+
+        # Remaining diffraction patterns, pod by pod
+        for dname, diff_view in self.single_views:
 
             # Weights and intensities for this view
             w = self.weights[diff_view]
@@ -494,14 +940,15 @@ class GaussianModel(BaseModel):
 
             # Floating intensity option
             if self.p.floating_intensities:
-                self.float_intens_coeff[dname] = ((w * Imodel * I).sum()
-                                                / (w * Imodel**2).sum())
+                self.float_intens_coeff[dname] = (
+                    (w * Imodel * I).sum(dtype=np.float64)
+                    / (w * Imodel**2).sum(dtype=np.float64))
                 Imodel *= self.float_intens_coeff[dname]
 
-            DI = np.double(Imodel) - I
+            DI = Imodel - I
 
             # Second pod loop: gradients computation
-            LLL = np.sum((w * DI**2).astype(np.float64))
+            LLL = np.sum(w * DI**2, dtype=np.float64)
             for name, pod in diff_view.pods.items():
                 if not pod.active:
                     continue
@@ -509,6 +956,9 @@ class GaussianModel(BaseModel):
                 self.ob_grad[pod.ob_view] += 2. * xi * pod.probe.conj()
                 self.pr_grad[pod.pr_view] += 2. * xi * pod.object.conj()
 
+            if self.p.cache_forward:
+                self.fcache.update(f)
+
             diff_view.error = LLL
             error_dct[dname] = np.array([0, LLL / np.prod(DI.shape), 0])
             LL += LLL
@@ -528,19 +978,97 @@ class GaussianModel(BaseModel):
 
         return error_dct
 
+    def _batch_grad(self, batch, error_dct):
+        """
+        Gradient contributions and log-likelihood of a stack of frames.
+        """
+        w = batch.gather(self.weights, 'di')
+        I = batch.gather(self.di, 'di')
+
+        # Forward model of all pods
+        f, P, O = batch.forward(self.ob, self.pr)
+        Imodel = batch.frame_sum(u.abs2(f))
+
+        # Floating intensity option
+        if self.p.floating_intensities:
+            c = ((w * Imodel * I).sum(axis=(-2, -1), dtype=np.float64)
+                 / (w * Imodel**2).sum(axis=(-2, -1), dtype=np.float64))
+            self.float_intens_coeff.update(zip(batch.names, c))
+            Imodel *= c[:, None, None]
+
+        DI = Imodel - I
+        LLL = np.sum(w * DI**2, axis=(-2, -1), dtype=np.float64)
+
+        # Back propagation of all pods, in place if the exit waves are
+        # not kept for the line search
+        xi = f.reshape((-1, batch.nmodes) + f.shape[1:])
+        if self.p.cache_forward:
+            self.fcache[batch] = f
+            xi = xi * (w * DI)[:, None]
+        else:
+            xi *= (w * DI)[:, None]
+        xi = xi.reshape(f.shape)
+        batch.propagator.bw(xi, out=xi)
+
+        # Gradients, probe and object buffers are reused
+        np.conj(P, out=P)
+        P *= xi
+        P *= 2.
+        batch.scatter_add(self.ob_grad, 'ob', P)
+        np.conj(O, out=O)
+        O *= xi
+        O *= 2.
+        batch.scatter_add(self.pr_grad, 'pr', O)
+
+        npts = np.prod(DI.shape[1:])
+        for dname, diff_view, err in zip(batch.names, batch.diff_views, LLL):
+            diff_view.error = err
+            error_dct[dname] = np.array([0, err / npts, 0])
+        return LLL.sum()
+
+    def _batch_coeffs(self, batch, ob_h, pr_h):
+        """
+        Line minimization coefficients of a stack of frames.
+        """
+        w = batch.gather(self.weights, 'di')
+        I = batch.gather(self.di, 'di')
+
+        f, a, b = batch.forward(self.ob, self.pr, ob_h, pr_h,
+                                self.fcache.pop(batch, None))
+        A0 = batch.frame_sum(u.abs2(f).astype(np.float64))
+        A1 = batch.frame_sum(2 * np.real(f * a.conj()).astype(np.float64))
+        A2 = batch.frame_sum(2 * np.real(f * b.conj()).astype(np.float64)
+                             + u.abs2(a))
+
+        if self.p.floating_intensities:
+            c = np.array([self.float_intens_coeff[dname]
+                          for dname in batch.names])[:, None, None]
+            A0 *= c
+            A1 *= c
+            A2 *= c
+
+        A0 -= I
+        w = w.ravel()
+
+        return np.array([np.dot(w, (A0**2).ravel()),
+                         np.dot(w, (2 * A0 * A1).ravel()),
+                         np.dot(w, (A1**2 + 2*A0*A2).ravel())])
+
     def poly_line_coeffs(self, ob_h, pr_h):
         """
         Compute the coefficients of the polynomial for line minimization
         in direction h
         """
 
-        B = np.zeros((3,), dtype=np.longdouble)
+        B = np.zeros((3,))
         Brenorm = 1. / self.LL[0]**2
 
-        # Outer loop: through diffraction patterns
-        for dname, diff_view in self.di.views.items():
-            if not diff_view.active:
-                continue
+        # Stacks of frames
+        for batch in self.batches:
+            B += self._batch_coeffs(batch, ob_h, pr_h) * Brenorm
+
+        # Remaining diffraction patterns, pod by pod
+        for dname, diff_view in self.single_views:
 
             # Weights and intensities for this view
             w = self.weights[diff_view]
@@ -553,16 +1081,18 @@ class GaussianModel(BaseModel):
             for name, pod in diff_view.pods.items():
                 if not pod.active:
                     continue
-                f = pod.fw(pod.probe * pod.object)
+                f = self.fcache.pop(name, None)
+                if f is None:
+                    f = pod.fw(pod.probe * pod.object)
                 a = pod.fw(pod.probe * ob_h[pod.ob_view]
                            + pr_h[pod.pr_view] * pod.object)
                 b = pod.fw(pr_h[pod.pr_view] * ob_h[pod.ob_view])
 
                 if A0 is None:
-                    A0 = u.abs2(f).astype(np.longdouble)
-                    A1 = 2 * np.real(f * a.conj()).astype(np.longdouble)
-                    A2 = (2 * np.real(f * b.conj()).astype(np.longdouble)
-                          + u.abs2(a).astype(np.longdouble))
+                    A0 = u.abs2(f).astype(np.float64)
+                    A1 = 2 * np.real(f * a.conj()).astype(np.float64)
+                    A2 = (2 * np.real(f * b.conj()).astype(np.float64)
+                          + u.abs2(a))
                 else:
                     A0 += u.abs2(f)
                     A1 += 2 * np.real(f * a.conj())
@@ -573,8 +1103,7 @@ class GaussianModel(BaseModel):
                 A1 *= self.float_intens_coeff[dname]
                 A2 *= self.float_intens_coeff[dname]
 
-            A0 = np.double(A0) - pod.upsample(I)
-            #A0 -= pod.upsample(I)
+            A0 -= pod.upsample(I)
             w = pod.upsample(w)
 
             B[0] += np.dot(w.flat, (A0**2).flat) * Brenorm
@@ -609,7 +1138,11 @@ class PoissonModel(BaseModel):
         for name, di_view in self.di.views.items():
             if not di_view.active:
                 continue
-            self.LLbase[name] = special.gammaln(di_view.data+1).sum()
+            self.LLbase[name] = special.gammaln(di_view.data+1).sum(dtype=np.float64)
+
+    def prepare(self):
+        BaseModel.prepare(self)
+        self._make_batches()
 
     def new_grad(self):
         """
@@ -624,11 +1157,14 @@ class PoissonModel(BaseModel):
         # We need an array for MPI
         LL = np.array([0.])
         error_dct = {}
+        self.fcache.clear()
 
-        # Outer loop: through diffraction patterns
-        for dname, diff_view in self.di.views.items():
-            if not diff_view.active:
-                continue
+        # Stacks of frames
+        for batch in self.batches:
+            LL += self._batch_grad(batch, error_dct)
+
+        # Remaining diffraction patterns, pod by pod
+        for dname, diff_view in self.single_views:
 
             # Mask and intensities for this view
             I = diff_view.data
@@ -646,14 +1182,15 @@ class PoissonModel(BaseModel):
 
             # Floating intensity option
             if self.p.floating_intensities:
-                self.float_intens_coeff[dname] = I.sum() / Imodel.sum()
+                self.float_intens_coeff[dname] = (I.sum(dtype=np.float64)
+                                                  / Imodel.sum(dtype=np.float64))
                 Imodel *= self.float_intens_coeff[dname]
 
             Imodel += 1e-6
             DI = m * (1. - I / Imodel)
 
             # Second pod loop: gradients computation
-            LLL = self.LLbase[dname] + (m * (Imodel - I * np.log(Imodel))).sum().astype(np.float64)
+            LLL = self.LLbase[dname] + (m * (Imodel - I * np.log(Imodel))).sum(dtype=np.float64)
             for name, pod in diff_view.pods.items():
                 if not pod.active:
                     continue
@@ -661,6 +1198,9 @@ class PoissonModel(BaseModel):
                 self.ob_grad[pod.ob_view] += 2 * xi * pod.probe.conj()
                 self.pr_grad[pod.pr_view] += 2 * xi * pod.object.conj()
 
+            if self.p.cache_forward:
+                self.fcache.update(f)
+
             diff_view.error = LLL
             error_dct[dname] = np.array([0, LLL / np.prod(DI.shape), 0])
             LL += LLL
@@ -681,18 +1221,100 @@ class PoissonModel(BaseModel):
 
         return error_dct
 
+    def _batch_grad(self, batch, error_dct):
+        """
+        Gradient contributions and log-likelihood of a stack of frames.
+        """
+        I = batch.gather(self.di, 'di')
+        m = batch.gather(self.engine.ma, 'ma')
+
+        # Forward model of all pods
+        f, P, O = batch.forward(self.ob, self.pr)
+        Imodel = batch.frame_sum(u.abs2(f))
+
+        # Floating intensity option
+        if self.p.floating_intensities:
+            c = (I.sum(axis=(-2, -1), dtype=np.float64)
+                 / Imodel.sum(axis=(-2, -1), dtype=np.float64))
+            self.float_intens_coeff.update(zip(batch.names, c))
+            Imodel *= c[:, None, None]
+
+        Imodel += 1e-6
+        DI = m * (1. - I / Imodel)
+        LLL = (np.array([self.LLbase[dname] for dname in batch.names])
+               + (m * (Imodel - I * np.log(Imodel))).sum(axis=(-2, -1), dtype=np.float64))
+
+        # Back propagation of all pods, in place if the exit waves are
+        # not kept for the line search
+        xi = f.reshape((-1, batch.nmodes) + f.shape[1:])
+        if self.p.cache_forward:
+            self.fcache[batch] = f
+            xi = xi * DI[:, None]
+        else:
+            xi *= DI[:, None]
+        xi = xi.reshape(f.shape)
+        batch.propagator.bw(xi, out=xi)
+
+        # Gradients, probe and object buffers are reused
+        np.conj(P, out=P)
+        P *= xi
+        P *= 2
+        batch.scatter_add(self.ob_grad, 'ob', P)
+        np.conj(O, out=O)
+        O *= xi
+        O *= 2
+        batch.scatter_add(self.pr_grad, 'pr', O)
+
+        npts = np.prod(DI.shape[1:])
+        for dname, diff_view, err in zip(batch.names, batch.diff_views, LLL):
+            diff_view.error = err
+            error_dct[dname] = np.array([0, err / npts, 0])
+        return LLL.sum()
+
+    def _batch_coeffs(self, batch, ob_h, pr_h):
+        """
+        Line minimization coefficients of a stack of frames.
+        """
+        I = batch.gather(self.di, 'di')
+        m = batch.gather(self.engine.ma, 'ma')
+
+        f, a, b = batch.forward(self.ob, self.pr, ob_h, pr_h,
+                                self.fcache.pop(batch, None))
+        A0 = batch.frame_sum(u.abs2(f).astype(np.float64))
+        A1 = batch.frame_sum(2 * np.real(f * a.conj()).astype(np.float64))
+        A2 = batch.frame_sum(2 * np.real(f * b.conj()).astype(np.float64)
+                             + u.abs2(a))
+
+        if self.p.floating_intensities:
+            c = np.array([self.float_intens_coeff[dname]
+                          for dname in batch.names])[:, None, None]
+            A0 *= c
+            A1 *= c
+            A2 *= c
+
+        A0 += 1e-6
+        DI = 1. - I/A0
+        LLbase = sum(self.LLbase[dname] for dname in batch.names)
+        m = m.ravel()
+
+        return np.array([LLbase + (m * (A0 - I * np.log(A0)).ravel()).sum(),
+                         np.dot(m, (A1*DI).ravel()),
+                         np.dot(m, (A2*DI).ravel()) + .5*np.dot(m, (I*(A1/A0)**2.).ravel())])
+
     def poly_line_coeffs(self, ob_h, pr_h):
         """
         Compute the coefficients of the polynomial for line minimization
         in direction h
         """
-        B = np.zeros((3,), dtype=np.longdouble)
+        B = np.zeros((3,))
         Brenorm = 1/(self.tot_measpts * self.LL[0])**2
 
-        # Outer loop: through diffraction patterns
-        for dname, diff_view in self.di.views.items():
-            if not diff_view.active:
-                continue
+        # Stacks of frames
+        for batch in self.batches:
+            B += self._batch_coeffs(batch, ob_h, pr_h) * Brenorm
+
+        # Remaining diffraction patterns, pod by pod
+        for dname, diff_view in self.single_views:
 
             # Weights and intensities for this view
             I = diff_view.data
@@ -705,16 +1327,18 @@ class PoissonModel(BaseModel):
             for name, pod in diff_view.pods.items():
                 if not pod.active:
                     continue
-                f = pod.fw(pod.probe * pod.object)
+                f = self.fcache.pop(name, None)
+                if f is None:
+                    f = pod.fw(pod.probe * pod.object)
                 a = pod.fw(pod.probe * ob_h[pod.ob_view]
                            + pr_h[pod.pr_view] * pod.object)
                 b = pod.fw(pr_h[pod.pr_view] * ob_h[pod.ob_view])
 
                 if A0 is None:
-                    A0 = u.abs2(f).astype(np.longdouble)
-                    A1 = 2 * np.real(f * a.conj()).astype(np.longdouble)
-                    A2 = (2 * np.real(f * b.conj()).astype(np.longdouble)
-                          + u.abs2(a).astype(np.longdouble))
+                    A0 = u.abs2(f).astype(np.float64)
+                    A1 = 2 * np.real(f * a.conj()).astype(np.float64)
+                    A2 = (2 * np.real(f * b.conj()).astype(np.float64)
+                          + u.abs2(a))
                 else:
                     A0 += u.abs2(f)
                     A1 += 2 * np.real(f * a.conj())
@@ -728,7 +1352,7 @@ class PoissonModel(BaseModel):
             A0 += 1e-6
             DI = 1. - I/A0
 
-            B[0] += (self.LLbase[dname] + (m * (A0 - I * np.log(A0))).sum().astype(np.float64)) * Brenorm
+            B[0] += (self.LLbase[dname] + (m * (A0 - I * np.log(A0))).sum()) * Brenorm
             B[1] += np.dot(m.flat, (A1*DI).flat) * Brenorm
             B[2] += (np.dot(m.flat, (A2*DI).flat) + .5*np.dot(m.flat, (I*(A1/A0)**2.).flat)) * Brenorm
 
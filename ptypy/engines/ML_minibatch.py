@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Mini-batch maximum likelihood reconstruction engine.
+
+This file is part of the PTYPY package.
+
+    :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
+    :license: see LICENSE for details.
+"""
+import numpy as np
+
+from ..utils.verbose import logger
+from ..utils import parallel
+from . import register
+from .ML import ML
+
+__all__ = ['ML_minibatch']
+
+
+@register()
+class ML_minibatch(ML):
+    """
+    Maximum likelihood reconstruction engine updating object and probe
+    from subsets of the diffraction frames.
+
+    Each iteration computes the gradient and the line minimization of the
+    noise model for one mini-batch of frames only. Frames are drawn at
+    random or stratified along a Hilbert curve through the scan positions,
+    so that every mini-batch covers the whole field of view.
+
+
+    Defaults:
+
+    [name]
+    default = ML_minibatch
+    type = str
+    help =
+    doc =
+
+    [minibatch_size]
+    default = 256
+    type = int
+    lowlim = 1
+    help = Number of frames per update
+    doc = Summed over all processes. Each iteration of the engine is one update.
+
+    [sampling]
+    default = 'random'
+    type = str
+    help = How frames are drawn
+    choices = ['random', 'stratified']
+    doc = 'stratified' divides the scan into as many compact regions along a Hilbert curve as there are frames in a mini-batch and draws one frame from each region.
+
+    [sweep]
+    default = True
+    type = bool
+    help = Visit every frame once per epoch
+    doc = If False, the frames of each mini-batch are drawn independently of the previous ones.
+
+    [step_size]
+    default = 1.
+    type = float
+    lowlim = 0.0
+    help = Factor applied to the step of the line minimization
+
+    [step_decay]
+    default = 0.
+    type = float
+    lowlim = 0.0
+    help = Decay of the step size
+    doc = The step size is divided by 1 + step_decay * epoch, where an epoch is as many frames as the data set holds.
+
+    [seed]
+    default = None
+    type = int
+    help = Seed of the frame sampling
+    doc = If None, the seed is drawn from numpy's global random state, so that runs after np.random.seed are reproducible. Each process combines the seed with its rank.
+
+    """
+
+    def __init__(self, ptycho_parent, pars=None):
+        """
+        Mini-batch maximum likelihood reconstruction engine.
+        """
+        super(ML_minibatch, self).__init__(ptycho_parent, pars)
+
+        # Active diffraction views of this process as (name, view) pairs
+        self.frames = []
+
+        # Frame indices of each stratum
+        self.strata = None
+
+        # Mini-batches left in the current epoch
+        self.queue = []
+
+        # Number of epochs done, fractional
+        self.epoch = 0.
+
+        seed = self.p.seed
+        if seed is None:
+            seed = np.random.randint(2**31)
+        self.rng = np.random.default_rng([seed, parallel.rank])
+        self.reg_amplitude = None
+
+    def engine_prepare(self):
+        """
+        Last minute initialization, everything, that needs to be recalculated,
+        when new data arrives.
+        """
+        super(ML_minibatch, self).engine_prepare()
+
+        self.frames = [(dname, diff_view) for dname, diff_view
+                       in self.di.views.items() if diff_view.active]
+        nframes = len(self.frames)
+        self.nframes_total = parallel.allreduce(nframes)
+
+        # Share of the mini-batch for this process
+        size = self.p.minibatch_size * nframes / max(self.nframes_total, 1)
+        self.size = min(nframes, max(1, int(round(size))))
+
+        if self.p.sampling == 'stratified' and nframes:
+            pos = np.array([diff_view.pod.ob_view.coord
+                            for dname, diff_view in self.frames])
+            label = parallel.space_filling_ranks(pos, 'hilbert', nranks=self.size)
+            order = np.argsort(label, kind='stable')
+            self.strata = np.split(order, np.cumsum(np.bincount(label, minlength=self.size))[:-1])
+        else:
+            self.strata = None
+        self.queue = []
+
+        regularizer = self.ML_model.regularizer
+        self.reg_amplitude = regularizer.amplitude if regularizer else None
+
+    def _draw_epoch(self):
+        """
+        Mini-batches that together hold every frame once.
+        """
+        n = len(self.frames)
+        if self.strata is None:
+            perm = self.rng.permutation(n)
+            return np.array_split(perm, -(-n // self.size))
+        strata = [self.rng.permutation(st) for st in self.strata]
+        nbatch = max(len(st) for st in strata)
+        return [np.array([st[j] for st in strata if j < len(st)])
+                for j in range(nbatch)]
+
+    def _draw_minibatch(self):
+        """
+        One mini-batch drawn independently of the previous ones.
+        """
+        if self.strata is None:
+            return self.rng.choice(len(self.frames), self.size, replace=False)
+        return np.array([self.rng.choice(st) for st in self.strata if len(st)])
+
+    def _pre_iterate_update(self):
+        """
+        Restrict the noise model to the next mini-batch.
+        """
+        views = []
+        if self.frames:
+            if not self.queue:
+                self.queue = self._draw_epoch() if self.p.sweep else [self._draw_minibatch()]
+            batch = self.queue.pop(0)
+            views = [self.frames[i] for i in batch]
+        self.ML_model._make_batches(views)
+
+        # The mini-batch stands for a fraction of the data set, the same
+        # on every process so that the cloned object and probe agree
+        fraction = parallel.allreduce(len(views)) / max(self.nframes_total, 1)
+        if self.reg_amplitude is not None:
+            self.ML_model.regularizer.amplitude = self.reg_amplitude * fraction
+
+        self.step_scale = self.p.step_size / (1. + self.p.step_decay * self.epoch)
+        self.epoch += fraction
+        logger.debug('Mini-batch of %d frames, epoch %.2f, step scale %.3g'
+                     % (len(views), self.epoch, self.step_scale))
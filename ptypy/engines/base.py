@@ -72,6 +72,9 @@ class BaseEngine(object):
 
     """
 
+    # Engines that handle tiled object storages (object_distribution = "tiled")
+    SUPPORTS_TILED_OBJECT = False
+
     # Define with which models this engine can work.
     COMPATIBLE_MODELS = []
 
@@ -150,6 +153,10 @@ class BaseEngine(object):
             if not model.__class__ in self.SUPPORTED_MODELS:
                 raise Exception('Model %s not supported by engine %s' % (model.__class__,self.p.name))
 
+        if self.ob.tiled and not self.SUPPORTS_TILED_OBJECT:
+            raise NotImplementedError('Engine %s does not support a tiled object, '
+                                      'use object_distribution = "cloned".' % self.p.name)
+
         self.engine_initialize()
 
     def prepare(self):
@@ -380,6 +387,13 @@ class PositionCorrectionEngine(BaseEngine):
     default = False
     type = bool
     help = record movement of positions
+
+    [position_refinement.block_size]
+    default = 64
+    type = int
+    lowlim = 0
+    help = Number of trial exit waves propagated together
+    doc = The trial positions of many views are evaluated with stacked FFTs, shifting the object in Fourier space instead of re-slicing it, so that sub-pixel positions are not rounded to the pixel grid. If 0, views are refined one by one.
     """
 
     POSREF_ENGINES = {
@@ -455,11 +469,9 @@ class PositionCorrectionEngine(BaseEngine):
             log(4, "----------- START POS REF -------------")
             self.position_refinement.update_constraints(self.curiter) # this stays here
 
-            # Iterate through all diffraction views
-            for dname, di_view in self.di.views.items():
-                # Check for new coordinates
-                if di_view.active:
-                    self.position_refinement.update_view_position(di_view)
+            # Refine all active diffraction views
+            self.position_refinement.update_positions(
+                [di_view for di_view in self.di.views.values() if di_view.active])
 
             # We may not need this
             #parallel.barrier()
@@ -11,15 +11,55 @@ from ..core import View
 from .. import utils as u
 from ..utils.verbose import log
 import numpy as np
+from scipy import fftpack
+
+
+def fourier_metric(af2, I, mask):
+    """
+    DM fourier error over the last two axes of the stacks `af2` (model
+    intensities), `I` (measured intensities) and `mask`.
+    """
+    return (np.sum(mask * (np.sqrt(af2) - np.sqrt(np.abs(I)))**2, axis=(-2, -1))
+            / mask.sum(axis=(-2, -1)))
+
+
+def photon_metric(af2, I, mask):
+    """
+    Reduced likelihood error over the last two axes of the stacks `af2`
+    (model intensities), `I` (measured intensities) and `mask`.
+    """
+    return (np.sum(mask * (af2 - I)**2 / (I + 1.), axis=(-2, -1))
+            / np.prod(af2.shape[-2:]))
 
 
 class PositionRefine(object):
     def __init__(self, p):
         self.p = p
 
+    def candidate_shifts(self, psize):
+        '''
+        Trial position increments of a single view.
+
+        Parameters
+        ----------
+        psize : numpy.ndarray
+            The pixel size of the object view.
+
+        Returns
+        -------
+        numpy.ndarray
+            A (N, 2) numpy array with the position increments [m] to try
+        '''
+
+        raise NotImplementedError('This method needs to be overridden in order to position correct')
+
     def update_view_position(self, di_view):
         '''
-        Refines the position of a single diffraction view
+        Refines the position of a single diffraction view. The object view
+        is moved to each of the trial positions of
+        :py:meth:`candidate_shifts` and kept at the one with the lowest
+        fourier error.
+
         Parameters
         ----------
         di_view : ptypy.core.classes.View
@@ -30,8 +70,256 @@ class PositionRefine(object):
         numpy.ndarray
             A length 2 numpy array with the position increments for x and y co-ordinates respectively
         '''
+        # there might be more than one object view
+        ob_view = di_view.pod.ob_view
 
-        raise NotImplementedError('This method needs to be overridden in order to position correct')
+        initial_coord = ob_view.coord.copy()
+        coord = initial_coord
+        psize = ob_view.psize.copy()
+
+        # if you cannot move far, do nothing
+        if np.max(psize) >= self.max_shift_dist:
+            return np.zeros((2,))
+
+        # This can be optimized by saving existing iteration fourier error...
+        error = self.fourier_error(di_view, ob_view.data)
+
+        for delta in self.candidate_shifts(psize):
+
+            # Move view to new position
+            new_coord = initial_coord + delta
+            ob_view.coord = new_coord
+            ob_view.storage.update_views(ob_view)
+            data = ob_view.data
+
+            # catch bad slicing
+            if not np.allclose(data.shape, ob_view.shape):
+                continue
+
+            new_error = self.fourier_error(di_view, data)
+
+            if new_error < error:
+                # keep
+                error = new_error
+                coord = new_coord
+                log(4, "Position correction: %s, coord: %s, delta: %s" % (di_view.ID, coord, delta))
+
+        ob_view.coord = coord
+        ob_view.storage.update_views(ob_view)
+        return coord - initial_coord
+
+    def update_positions(self, di_views):
+        '''
+        Refines the positions of a list of diffraction views.
+
+        Views whose pods can be stacked are refined in blocks: the trial
+        positions of all views of a block are evaluated with stacked FFTs
+        of `block_size` exit waves, and the object is shifted to each trial
+        position in Fourier space instead of being re-sliced, so that
+        sub-pixel positions are not rounded to the pixel grid. The other
+        views, and all
+        views if `block_size` is 0, are refined one by one with
+        :py:meth:`update_view_position`.
+
+        Parameters
+        ----------
+        di_views : list
+            The active diffraction views that we wish to refine.
+        '''
+        if not self.p.block_size:
+            for di_view in di_views:
+                self.update_view_position(di_view)
+            return
+
+        groups = {}
+        single_views = []
+        for di_view in di_views:
+            key = self._stack_key(di_view)
+            if key is None:
+                single_views.append(di_view)
+            else:
+                groups.setdefault(key, []).append(di_view)
+
+        for views in groups.values():
+            self._update_stacked_positions(views)
+        for di_view in single_views:
+            self.update_view_position(di_view)
+
+    def _stack_key(self, di_view):
+        '''
+        Key of the views that can be refined together with `di_view`:
+        views on the same storages whose pods share a propagator. None
+        for views that need the per-view path (3D data, resampled
+        geometries, views of other shapes).
+        '''
+        pods = list(di_view.pods.values())
+        if di_view.ndim != 2 or not pods:
+            return None
+        shape = tuple(di_view.shape)
+        propagator = pods[0].geometry.propagator
+        for pod in pods:
+            if (pod.geometry.resample != 1
+                    or pod.geometry.propagator is not propagator
+                    or tuple(pod.pr_view.shape) != shape):
+                return None
+        pod = di_view.pod
+        if tuple(pod.ob_view.shape) != shape or tuple(pod.ma_view.shape) != shape:
+            return None
+        return (di_view.storage.ID, pod.ob_view.storage.ID, pod.ma_view.storage.ID,
+                tuple(p.pr_view.storage.ID for p in pods), id(propagator))
+
+    def _update_stacked_positions(self, di_views):
+        '''
+        Refines the positions of diffraction views sharing a
+        :py:meth:`_stack_key`, and moves the object views to the best
+        trial position.
+        '''
+        ob_views = [v.pod.ob_view for v in di_views]
+        S = ob_views[0].storage
+        psize = S.psize
+
+        # if you cannot move far, do nothing
+        if np.max(psize) >= self.max_shift_dist:
+            return
+
+        # Position increments, the current position first
+        candidates = [self.candidate_shifts(psize) for v in di_views]
+        nc = 1 + max(len(c) for c in candidates)
+        deltas = np.zeros((len(di_views), nc, 2))
+        valid = np.zeros((len(di_views), nc), dtype=bool)
+        valid[:, 0] = True
+        for i, c in enumerate(candidates):
+            deltas[i, 1:len(c) + 1] = c
+            valid[i, 1:len(c) + 1] = True
+
+        # Pixel shifts relative to the current slices
+        table = S.owner.view_table
+        rows = S._view_rows(ob_views)
+        shifts = table['sp'][rows, None, :2] + deltas / psize
+        dlow = table['dlow'][rows, None, :2] + np.round(shifts + 0.00001).astype(int)
+
+        # catch bad slicing
+        valid &= (dlow >= 0).all(-1)
+        valid &= (dlow + ob_views[0].shape <= S.shape[1:]).all(-1)
+
+        error = self._stacked_errors(di_views, shifts, valid)
+        best = np.argmin(error, axis=1)
+
+        moved = []
+        for i in np.flatnonzero(best):
+            ob_view = ob_views[i]
+            delta = deltas[i, best[i]]
+            ob_view.coord = ob_view.coord + delta
+            moved.append(ob_view)
+            log(4, "Position correction: %s, coord: %s, delta: %s" % (di_views[i].ID, ob_view.coord, delta))
+        S._update_all_views(moved)
+
+    def _stacked_errors(self, di_views, shifts, valid):
+        '''
+        Fourier errors of the diffraction views with the object shifted by
+        `shifts` pixels, an array of shape (views, trials, 2). Entries that
+        are not `valid` are set to infinity.
+
+        The integer part of a shift selects the object region, the
+        sub-pixel part is applied to it in Fourier space.
+        '''
+        nv, nc = valid.shape
+        pods = [list(v.pods.values()) for v in di_views]
+        npods = len(pods[0])
+        ob_views = [v.pod.ob_view for v in di_views]
+        S = ob_views[0].storage
+        sh = tuple(ob_views[0].shape)
+        propagator = pods[0][0].geometry.propagator
+
+        ishifts = np.round(shifts + 0.00001).astype(int)
+        subpix = shifts - ishifts
+
+        table = S.owner.view_table
+        rows = S._view_rows(ob_views)
+        layers = table['dlayer'][rows]
+        lo = table['dlow'][rows, :2]
+
+        # Exit waves propagated together
+        step = max(1, self.p.block_size // npods)
+        vblock = max(1, step // nc)
+
+        error = np.full((nv, nc), np.inf)
+        for start in range(0, nv, vblock):
+            views = di_views[start:start + vblock]
+            n = len(views)
+            blk = slice(start, start + n)
+            pr = np.stack([pods[start][k].pr_view.storage._stacked_data(
+                [p[k].pr_view for p in pods[blk]]) for k in range(npods)], axis=1)
+            I = views[0].storage._stacked_data(views)
+            mask = views[0].pod.ma_view.storage._stacked_data([v.pod.ma_view for v in views])
+
+            vi, ci = np.nonzero(valid[blk])
+            if not len(vi):
+                continue
+
+            # If all trials of a view have the same sub-pixel shift (as on
+            # a search grid), its region is shifted once for all of them
+            sp = np.zeros((n, 2))
+            sp[vi] = subpix[start + vi, ci]
+            shared = np.allclose(sp[vi], subpix[start + vi, ci], rtol=0., atol=1e-3)
+            if shared:
+                margin = np.abs(ishifts[start + vi, ci]).max()
+                region, off = self._shifted_regions(propagator, S, layers[blk], lo[blk],
+                                                    sh, sp, margin)
+
+            for j in range(0, len(vi), step):
+                a, c = vi[j:j + step], ci[j:j + step]
+                k = ishifts[start + a, c]
+                if shared:
+                    ob = np.array([region[i, y:y + sh[0], x:x + sh[1]]
+                                   for i, (y, x) in zip(a, k + off)])
+                else:
+                    ob, off = self._shifted_regions(propagator, S, layers[start + a],
+                                                    lo[start + a] + k, sh,
+                                                    subpix[start + a, c], 0)
+                    ob = ob[:, off[0]:off[0] + sh[0], off[1]:off[1] + sh[1]]
+                ex = (ob[:, None] * pr[a]).reshape((-1,) + sh)
+                af2 = u.abs2(propagator.fw(ex, out=ex)).reshape((len(a), npods) + sh).sum(1)
+                error[start + a, c] = self.stacked_error(af2, I[a], mask[a])
+
+        error[np.isnan(error)] = np.inf
+        return error
+
+    def _shifted_regions(self, propagator, S, layers, lo, shape, subpix, margin):
+        '''
+        Regions of storage `S` with corners `lo` and of `shape` plus at
+        least `margin` pixels (and a few more to keep the wrap-around of
+        the Fourier shift off the edges) on each side, shifted by `subpix`
+        pixels with the FFTs of `propagator`. Returns the stack of regions
+        and the offset of the unshifted corners in them.
+        '''
+        size = [fftpack.next_fast_len(int(n + 2 * (margin + 2))) for n in shape]
+        off = np.array([(l - n) // 2 for l, n in zip(size, shape)])
+        out = self._padded_patches(S, layers, lo - off, size)
+        sub = np.flatnonzero(subpix.any(1))
+        if len(sub):
+            ry = np.exp(2j * np.pi * np.fft.fftfreq(size[0]) * subpix[sub, 0, None]).astype(out.dtype)
+            rx = np.exp(2j * np.pi * np.fft.fftfreq(size[1]) * subpix[sub, 1, None]).astype(out.dtype)
+            w = propagator.fft(out[sub])
+            w *= ry[:, :, None]
+            w *= rx[:, None, :]
+            out[sub] = propagator.ifft(w, out=w)
+        return out, off
+
+    @staticmethod
+    def _padded_patches(S, layers, lo, shape):
+        '''
+        Stack of the regions of storage `S` at layers `layers`, with
+        corners `lo` and of `shape`. Pixels outside of the storage are zero.
+        '''
+        out = np.zeros((len(layers),) + tuple(shape), dtype=S.dtype)
+        for k, (l, (y0, x0)) in enumerate(zip(layers, lo)):
+            ys, xs = max(y0, 0), max(x0, 0)
+            ye = min(y0 + shape[0], S.shape[1])
+            xe = min(x0 + shape[1], S.shape[2])
+            if ye > ys and xe > xs:
+                out[k, ys - y0:ye - y0, xs - x0:xe - x0] = S.data[l, ys:ye, xs:xe]
+        return out
 
     def update_constraints(self, iteration):
         '''
@@ -66,7 +354,7 @@ class PositionRefine(object):
         af2 = np.zeros_like(di_view.data)
         for name, pod in di_view.pods.items():
             af2 += pod.downsample(u.abs2(pod.fw(pod.probe*obj)))
-        return np.sum(di_view.pod.mask * (np.sqrt(af2) - np.sqrt(np.abs(di_view.data)))**2) / di_view.pod.mask.sum()
+        return fourier_metric(af2, di_view.data, di_view.pod.mask)
 
     def estimate_photon_metric(self, di_view, obj):
         '''
@@ -87,7 +375,7 @@ class PositionRefine(object):
         af2 = np.zeros_like(di_view.data)
         for name, pod in di_view.pods.items():
             af2 += pod.downsample(u.abs2(pod.fw(pod.probe*obj)))
-        return (np.sum(di_view.pod.mask * (af2 - di_view.data)**2 / (di_view.data + 1.)) / np.prod(af2.shape))
+        return photon_metric(af2, di_view.data, di_view.pod.mask)
 
     def cleanup(self):
         '''
@@ -129,14 +417,16 @@ class AnnealingRefine(PositionRefine):
         # Choose metric for fourier error
         if metric == "fourier":
             self.fourier_error = self.estimate_fourier_metric
+            self.stacked_error = fourier_metric
         elif metric == "photon":
             self.fourier_error = self.estimate_photon_metric
+            self.stacked_error = photon_metric
         else:
             raise NotImplementedError("Metric %s is currently not implemented" %metric)
 
-    def update_view_position(self, di_view):
+    def candidate_shifts(self, psize):
         '''
-        Refines the positions by the following algorithm:
+        Trial positions of the following algorithm:
 
         A.M. Maiden, M.J. Humphry, M.C. Sarahan, B. Kraus, J.M. Rodenburg,
         An annealing algorithm to correct positioning errors in ptychography,
@@ -148,28 +438,15 @@ class AnnealingRefine(PositionRefine):
 
         Parameters
         ----------
-        di_view : ptypy.core.classes.View
-            A diffraction view that we wish to refine.
+        psize : numpy.ndarray
+            The pixel size of the object view.
 
         Returns
         -------
         numpy.ndarray
-            A length 2 numpy array with the position increments for x and y co-ordinates respectively
-        '''        
-        # there might be more than one object view
-        ob_view = di_view.pod.ob_view
-
-        initial_coord = ob_view.coord.copy()
-        coord = initial_coord
-        psize = ob_view.psize.copy()
-
-        # if you cannot move far, do nothing
-        if np.max(psize) >= self.max_shift_dist:
-            return np.zeros((2,))
-            
-        # This can be optimized by saving existing iteration fourier error...
-        error = self.fourier_error(di_view, ob_view.data)
-        
+            A (N, 2) numpy array with the random position increments [m]
+        '''
+        deltas = []
         for i in range(self.p.nshifts):
             # Generate coordinate shift in one of the 4 cartesian quadrants
             a, b = np.random.uniform(np.max(psize), self.max_shift_dist, 2)
@@ -179,27 +456,8 @@ class AnnealingRefine(PositionRefine):
                 # Positions drifted too far, skip this position
                 continue
 
-            # Move view to new position
-            new_coord = initial_coord + delta 
-            ob_view.coord = new_coord
-            ob_view.storage.update_views(ob_view)
-            data = ob_view.data
-            
-            # catch bad slicing
-            if not np.allclose(data.shape, ob_view.shape):
-                continue 
-                
-            new_error = self.fourier_error(di_view, data)
-
-            if new_error < error:
-                # keep
-                error = new_error
-                coord = new_coord
-                log(4, "Position correction: %s, coord: %s, delta: %s" % (di_view.ID, coord, delta))
-          
-        ob_view.coord = coord
-        ob_view.storage.update_views(ob_view)        
-        return coord - initial_coord
+            deltas.append(delta)
+        return np.array(deltas).reshape(-1, 2)
 
     @property
     def citation_dictionary(self):
@@ -238,42 +496,30 @@ class GridSearchRefine(PositionRefine):
         # Choose metric for fourier error
         if metric == "fourier":
             self.fourier_error = self.estimate_fourier_metric
+            self.stacked_error = fourier_metric
         elif metric == "photon":
             self.fourier_error = self.estimate_photon_metric
+            self.stacked_error = photon_metric
         else:
             raise NotImplementedError("Metric %s is currently not implemented" %metric)
 
-    def update_view_position(self, di_view):
+    def candidate_shifts(self, psize):
         '''
-        Refines the positions by the following algorithm:
+        Trial positions of the following algorithm:
 
         Calculates all shifts in a given radius around the original position and calculates the fourier error. 
         If the fourier error decreased the calculated postion will be used as new position.
 
         Parameters
         ----------
-        di_view : ptypy.core.classes.View
-            A diffraction view that we wish to refine.
+        psize : numpy.ndarray
+            The pixel size of the object view.
 
         Returns
         -------
         numpy.ndarray
-            A length 2 numpy array with the position increments for x and y co-ordinates respectively
-        '''        
-        # there might be more than one object view
-        ob_view = di_view.pod.ob_view
-
-        initial_coord = ob_view.coord.copy()
-        coord = initial_coord
-        psize = ob_view.psize.copy()
-
-        # if you cannot move far, do nothing
-        if np.max(psize) >= self.max_shift_dist:
-            return np.zeros((2,))
-            
-        # This can be optimized by saving existing iteration fourier error...
-        error = self.fourier_error(di_view, ob_view.data)
-        
+            A (N, 2) numpy array with the position increments [m] on the search grid
+        '''
         max_shift_pix = np.ceil(self.max_shift_dist / np.min(psize))
         max_bound_pix = np.ceil(self.p.max_shift / np.min(psize))
 
@@ -281,33 +527,7 @@ class GridSearchRefine(PositionRefine):
         deltas = np.mgrid[-max_shift_pix:max_shift_pix+1:1,
                           -max_shift_pix:max_shift_pix+1:1]
         within_bound = (deltas[0]**2 + deltas[1]**2) < (max_bound_pix**2)
-        deltas = (deltas[:,within_bound] * np.min(psize)).T
-
-        for i in range(deltas.shape[0]):
-            # Current shift
-            delta = deltas[i]
-
-            # Move view to new position
-            new_coord = initial_coord + delta 
-            ob_view.coord = new_coord
-            ob_view.storage.update_views(ob_view)
-            data = ob_view.data
-            
-            # catch bad slicing
-            if not np.allclose(data.shape, ob_view.shape):
-                continue 
-                
-            new_error = self.fourier_error(di_view, data)
-
-            if new_error < error:
-                # keep
-                error = new_error
-                coord = new_coord
-                log(4, "Position correction: %s, coord: %s, delta: %s" % (di_view.ID, coord, delta))
-     
-        ob_view.coord = coord
-        ob_view.storage.update_views(ob_view)        
-        return coord - initial_coord
+        return (deltas[:,within_bound] * np.min(psize)).T
 
     @property
     def citation_dictionary(self):
@@ -108,6 +108,8 @@ class _ProjectionEngine(PositionCorrectionEngine):
 
     """
 
+    SUPPORTS_TILED_OBJECT = True
+
     SUPPORTED_MODELS = [Full, Vanilla, Bragg3dModel, BlockVanilla, BlockFull]
 
     def __init__(self, ptycho_parent, pars=None):
@@ -344,8 +346,9 @@ class _ProjectionEngine(PositionCorrectionEngine):
         ob = self.ob
         ob_nrm = self.ob_nrm
 
-        # Fill container
-        if not parallel.master:
+        # Fill container, every tile of a tiled object carries its share
+        # of the inertia term
+        if not parallel.master and not ob.tiled:
             ob.fill(0.0)
             ob_nrm.fill(0.)
         else:
@@ -355,6 +358,8 @@ class _ProjectionEngine(PositionCorrectionEngine):
                 # This estimate assumes that the probe power is uniformly distributed through the
                 # array and therefore underestimate the strength of the probe terms.
                 cfact = self.p.object_inertia * self.mean_power
+                if s.tiled:
+                    cfact = (cfact / s.tile_coverage()).astype(s.data.real.dtype)
                 if self.p.obj_smooth_std is not None:
                     log(4, 'Smoothing object, average cfact is %.2f'
                         % np.mean(cfact).real)
@@ -365,7 +370,10 @@ class _ProjectionEngine(PositionCorrectionEngine):
                 else:
                     s.data[:] = s.data * cfact
 
-                ob_nrm.storages[name].fill(cfact)
+                if s.tiled:
+                    ob_nrm.storages[name].data[:] = cfact
+                else:
+                    ob_nrm.storages[name].fill(cfact)
 
         # DM update per node
         for name, pod in self.pods.items():
@@ -377,10 +385,10 @@ class _ProjectionEngine(PositionCorrectionEngine):
         # Distribute result with MPI
         for name, s in self.ob.storages.items():
             # Get the np arrays
-            nrm = ob_nrm.storages[name].data
-            parallel.allreduce(s.data)
-            parallel.allreduce(nrm)
-            s.data /= nrm
+            nrm = ob_nrm.storages[name]
+            s.allreduce()
+            nrm.allreduce()
+            s.data /= nrm.data
 
             # A possible (but costly) sanity check would be as follows:
             # if all((np.abs(nrm)-np.abs(cfact))/np.abs(cfact) < 1.):
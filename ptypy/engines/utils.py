@@ -173,7 +173,7 @@ def projection_update_generalized(diff_view, a, b, c, pbound=None):
 
     # Fourier magnitudes deviations
     fdev = af - fmag
-    err_fmag = np.sum(fmask * fdev**2) / fmask.sum()
+    err_fmag = np.sum(fmask * fdev**2, dtype=np.float64) / fmask.sum()
     err_exit = 0.
 
     """
@@ -186,7 +186,7 @@ def projection_update_generalized(diff_view, a, b, c, pbound=None):
             df = pod.bw(pod.upsample(fm) * f[name]) + \
                  a * pod.probe * pod.object - (a + b + c) * pod.exit
             pod.exit += df
-            err_exit += np.mean(u.abs2(df))
+            err_exit += np.mean(u.abs2(df), dtype=np.float64)
     elif err_fmag > pbound:
         # Power bound is applied
         renorm = np.sqrt(pbound / err_fmag)
@@ -197,7 +197,7 @@ def projection_update_generalized(diff_view, a, b, c, pbound=None):
             df = pod.bw(pod.upsample(fm) * f[name]) + \
                  a * pod.probe * pod.object - (a + b + c) * pod.exit
             pod.exit += df
-            err_exit += np.mean(u.abs2(df))
+            err_exit += np.mean(u.abs2(df), dtype=np.float64)
     else:
         # Within power bound so no constraint applied.
         for name, pod in diff_view.pods.items():
@@ -205,7 +205,7 @@ def projection_update_generalized(diff_view, a, b, c, pbound=None):
                 continue
             df = (a + c) * (pod.probe * pod.object - pod.exit)
             pod.exit += df
-            err_exit += np.mean(u.abs2(df))
+            err_exit += np.mean(u.abs2(df), dtype=np.float64)
     """
     # Essentially, the following is all the same formula
     # fm = (1 - fmask) + fmask * (fmag + fdev * renorm)
@@ -237,7 +237,7 @@ def projection_update_generalized(diff_view, a, b, c, pbound=None):
             df = (a + b*c) * (pod.probe * pod.object - pod.exit)
 
         pod.exit += df
-        err_exit += np.mean(u.abs2(df))
+        err_exit += np.mean(u.abs2(df), dtype=np.float64)
 
     return err_fmag, err_exit
 
@@ -365,7 +365,7 @@ def basic_fourier_update_LEGACY(diff_view, pbound=None, alpha=1., LL_error=True)
 
     # Fourier magnitudes deviations
     fdev = af - fmag
-    err_fmag = np.sum(fmask * fdev**2) / fmask.sum()
+    err_fmag = np.sum(fmask * fdev**2, dtype=np.float64) / fmask.sum()
     err_exit = 0.
 
     if pbound is None:
@@ -376,7 +376,7 @@ def basic_fourier_update_LEGACY(diff_view, pbound=None, alpha=1., LL_error=True)
                 continue
             df = pod.bw(pod.upsample(fm) * f[name]) - alpha * pod.probe * pod.object + (alpha - 1) * pod.exit
             pod.exit += df
-            err_exit += np.mean(u.abs2(df))
+            err_exit += np.mean(u.abs2(df), dtype=np.float64)
     elif err_fmag > pbound:
         # Power bound is applied
         renorm = np.sqrt(pbound / err_fmag)
@@ -386,7 +386,7 @@ def basic_fourier_update_LEGACY(diff_view, pbound=None, alpha=1., LL_error=True)
                 continue
             df = pod.bw(pod.upsample(fm) * f[name]) - alpha * pod.probe * pod.object + (alpha - 1) * pod.exit
             pod.exit += df
-            err_exit += np.mean(u.abs2(df))
+            err_exit += np.mean(u.abs2(df), dtype=np.float64)
     else:
         # Within power bound so no constraint applied.
         for name, pod in diff_view.pods.items():
@@ -394,7 +394,7 @@ def basic_fourier_update_LEGACY(diff_view, pbound=None, alpha=1., LL_error=True)
                 continue
             df = (pod.probe * pod.object - pod.exit)
             pod.exit += df
-            err_exit += np.mean(u.abs2(df))
+            err_exit += np.mean(u.abs2(df), dtype=np.float64)
 
     return np.array([err_fmag, err_phot, err_exit])
 
@@ -520,8 +520,16 @@ def Cnorm2(c):
     ptypy.utils.math_utils.norm2
     """
     r = 0.
+    rt = 0.
     for name, s in c.storages.items():
-        r += u.norm2(s.data)
+        if s.tiled:
+            # Count every pixel of the tiled storage once
+            a = s.data[:, s.tile_owned()]
+            rt += _vdot(a, a).real
+        else:
+            r += _vdot(s.data, s.data).real
+    if c.tiled:
+        r += parallel.allreduce(rt)
     return r
 
 
@@ -534,7 +542,33 @@ def Cdot(c1, c2):
     :returns: The dot product (*scalar*)
     """
     r = 0.
+    rt = 0j
     for name, s in c1.storages.items():
-        r += np.vdot(c1.storages[name].data.flat, c2.storages[name].data.flat)
+        if s.tiled:
+            # Count every pixel of the tiled storage once
+            own = s.tile_owned()
+            rt += _vdot(s.data[:, own], c2.storages[name].data[:, own])
+        else:
+            r += _vdot(c1.storages[name].data, c2.storages[name].data)
+    if c1.tiled:
+        r += parallel.allreduce(rt)
+    return r
+
+
+def _vdot(a, b, block=2**20):
+    """
+    np.vdot of `a` and `b`. The products of single-precision arrays are
+    summed block by block with np.add.reduce in double precision, so that
+    they keep full accuracy without an upcast copy of the inputs.
+    """
+    a = a.reshape(-1)
+    b = b.reshape(-1)
+    dtype = np.promote_types(np.result_type(a, b), np.float64)
+    if dtype == np.result_type(a, b):
+        return complex(np.vdot(a, b))
+    r = 0j
+    for i in range(0, a.size, block):
+        p = np.conj(a[i:i + block]) * b[i:i + block]
+        r += complex(np.add.reduce(p, dtype=dtype))
     return r
 
@@ -17,9 +17,11 @@ from ptypy.experiment import register
 from ptypy.utils import parallel
 from ptypy.utils.verbose import log
 from ptypy.utils.array_utils import _translate_to_pix
+from ptypy.io import H5FrameReader
 
 import os
 from multiprocessing import Pool, RawArray
+from multiprocessing.util import Finalize
 
 @register()
 class Hdf5Loader(PtyScan):
@@ -364,7 +366,7 @@ class Hdf5Loader(PtyScan):
         self.normalisation = None
         self.normalisation_laid_out_like_positions = None
         self.darkfield_laid_out_like_data = None
-        self.flatfield_field_laid_out_like_data = None
+        self.flatfield_laid_out_like_data = None
         self.mask_laid_out_like_data = None
         self.preview_indices = None
         self.framefilter = None
@@ -909,12 +911,61 @@ class Hdf5Loader(PtyScan):
 
 @register()
 class Hdf5LoaderFast(Hdf5Loader):
+    """
+    Hdf5Loader that reads and corrects the frames of a chunk in a pool of
+    worker processes. The pool is started with the first chunk and kept
+    for the lifetime of the loader. Each worker opens the HDF5 files once,
+    reads the frames of its slab directly into shared memory and applies
+    darkfield, flatfield, normalisation, padding and mask inversion to
+    the whole slab.
+
+    Defaults:
+
+    [name]
+    default = 'Hdf5LoaderFast'
+    type = str
+    help =
+
+    [buffers]
+    default = 1
+    type = int
+    help = Number of shared memory buffers that loaded chunks cycle through
+    doc = Frames returned by ``load`` are views into a shared memory buffer, which is
+          reused after this many further chunks. When the scan model prefetches
+          ``scan.prefetch`` chunks, at least ``scan.prefetch + 2`` buffers are needed (the
+          prefetched chunks, the chunk being loaded and the chunk being consumed); fewer are
+          raised to that number.
+    lowlim = 1
+
+    [direct_chunks]
+    default = True
+    type = bool
+    help = Read the intensities with direct chunk reads where possible
+    doc = If the intensities are stored one frame per chunk and all of their filters can be
+          decoded (gzip, shuffle, and blosc, bitshuffle or lz4 if the respective package is
+          installed), the workers fetch the raw chunks of their slab in one go and decompress
+          them in ``decompress_threads`` threads, bypassing the HDF5 filter pipeline.
+          See :py:class:`ptypy.io.H5FrameReader`.
+
+    [decompress_threads]
+    default = 1
+    type = int
+    help = Number of threads per worker process that decompress direct chunk reads
+    lowlim = 1
+    """
+
+    # Per-process state of the pool workers
+    _worker = None
+
     def __init__(self, pars=None, **kwargs):
         super().__init__(pars=pars, **kwargs)
         self.cpu_count_per_rank = max(os.cpu_count() // parallel.size,1)
         print("Rank %d has access to %d processes" %(parallel.rank, self.cpu_count_per_rank))
         self.intensities_array = None
         self.weights_array = None
+        self._pool = None
+        self._capacity = 0
+        self._slot = -1
 
     @staticmethod
     def subtract_dark(raw, dark):
@@ -927,108 +978,233 @@ class Hdf5LoaderFast(Hdf5Loader):
         return corr
 
     @staticmethod
-    def _init_worker(intensities_raw_array, weights_raw_array, 
-                     intensities_handle,
-                     weights_handle,
-                     darkfield_handle,
-                     flatfield_handle,
+    def _source(d):
+        """
+        Picklable reference to dataset `d` for the pool workers,
+        arrays are passed as they are.
+        """
+        if isinstance(d, h5.Dataset):
+            return (d.file.filename, d.name)
+        return d
+
+    @staticmethod
+    def _open_source(src, files):
+        if isinstance(src, tuple):
+            if src[0] not in files:
+                files[src[0]] = h5.File(src[0], 'r')
+            return files[src[0]][src[1]]
+        return src
+
+    def _worker_args(self, intensities_raw, weights_raw, shape):
+        """
+        Arguments of :py:meth:`_init_worker`.
+        """
+        layout = {}
+        for name, like_data in [('mask', self.mask_laid_out_like_data),
+                                ('darkfield', self.darkfield_laid_out_like_data),
+                                ('flatfield', self.flatfield_laid_out_like_data)]:
+            d = getattr(self, name)
+            layout[name] = (None if d is None else self._source(d), like_data)
+        threads = self.p.decompress_threads if self.p.direct_chunks else 0
+        return (intensities_raw, weights_raw, shape,
+                self.intensities_dtype, self.weights_dtype,
+                self._source(self.intensities), layout,
+                self.frame_slices, self._inner_slices(), self.p.mask.invert,
+                threads)
+
+    @staticmethod
+    def _init_worker(intensities_raw, weights_raw, shape,
                      intensities_dtype, weights_dtype,
-                     array_shape, 
-                     mask_laid_out_like_data,
-                     darkfield_laid_out_like_data,
-                     flatfield_laid_out_like_data):
-        Hdf5LoaderFast.worker_intensities_handle = intensities_handle
-        Hdf5LoaderFast.worker_intensities_array = np.frombuffer(intensities_raw_array, intensities_dtype, -1).reshape(array_shape)
-        Hdf5LoaderFast.worker_weights_handle = weights_handle
-        Hdf5LoaderFast.worker_weights_array = np.frombuffer(weights_raw_array, weights_dtype, -1).reshape(array_shape) if weights_raw_array else None
-        Hdf5LoaderFast.worker_mask_laid_out_like_data = mask_laid_out_like_data
-        Hdf5LoaderFast.worker_darkfield_handle = darkfield_handle
-        Hdf5LoaderFast.worker_darkfield_laid_out_like_data = darkfield_laid_out_like_data
-        Hdf5LoaderFast.worker_flatfield_handle = flatfield_handle
-        Hdf5LoaderFast.worker_flatfield_laid_out_like_data = flatfield_laid_out_like_data
+                     intensities_src, layout,
+                     frame_slices, inner, invert, threads):
+        """
+        Attach to the shared buffers and open the files, once per worker.
+        Corrections that are the same for all frames are read here.
+        Direct chunk reads are used if `threads` > 0 and the intensities
+        support them.
+        """
+        files = {}
+        w = {'files': files, 'inner': inner, 'invert': invert}
+        w['intensities_array'] = np.frombuffer(intensities_raw, intensities_dtype, -1).reshape(shape)
+        w['weights_array'] = np.frombuffer(weights_raw, weights_dtype, -1).reshape(shape)
+        w['intensities'] = Hdf5LoaderFast._open_source(intensities_src, files)
+        w['reader'] = None
+        if threads and isinstance(w['intensities'], h5.Dataset):
+            if H5FrameReader.supported(w['intensities']):
+                w['reader'] = H5FrameReader(w['intensities'], threads)
+        for name, (src, like_data) in layout.items():
+            d = None if src is None else Hdf5LoaderFast._open_source(src, files)
+            if d is not None and not like_data:
+                # The same frame for all scan points
+                d = np.asarray(d[frame_slices]).squeeze()
+            w[name] = (d, like_data)
+        Hdf5LoaderFast._worker = w
+        # Runs when the worker exits after close_pool()
+        Finalize(None, Hdf5LoaderFast._close_worker, exitpriority=10)
+
+    @staticmethod
+    def _close_worker():
+        """
+        Stop the decompression threads and close the files of a worker.
+        """
+        w = Hdf5LoaderFast._worker
+        if w is None:
+            return
+        if w['reader'] is not None:
+            w['reader'].close()
+        for f in w['files'].values():
+            f.close()
+        Hdf5LoaderFast._worker = None
 
     @staticmethod
-    def _read_intensities_and_weights(slices):
+    def _read_slab(task):
         '''
-        Copy intensities/weights into memory and correct for 
-        darkfield/flatfield if they exist
+        Read the frames of one slab into shared memory and apply all
+        corrections to the slab as a whole.
         '''
-        indexed_frame_slices, dest_slices = slices
-        frame_slices = tuple(np.array(indexed_frame_slices)[-2:])
-
-        # Handle / target array for intensities
-        src_intensities  = Hdf5LoaderFast.worker_intensities_handle
-        dest_intensities = Hdf5LoaderFast.worker_intensities_array
-
-        # Handle / target array for mask/weights
-        src_weights  = Hdf5LoaderFast.worker_weights_handle
-        dest_weights = Hdf5LoaderFast.worker_weights_array
-        mask_laid_out_like_data = Hdf5LoaderFast.worker_mask_laid_out_like_data
-
-        # Handle for darkfield
-        src_darkfield = Hdf5LoaderFast.worker_darkfield_handle
-        darkfield_laid_out_like_data = Hdf5LoaderFast.worker_darkfield_laid_out_like_data
-
-        # Handle for flatfield
-        src_flatfield = Hdf5LoaderFast.worker_flatfield_handle
-        flatfield_laid_out_like_data = Hdf5LoaderFast.worker_flatfield_laid_out_like_data
-
-        # Copy intensities and weights
-        src_intensities.read_direct(dest_intensities, indexed_frame_slices, dest_slices)
-        if src_weights is not None:
-            if mask_laid_out_like_data:
-                src_weights.read_direct(dest_weights, indexed_frame_slices, dest_slices)
-            else:
-                src_weights.read_direct(dest_weights, frame_slices, dest_slices)
-
-        # Correct darkfield
-        if src_darkfield is not None:
-            if darkfield_laid_out_like_data:
-                df = src_darkfield[indexed_frame_slices].squeeze()
-            else:
-                df = src_darkfield[frame_slices].squeeze()
-            dest_intensities[dest_slices] = Hdf5LoaderFast.subtract_dark(dest_intensities[dest_slices], df)
+        slot, start, src_slices, factors = task
+        w = Hdf5LoaderFast._worker
+        inner = w['inner']
+        n = len(src_slices)
+        intensities = w['intensities_array'][slot, start:start + n]
+        weights = w['weights_array'][slot, start:start + n]
+        raw = intensities[(slice(None),) + inner]
+        weights_inner = weights[(slice(None),) + inner]
+        if raw.shape != intensities.shape:
+            # Padded frames
+            intensities.fill(0)
+            weights.fill(0)
+
+        mask, mask_like_data = w['mask']
+        darkfield, darkfield_like_data = w['darkfield']
+        flatfield, flatfield_like_data = w['flatfield']
+
+        # Intensities and per-frame corrections
+        src_intensities = w['intensities']
+        df = np.empty_like(raw) if darkfield_like_data and darkfield is not None else darkfield
+        ff = np.empty_like(raw) if flatfield_like_data and flatfield is not None else flatfield
+        reader = w['reader']
+        if reader is not None:
+            reader.read([src[:-2] for src in src_slices], raw, src_slices[0][-2:])
+        for j, src in enumerate(src_slices):
+            dest = (slice(j, j + 1),) + inner
+            if reader is None:
+                src_intensities.read_direct(intensities, src, dest)
+            if mask is not None and mask_like_data:
+                mask.read_direct(weights, src, dest)
+            if darkfield is not None and darkfield_like_data:
+                df[j] = darkfield[src].squeeze()
+            if flatfield is not None and flatfield_like_data:
+                ff[j] = flatfield[src].squeeze()
+
+        # Corrections of the whole slab
+        if mask is None:
+            weights_inner[:] = 1
+        elif not mask_like_data:
+            weights_inner[:] = mask
+        if darkfield is not None:
+            raw[:] = Hdf5LoaderFast.subtract_dark(raw, df)
+        if flatfield is not None:
+            raw /= ff
+        for j, factor in enumerate(factors):
+            if factor is not None:
+                raw[j] *= factor
+        if w['invert']:
+            np.subtract(1, weights, out=weights)
+
+    def _inner_slices(self):
+        """
+        Slices of the loaded frame within a padded frame.
+        """
+        pad = self.pad.reshape(2, 2)
+        return tuple(slice(pad[ax, 0], pad[ax, 0] + self.frame_shape[ax]) for ax in range(2))
 
-        # Correct flatfield
-        if src_flatfield is not None:
-            if flatfield_laid_out_like_data:
-                dest_intensities[dest_slices] /= src_flatfield[indexed_frame_slices].squeeze()
-            else:
-                dest_intensities[dest_slices] /= src_flatfield[frame_slices].squeeze()
+    @property
+    def weights_dtype(self):
+        dtype = np.dtype(self.mask_dtype)
+        if self.p.mask.invert:
+            # Same type as 1 - mask
+            dtype = np.result_type(1, dtype)
+        return dtype
 
-    def _setup_raw_intensity_buffer(self, dtype, sh):
-        npixels = int(np.prod(sh))
-        if (self.intensities_array is not None) and (self.intensities_array.size == npixels):
-            return
-        self._intensities_raw_array = RawArray(np.ctypeslib.as_ctypes_type(dtype), npixels)
-        self.intensities_array = np.frombuffer(self._intensities_raw_array, self.intensities_dtype, -1).reshape(sh)
-        
-    def _setup_raw_weights_buffer(self, dtype, sh):
+    def _start_pool(self, capacity):
+        """
+        (Re)start the worker pool with shared buffers for `capacity` frames
+        in each of the ``p.buffers`` buffers.
+        """
+        self.close_pool()
+        self.frame_shape = tuple(int(x) for x in u.expect2(self.frame_shape))
+        padded = tuple(np.array(self.frame_shape) + self.pad.reshape(2, 2).sum(1))
+        sh = (self._num_buffers(), capacity) + padded
         npixels = int(np.prod(sh))
-        if (self.weights_array is not None) and (self.weights_array.size == npixels):
-            return
-        if self.mask is not None:
-            self._weights_raw_array = RawArray(np.ctypeslib.as_ctypes_type(dtype), npixels)
-            self.weights_array = np.frombuffer(self._weights_raw_array, dtype, -1).reshape(sh)
+        self._intensities_raw_array = RawArray(np.ctypeslib.as_ctypes_type(self.intensities_dtype), npixels)
+        self._weights_raw_array = RawArray(np.ctypeslib.as_ctypes_type(self.weights_dtype), npixels)
+        self._buffers = (np.frombuffer(self._intensities_raw_array, self.intensities_dtype, -1).reshape(sh),
+                         np.frombuffer(self._weights_raw_array, self.weights_dtype, -1).reshape(sh))
+        self._pool = Pool(self.cpu_count_per_rank,
+                          initializer=Hdf5LoaderFast._init_worker,
+                          initargs=self._worker_args(self._intensities_raw_array,
+                                                     self._weights_raw_array, sh))
+        self._capacity = capacity
+        self._slot = -1
+
+    def _num_buffers(self):
+        """
+        Number of shared buffers, enough for the chunks in flight when
+        prefetching.
+        """
+        n = max(self.p.buffers, 1)
+        if self.prefetch_depth:
+            need = self.prefetch_depth + 2
+            if n < need:
+                log(3, 'Using %d shared buffers for %d prefetched chunks instead of %d.'
+                    % (need, self.prefetch_depth, n))
+                n = need
+        return n
+
+    def close_pool(self):
+        """
+        Stop the worker processes.
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def _normalisation_factor(self, index, indexed_frame_slice):
+        """
+        Factor the intensities of scan point `index` are multiplied with,
+        None if they are left as they are.
+        """
+        if self.normalisation is None:
+            return None
+        if self.normalisation_laid_out_like_positions:
+            scale =  self.normalisation[index]
         else:
-            self._weights_raw_array = None
-            self.weights_array = np.ones(sh, dtype=int)
-
-    def load_multiprocessing(self, src_slices):
-        sh = (len(src_slices),) + self.frame_shape
-        self._setup_raw_intensity_buffer(self.intensities_dtype, sh)
-        self._setup_raw_weights_buffer(self.mask_dtype, sh)
-        dest_slices = [np.s_[i:i+1] for i in range(len(src_slices))]
-
-        with Pool(self.cpu_count_per_rank, 
-                  initializer=Hdf5LoaderFast._init_worker,
-                  initargs=(self._intensities_raw_array, self._weights_raw_array,
-                            self.intensities, self.mask, self.darkfield, self.flatfield,
-                            self.intensities_dtype, self.mask_dtype,
-                            sh, self.mask_laid_out_like_data,
-                            self.darkfield_laid_out_like_data, 
-                            self.flatfield_field_laid_out_like_data)) as p:
-            p.map(self._read_intensities_and_weights, zip(src_slices, dest_slices))
+            scale = np.squeeze(self.normalisation[indexed_frame_slice])
+        if np.abs(scale - self.normalisation_mean) < (self.p.normalisation.sigma * self.normalisation_std):
+            return 1 / (scale * self.normalisation_mean)
+        return None
+
+    def load_multiprocessing(self, src_slices, indices):
+        """
+        Load and correct the frames at `src_slices` for scan points
+        `indices` into the next shared buffer. The frames are left in
+        :py:attr:`intensities_array` and :py:attr:`weights_array`.
+        """
+        n = len(src_slices)
+        if (self._pool is None or n > self._capacity
+                or len(self._buffers[0]) < self._num_buffers()):
+            self._start_pool(n)
+        self._slot = (self._slot + 1) % len(self._buffers[0])
+        self.intensities_array = self._buffers[0][self._slot, :n]
+        self.weights_array = self._buffers[1][self._slot, :n]
+
+        factors = [self._normalisation_factor(ii, sl) for ii, sl in zip(indices, src_slices)]
+        bounds = np.linspace(0, n, min(n, self.cpu_count_per_rank) + 1).astype(int)
+        tasks = [(self._slot, a, src_slices[a:b], factors[a:b])
+                 for a, b in zip(bounds[:-1], bounds[1:])]
+        self._pool.map(Hdf5LoaderFast._read_slab, tasks)
 
     def load_unmapped_raster_scan(self, indices):
 
@@ -1042,14 +1218,14 @@ class Hdf5LoaderFast(Hdf5Loader):
                 indexed_frame_slices = (self.p.outer_index,) + indexed_frame_slices
             slices.append(indexed_frame_slices)
 
-        self.load_multiprocessing(slices)
+        self.load_multiprocessing(slices, indices)
 
         intensities = {}
         positions = {}
         weights = {}
         for k,ii in enumerate(indices):
             slow_idx, fast_idx = self.preview_indices[:,ii]
-            weights[ii], intensities[ii] = self.get_corrected_intensities(self.weights_array[k], self.intensities_array[k], ii, slices[k])
+            weights[ii], intensities[ii] = self.weights_array[k], self.intensities_array[k]
             positions[ii] = np.array([self.slow_axis[slow_idx, fast_idx] * self.p.positions.slow_multiplier,
                                       self.fast_axis[slow_idx, fast_idx] * self.p.positions.fast_multiplier])
         log(3, 'Data loaded successfully.')
@@ -1066,14 +1242,14 @@ class Hdf5LoaderFast(Hdf5Loader):
                 indexed_frame_slices = (self.p.outer_index,) + indexed_frame_slices
             slices.append(indexed_frame_slices)
         
-        self.load_multiprocessing(slices)
+        self.load_multiprocessing(slices, indices)
 
         intensities = {}
         positions = {}
         weights = {}
         for k,ii in enumerate(indices):
             slow_idx, fast_idx = self.preview_indices[:, ii]
-            weights[ii], intensities[ii] = self.get_corrected_intensities(self.weights_array[k], self.intensities_array[k], ii, slices[k])
+            weights[ii], intensities[ii] = self.weights_array[k], self.intensities_array[k]
             positions[ii] = np.array([self.slow_axis[slow_idx, fast_idx] * self.p.positions.slow_multiplier,
                                       self.fast_axis[slow_idx, fast_idx] * self.p.positions.fast_multiplier])
         log(3, 'Data loaded successfully.')
@@ -1090,37 +1266,22 @@ class Hdf5LoaderFast(Hdf5Loader):
                 indexed_frame_slices = (self.p.outer_index,) + indexed_frame_slices
             slices.append(indexed_frame_slices)
 
-        self.load_multiprocessing(slices)
+        self.load_multiprocessing(slices, indices)
 
         intensities = {}
         positions = {}
         weights = {}
         for k,ii in enumerate(indices):
             jj = self.preview_indices[ii]
-            weights[ii], intensities[ii] = self.get_corrected_intensities(self.weights_array[k], self.intensities_array[k], ii, slices[k])
+            weights[ii], intensities[ii] = self.weights_array[k], self.intensities_array[k]
             positions[ii] = np.array([self.slow_axis[jj] * self.p.positions.slow_multiplier,
                                       self.fast_axis[jj] * self.p.positions.fast_multiplier])
         log(3, 'Data loaded successfully.')
         return intensities, positions, weights
 
-    def get_corrected_intensities(self, weights, intensities, index, indexed_frame_slice):
-        '''
-        Corrects the intensities for normalisation and padding
-        '''
-
-        if self.normalisation is not None:
-            if self.normalisation_laid_out_like_positions:
-                scale =  self.normalisation[index]
-            else:
-                scale = np.squeeze(self.normalisation[indexed_frame_slice])
-            if np.abs(scale - self.normalisation_mean) < (self.p.normalisation.sigma * self.normalisation_std):
-                intensities *= 1 / (scale * self.normalisation_mean)
-
-        if self.p.padding:
-            intensities = np.pad(intensities, tuple(self.pad.reshape(2,2)), mode='constant')
-            weights = np.pad(weights, tuple(self.pad.reshape(2,2)), mode='constant')
-
-        if self.p.mask.invert:
-            weights = 1 - weights
-
-        return weights, intensities
+    def _finalize(self):
+        """
+        Stop the worker pool and close any open HDF5 files.
+        """
+        self.close_pool()
+        super()._finalize()
@@ -12,21 +12,123 @@ import numpy as np
 import time
 import os
 import glob
+import queue
+import threading
 from collections import OrderedDict
 import pickle
+import fnmatch
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from ..utils import Param
 from ..utils.verbose import logger
 
-__all__ = ['h5write', 'h5append', 'h5read', 'h5info', 'h5options']
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+
+# Optional decompressors for direct chunk reads
+try:
+    import blosc
+except ImportError:
+    blosc = None
+
+try:
+    import bitshuffle
+except ImportError:
+    bitshuffle = None
+
+try:
+    import lz4.block as lz4_block
+except ImportError:
+    lz4_block = None
+
+__all__ = ['h5write', 'h5append', 'h5read', 'h5info', 'h5options',
+           'AsyncH5Writer', 'h5write_benchmark', 'H5Proxy', 'h5resolve',
+           'H5FrameReader']
 
 h5options = dict(
     H5RW_VERSION='0.1',
     H5PY_VERSION=h5py.version.version,
     # UNSUPPORTED = 'ignore',
     UNSUPPORTED='fail',
-    SLASH_ESCAPE='_SLASH_')
+    SLASH_ESCAPE='_SLASH_',
+    # Default filter for arrays, see _filter_options
+    COMPRESSION='gzip',
+    # Chunk shape for stacks of detector frames: 'frame' for one frame
+    # per chunk, None to let h5py guess. Other arrays are chunked by h5py.
+    CHUNKS='frame',
+    # Paths of the datasets that hold stacks of detector frames
+    FRAME_DATASETS=['chunks/*/data', 'chunks/*/weights'])
 STR_CONVERT = [type]
 
+FILTERS = ['none', 'gzip', 'lzf', 'shuffle+gzip', 'blosc', 'bitshuffle']
+""" Names of the filters understood by h5write/h5append """
+
+
+def _filter_options(name, level=None):
+    """
+    Keyword arguments for h5py's create_dataset that select the filter
+    `name` (one of FILTERS) with compression `level`. The hdf5plugin
+    filters fall back to 'shuffle+gzip' if hdf5plugin is not installed.
+    """
+    if name is None or name == 'none':
+        return {}
+    elif name in ['blosc', 'bitshuffle'] and hdf5plugin is None:
+        logger.warning('Filter %s needs hdf5plugin, using shuffle+gzip instead.' % name)
+        name = 'shuffle+gzip'
+
+    if name == 'gzip':
+        return dict(compression='gzip', compression_opts=level)
+    elif name == 'shuffle+gzip':
+        return dict(compression='gzip', compression_opts=level, shuffle=True)
+    elif name == 'lzf':
+        return dict(compression='lzf')
+    elif name == 'blosc':
+        return dict(hdf5plugin.Blosc(cname='lz4', clevel=5 if level is None else level,
+                                     shuffle=hdf5plugin.Blosc.BITSHUFFLE))
+    elif name == 'bitshuffle':
+        return dict(hdf5plugin.Bitshuffle(cname='lz4'))
+    else:
+        raise RuntimeError('Unknown filter %s, choose one of %s' % (name, FILTERS))
+
+
+def _dataset_options(path, a, layout=None):
+    """
+    Filter and chunk options for storing array `a` at `path`.
+
+    `layout` maps dataset paths (relative to the file root, wildcards
+    allowed) to a filter name or to a dictionary with the optional
+    keys 'filter', 'level' and 'chunks'. Unmatched datasets use
+    h5options['COMPRESSION'], and h5options['CHUNKS'] if their path
+    matches h5options['FRAME_DATASETS'].
+    """
+    spec = {}
+    if layout:
+        for pattern, v in layout.items():
+            if fnmatch.fnmatchcase(path, pattern):
+                spec = v if isinstance(v, dict) else {'filter': v}
+                break
+
+    # Scalar datasets cannot be chunked or filtered
+    if a.ndim == 0:
+        return {}
+
+    kw = _filter_options(spec.get('filter', h5options['COMPRESSION']),
+                         spec.get('level'))
+    if 'chunks' in spec:
+        chunks = spec['chunks']
+    elif any(fnmatch.fnmatchcase(path, p) for p in h5options['FRAME_DATASETS']):
+        chunks = h5options['CHUNKS']
+    else:
+        chunks = None
+    if chunks == 'frame':
+        chunks = (1,) + a.shape[1:] if (a.ndim == 3 and a.size) else None
+    if chunks is not None:
+        kw['chunks'] = chunks
+    return kw
+
 
 def sdebug(f):
     """
@@ -53,7 +155,7 @@ class Str_to_Slice(object):
 str_to_slice = Str_to_Slice()
 
 
-def _h5write(filename, mode, *args, **kwargs):
+def _h5write(filename, mode, *args, h5layout=None, **kwargs):
     """\
     _h5write(filename, mode, {'var1'=..., 'var2'=..., ...})
     _h5write(filename, mode, var1=..., var2=..., ...)
@@ -77,11 +179,6 @@ def _h5write(filename, mode, *args, **kwargs):
     It defaults to overwriting an existing file.
     """
 
-    filename = os.path.abspath(os.path.expanduser(filename))
-
-    ctime = time.asctime()
-    mtime = ctime
-
     # Update input dictionary
     if args:
         d = args[0].copy()  # shallow copy
@@ -89,6 +186,22 @@ def _h5write(filename, mode, *args, **kwargs):
         d = {}
     d.update(kwargs)
 
+    _h5write_dict(filename, mode, d, h5layout=h5layout)
+
+
+def _h5write_dict(filename, mode, d, unsupported=None, h5layout=None):
+    """
+    Write the dictionary `d` to `filename`. `unsupported` overrides
+    h5options['UNSUPPORTED'] for this write, `h5layout` selects filters
+    and chunk shapes per dataset (see _dataset_options).
+    """
+    filename = os.path.abspath(os.path.expanduser(filename))
+    if unsupported is None:
+        unsupported = h5options['UNSUPPORTED']
+
+    ctime = time.asctime()
+    mtime = ctime
+
     # List of object ids to make sure we are not saving something twice.
     ids = []
 
@@ -108,7 +221,9 @@ def _h5write(filename, mode, *args, **kwargs):
     # @sdebug
     def _store_numpy(group, a, name, compress=True):
         if compress:
-            dset = group.create_dataset(name, data=a, compression='gzip')
+            path = (group.name + '/' + name).lstrip('/')
+            dset = group.create_dataset(name, data=a,
+                                        **_dataset_options(path, a, h5layout))
         else:
             dset = group.create_dataset(name, data=a)
         dset.attrs['type'] = 'array'
@@ -250,9 +365,9 @@ def _h5write(filename, mode, *args, **kwargs):
         elif type(a) in STR_CONVERT:
             dset = _store_string(group, str(a), name)
         else:
-            if h5options['UNSUPPORTED'] == 'fail':
+            if unsupported == 'fail':
                 raise RuntimeError('Unsupported data type : %s' % type(a))
-            elif h5options['UNSUPPORTED'] == 'pickle':
+            elif unsupported == 'pickle':
                 dset = _store_pickle(group, a, name)
             else:
                 dset = None
@@ -279,7 +394,7 @@ def _h5write(filename, mode, *args, **kwargs):
     return
 
 
-def h5write(filename, *args, **kwargs):
+def h5write(filename, *args, h5layout=None, **kwargs):
     """\
     h5write(filename, {'var1'=..., 'var2'=..., ...})
     h5write(filename, var1=..., var2=..., ...)
@@ -298,15 +413,21 @@ def h5write(filename, *args, **kwargs):
     (Setting the option UNSUPPORTED equal to 'ignore' eliminates
     unsupported types. Default is 'fail', which raises an error.)
 
+    Arrays are compressed with the filter h5options['COMPRESSION'] and
+    detector frame stacks (h5options['FRAME_DATASETS']) are chunked
+    frame by frame. `h5layout` overrides this per
+    dataset, e.g. ``h5layout={'chunks/*/data': {'filter': 'lzf'},
+    'meta/*': 'none'}``. Filters are listed in FILTERS.
+
     The file mode can be chosen according to the h5py documentation.
     It defaults to overwriting an existing file.
     """
 
-    _h5write(filename, 'w', *args, **kwargs)
+    _h5write(filename, 'w', *args, h5layout=h5layout, **kwargs)
     return
 
 
-def h5append(filename, *args, **kwargs):
+def h5append(filename, *args, h5layout=None, **kwargs):
     """\
     h5append(filename, {'var1'=..., 'var2'=..., ...})
     h5append(filename, var1=..., var2=..., ...)
@@ -325,14 +446,432 @@ def h5append(filename, *args, **kwargs):
     (Setting the option UNSUPPORTED equal to 'ignore' eliminates
     unsupported types. Default is 'fail', which raises an error.)
 
+    Arrays are compressed with the filter h5options['COMPRESSION'] and
+    detector frame stacks (h5options['FRAME_DATASETS']) are chunked
+    frame by frame. `h5layout` overrides this per
+    dataset, e.g. ``h5layout={'chunks/*/data': {'filter': 'lzf'},
+    'meta/*': 'none'}``. Filters are listed in FILTERS.
+
     The file mode can be chosen according to the h5py documentation.
     It defaults to overwriting an existing file.
     """
 
-    _h5write(filename, 'a', *args, **kwargs)
+    _h5write(filename, 'a', *args, h5layout=h5layout, **kwargs)
     return
 
 
+def _h5snapshot(a, unsupported):
+    """
+    Copy of `a` that is independent of later changes to the original:
+    arrays and containers are copied, scalars and strings are immutable.
+    Unsupported objects are dropped, pickled or raise, like in h5write.
+    """
+    if type(a) in (dict, OrderedDict, Param):
+        d = type(a)()
+        items = a._to_dict().items() if type(a) is Param else a.items()
+        for k, v in items:
+            v = _h5snapshot(v, unsupported)
+            if v is not _DROP:
+                d[k] = v
+        return d
+    elif type(a) in (list, tuple):
+        l = [_h5snapshot(v, unsupported) for v in a]
+        l = [v for v in l if v is not _DROP]
+        return l if type(a) is list else tuple(l)
+    elif type(a) is np.ndarray or isinstance(a, (np.record, np.recarray)):
+        return a.copy()
+    elif (type(a) is str or np.isscalar(a) or a is None
+          or type(a) in STR_CONVERT):
+        return a
+    elif unsupported == 'fail':
+        raise RuntimeError('Unsupported data type : %s' % type(a))
+    elif unsupported == 'pickle':
+        return pickle.loads(pickle.dumps(a))
+    else:
+        return _DROP
+
+
+_DROP = object()
+
+
+class AsyncH5Writer(object):
+    """
+    Write h5 files from a background thread.
+
+    :py:meth:`write` takes the same arguments as :py:func:`h5write`.
+    It copies the content and queues it, so the caller can continue to
+    modify the original data. At most `maxsize` copies wait in the
+    queue; when it is full, :py:meth:`write` blocks until the writer
+    catches up. :py:meth:`flush` waits until every queued file is
+    written and synced to disk, and re-raises the first error of the
+    writer thread.
+    """
+
+    def __init__(self, maxsize=1, fsync=True):
+        self.fsync = fsync
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._error = None
+
+    def write(self, filename, *args, h5layout=None, **kwargs):
+        """
+        Queue writing `filename` as h5write(filename, *args, **kwargs).
+        """
+        if args:
+            d = args[0].copy()  # shallow copy
+        else:
+            d = {}
+        d.update(kwargs)
+        unsupported = h5options['UNSUPPORTED']
+        d = _h5snapshot(d, unsupported)
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self._queue.put((filename, d, unsupported, h5layout))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                filename, d, unsupported, h5layout = item
+                _h5write_dict(filename, 'w', d, unsupported, h5layout)
+                if self.fsync:
+                    filename = os.path.abspath(os.path.expanduser(filename))
+                    fd = os.open(filename, os.O_RDONLY)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+            except Exception as e:
+                logger.error('Background write to %s failed: %s' % (item[0], e))
+                if self._error is None:
+                    self._error = e
+            finally:
+                self._queue.task_done()
+
+    @property
+    def pending(self):
+        """ Number of files queued or being written. """
+        return self._queue.unfinished_tasks
+
+    def flush(self):
+        """
+        Block until all queued files are written and synced.
+        """
+        self._queue.join()
+        if self._error is not None:
+            e, self._error = self._error, None
+            raise e
+
+    def close(self):
+        """
+        Flush and stop the writer thread.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._thread = None
+        self.flush()
+
+
+def h5write_benchmark(filename, data, filters=None, level=None, chunks='frame', repeat=1):
+    """
+    Time writing the array `data` with each filter in `filters`
+    (default: all available in FILTERS) to `filename`.
+
+    Returns a dictionary mapping filter name to a dictionary with the
+    best write time 'time' in s, the throughput 'MBps' of uncompressed
+    data and the compression 'ratio'. The file is removed afterwards.
+    """
+    if filters is None:
+        filters = [f for f in FILTERS
+                   if hdf5plugin is not None or f not in ['blosc', 'bitshuffle']]
+    data = np.asarray(data)
+    nbytes = data.nbytes
+    res = OrderedDict()
+    for name in filters:
+        layout = {'data': dict(filter=name, level=level, chunks=chunks)}
+        times = []
+        for i in range(repeat):
+            t = time.perf_counter()
+            h5write(filename, h5layout=layout, data=data)
+            times.append(time.perf_counter() - t)
+        size = os.path.getsize(filename)
+        best = min(times)
+        res[name] = dict(time=best,
+                         MBps=nbytes / 1e6 / best if best > 0 else np.inf,
+                         ratio=nbytes / float(size))
+        logger.info('%-14s %8.3f s %10.1f MB/s  ratio %6.2f'
+                    % (name, best, res[name]['MBps'], res[name]['ratio']))
+    if os.path.exists(filename):
+        os.remove(filename)
+    return res
+
+
+class H5Proxy(object):
+    """
+    Stand-in for an array dataset, returned by h5read(..., lazy=True).
+
+    Nothing is read until the proxy is sliced like an array or converted
+    with np.asarray / :py:meth:`read`. The file is opened for each access,
+    so proxies stay valid after h5read returns. Contiguous, uncompressed
+    datasets can be memory-mapped with :py:meth:`memmap`.
+    """
+
+    def __init__(self, filename, path, shape, dtype, offset=None):
+        self.filename = filename
+        self.path = path
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.offset = offset
+
+    @classmethod
+    def from_dataset(cls, dset):
+        offset = None
+        if (dset.chunks is None and dset.compression is None
+                and not dset.dtype.hasobject and not dset.external):
+            try:
+                offset = dset.id.get_offset()
+            except Exception:
+                offset = None
+        return cls(dset.file.filename, dset.name, dset.shape, dset.dtype, offset)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        if not self.shape:
+            raise TypeError('len() of unsized object')
+        return self.shape[0]
+
+    def __getitem__(self, sl):
+        with h5py.File(self.filename, 'r') as f:
+            return f[self.path][sl]
+
+    def read(self):
+        """ Load the whole dataset. """
+        return self[...]
+
+    def __array__(self, dtype=None, copy=None):
+        a = self.read()
+        return a if dtype is None else a.astype(dtype, copy=False)
+
+    def memmap(self):
+        """
+        Read-only memory map of the dataset, or the loaded array if the
+        dataset is chunked, compressed or not yet allocated.
+        """
+        if self.offset is None or not self.size:
+            return self.read()
+        return np.memmap(self.filename, dtype=self.dtype, mode='r',
+                         offset=self.offset, shape=self.shape)
+
+    def __repr__(self):
+        sh = 'x'.join(str(x) for x in self.shape) if self.shape else 'scalar'
+        return '<H5Proxy %s [%s %s array]>' % (self.path, sh, self.dtype)
+
+
+def h5resolve(obj):
+    """
+    Copy of the tree `obj` from h5read(..., lazy=True) in which every
+    :py:class:`H5Proxy` is replaced by the loaded array.
+    """
+    if isinstance(obj, H5Proxy):
+        return obj.read()
+    elif type(obj) in (dict, OrderedDict, Param):
+        d = type(obj)()
+        for k, v in obj.items():
+            d[k] = h5resolve(v)
+        return d
+    elif type(obj) in (list, tuple):
+        return type(obj)(h5resolve(v) for v in obj)
+    return obj
+
+
+def _unshuffle(buf, cd_values):
+    """ Inverse of the HDF5 shuffle filter. """
+    a = np.frombuffer(buf, np.uint8)
+    size = cd_values[0]
+    n = len(a) // size
+    if size in (2, 4, 8) and n * size == len(a):
+        # Assemble little-endian words from the byte planes, much faster
+        # than a byte-wise transpose
+        planes = a.reshape(size, n)
+        word = np.dtype('<u%d' % size)
+        out = planes[0].astype(word)
+        for k in range(1, size):
+            out |= planes[k].astype(word) << (8 * k)
+        return out.view(np.uint8)
+    out = np.empty_like(a)
+    out[:n * size] = a[:n * size].reshape(size, n).T.ravel()
+    out[n * size:] = a[n * size:]
+    return out
+
+
+def _decode_lz4(buf, cd_values):
+    """ Inverse of the HDF5 LZ4 filter (id 32004). """
+    total, block = struct.unpack('>qi', bytes(buf[:12]))
+    out = bytearray()
+    pos = 12
+    while len(out) < total:
+        nb, = struct.unpack('>i', bytes(buf[pos:pos + 4]))
+        pos += 4
+        size = min(block, total - len(out))
+        data = bytes(buf[pos:pos + nb])
+        out += data if nb == size else lz4_block.decompress(data, uncompressed_size=size)
+        pos += nb
+    return out
+
+
+def _decode_bitshuffle(buf, cd_values):
+    """ Inverse of the bitshuffle filter (id 32008) with LZ4. """
+    itemsize = cd_values[2]
+    total, block = struct.unpack('>QI', bytes(buf[:12]))
+    dtype = np.dtype('u%d' % itemsize)
+    return bitshuffle.decompress_lz4(np.frombuffer(buf, np.uint8, offset=12),
+                                     (total // itemsize,), dtype, block // itemsize)
+
+
+def _fletcher32(buf, cd_values):
+    """
+    Check and strip the Fletcher-32 checksum of the HDF5 filter. The sums
+    run over big-endian 16-bit words and are reduced modulo 65535 as in
+    HDF5, where a non-zero sum that is a multiple of 65535 is 0xffff.
+    """
+    a = np.frombuffer(buf, np.uint8)
+    data, stored = a[:-4], struct.unpack('<I', a[-4:].tobytes())[0]
+    if len(data) % 2:
+        data = np.append(data, np.uint8(0))
+    w = data.view('>u2').astype(np.uint64)
+    n = len(w)
+    s1 = int(w.sum()) % 65535
+    s2 = int(np.dot(w, (np.arange(n, 0, -1, dtype=np.uint64) % 65535))) % 65535
+    if w.any():
+        s1 = s1 or 0xffff
+        s2 = s2 or 0xffff
+    checksum = (s2 << 16) | s1
+    # Files from HDF5 before 1.6.3 have the bytes of each sum swapped
+    swap = lambda s: ((s & 0xff) << 8) | (s >> 8)
+    if stored not in (checksum, (swap(s2) << 16) | swap(s1)):
+        raise OSError('Data error detected by Fletcher-32 checksum')
+    return a[:-4]
+
+
+# Decoders for direct chunk reads: filter id -> (decode(buf, cd_values), available)
+_CHUNK_DECODERS = {
+    h5py.h5z.FILTER_DEFLATE: (lambda buf, cd: zlib.decompress(buf), True),
+    h5py.h5z.FILTER_SHUFFLE: (_unshuffle, True),
+    h5py.h5z.FILTER_FLETCHER32: (_fletcher32, True),
+    32001: (lambda buf, cd: blosc.decompress(bytes(buf)), blosc is not None),
+    32004: (_decode_lz4, lz4_block is not None),
+    32008: (_decode_bitshuffle, bitshuffle is not None),
+}
+
+
+class H5FrameReader(object):
+    """
+    Read frames of a dataset that is chunked one frame per chunk, with
+    h5py's direct chunk reads instead of the HDF5 filter pipeline.
+
+    :py:meth:`read` fetches the raw chunks of all requested frames first
+    and then decompresses them, in `threads` threads if more than one.
+    zlib and the decompressors of the optional packages blosc,
+    bitshuffle and lz4 release the GIL. Decompressed frames are written
+    straight into the destination array.
+
+    Use :py:meth:`supported` to check a dataset first. Filters that are
+    not listed in _CHUNK_DECODERS, or whose package is missing, are not
+    supported.
+    """
+
+    def __init__(self, dset, threads=1):
+        if not self.supported(dset):
+            raise ValueError('Direct chunk reads not supported for %s' % dset.name)
+        self.dset = dset
+        self.threads = max(int(threads), 1)
+        self._executor = None
+        plist = dset.id.get_create_plist()
+        self.pipeline = [plist.get_filter(i)[:3:2] for i in range(plist.get_nfilters())]
+        self.frame_shape = dset.shape[-2:]
+
+    @staticmethod
+    def supported(dset):
+        """
+        True if `dset` holds one whole frame per chunk and all of its
+        filters can be decoded.
+        """
+        if (dset.chunks is None or dset.ndim < 3 or dset.is_virtual
+                or dset.dtype.kind not in 'biuf'):
+            return False
+        if (dset.chunks[-2:] != dset.shape[-2:]
+                or any(c != 1 for c in dset.chunks[:-2])):
+            return False
+        plist = dset.id.get_create_plist()
+        for i in range(plist.get_nfilters()):
+            code = plist.get_filter(i)[0]
+            if not _CHUNK_DECODERS.get(code, (None, False))[1]:
+                return False
+        return True
+
+    def _decode(self, filter_mask, buf):
+        for i in reversed(range(len(self.pipeline))):
+            if filter_mask & (1 << i):
+                # Filter was skipped for this chunk
+                continue
+            code, cd_values = self.pipeline[i]
+            buf = _CHUNK_DECODERS[code][0](buf, cd_values)
+        return np.frombuffer(buf, self.dset.dtype).reshape(self.frame_shape)
+
+    def read(self, frames, out, sel=Ellipsis):
+        """
+        Read frames into `out`, ``out[j] = frame[sel]`` for the j-th
+        entry of `frames`, a list of index tuples (or integers) along
+        the leading axes of the dataset.
+        """
+        zeros = (0,) * 2
+        raw = []
+        for frame in frames:
+            frame = tuple(np.atleast_1d(frame).astype(int))
+            try:
+                raw.append(self.dset.id.read_direct_chunk(frame + zeros))
+            except (KeyError, RuntimeError, OSError):
+                # Chunk not allocated (fill value), read the usual way
+                raw.append(frame)
+
+        def decode(j):
+            r = raw[j]
+            if len(r) == 2 and isinstance(r[1], bytes):
+                out[j] = self._decode(*r)[sel]
+            else:
+                out[j] = self.dset[r][sel]
+
+        if self.threads > 1 and len(raw) > 1:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.threads)
+            list(self._executor.map(decode, range(len(raw))))
+        else:
+            for j in range(len(raw)):
+                decode(j)
+        return out
+
+    def close(self):
+        """ Stop the decompression threads. """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
 def h5read(filename, *args, **kwargs):
     """\
     h5read(filename)
@@ -360,8 +899,13 @@ def h5read(filename, *args, **kwargs):
     h5read(filename_with_wildcard, ... , doglob=True)
     Reads sequentially all globbed filenames.
 
+    h5read(filename, ..., lazy=True)
+    Does not load arrays, but returns an H5Proxy for each of them that
+    reads on access (see h5resolve to load them all).
+
     """
     doglob = kwargs.pop('doglob', None)
+    lazy = kwargs.pop('lazy', False)
     depth = kwargs.pop('depth', None)
     depth = 99 if depth is None else depth + 1
 
@@ -423,6 +967,8 @@ def h5read(filename, *args, **kwargs):
     def _load_numpy(dset, sl=None):
         if sl is not None:
             return dset[sl]
+        elif lazy:
+            return H5Proxy.from_dataset(dset)
         else:
             return dset[...]
 
@@ -484,7 +1030,7 @@ def h5read(filename, *args, **kwargs):
         elif dset_type == 'array':
             val = _load_numpy(dset, sl)
         elif dset_type == 'arraylist':
-            val = [x for x in _load_numpy(dset)]
+            val = [x for x in dset[...]]
             if sl is not None:
                 val = val[sl]
         elif dset_type == 'tuple':
@@ -492,7 +1038,7 @@ def h5read(filename, *args, **kwargs):
             if sl is not None:
                 val = val[sl]
         elif dset_type == 'arraytuple':
-            val = tuple(_load_numpy(dset).tolist())
+            val = tuple(dset[...].tolist())
             if sl is not None:
                 val = val[sl]
         elif dset_type == 'string':
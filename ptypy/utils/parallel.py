@@ -26,8 +26,8 @@ MPIenabled = not (size == 1)
 master = (rank == 0)
 
 __all__ = ['MPIenabled', 'comm', 'MPI', 'master','barrier',
-           'LoadManager', 'loadmanager','allreduce','send','receive','bcast',
-           'bcast_dict', 'gather_dict', 'gather_list', 
+           'LoadManager', 'loadmanager', 'space_filling_ranks', 'allreduce','send','receive','bcast',
+           'bcast_dict', 'gather_dict', 'gather_list', 'halo_reduce', 'gather_tiles',
            'MPIrand_normal', 'MPIrand_uniform','MPInoise2d']
 
 
@@ -150,6 +150,26 @@ class LoadManager(object):
             self.rank_of[k] = r
         return out
 
+    def assign_ranks(self, idlist, ranks):
+        """
+        Assign each id of `idlist` to the rank given for it in `ranks`,
+        e.g. from :any:`space_filling_ranks`, instead of balancing the
+        load here. Loads and :any:`rank_of` are updated as in :any:`assign`.
+
+        Returns
+        -------
+        R : list
+            A nested list such that ``R[rank]`` lists the positions in
+            `idlist` of the ids managed by process of given `rank`.
+        """
+        out = [[] for x in range(size)]
+        for i, (k, r) in enumerate(zip(idlist, ranks)):
+            r = int(r)
+            out[r].append(i)
+            self.load[r] += 1
+            self.rank_of[k] = r
+        return out
+
     def reset(self):
         """
         Resets :any:`LoadManager` to initial state.
@@ -160,6 +180,87 @@ class LoadManager(object):
 loadmanager = LoadManager()
 
 
+def _hilbert_keys(ix, iy, bits):
+    """
+    Distance along the Hilbert curve through a 2**bits x 2**bits grid
+    of the integer points `ix`, `iy`.
+    """
+    n = 1 << bits
+    x = np.array(ix, dtype=np.int64)
+    y = np.array(iy, dtype=np.int64)
+    d = np.zeros_like(x)
+    s = n >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+        # Rotate the quadrant
+        flip = ~ry & rx
+        x[flip] = n - 1 - x[flip]
+        y[flip] = n - 1 - y[flip]
+        swap = ~ry
+        x[swap], y[swap] = y[swap], x[swap]
+        s >>= 1
+    return d
+
+
+def _morton_keys(ix, iy, bits):
+    """
+    Distance along the Morton (Z-order) curve of the integer points
+    `ix`, `iy`, i.e. their interleaved bits.
+    """
+    x = np.asarray(ix, dtype=np.int64)
+    y = np.asarray(iy, dtype=np.int64)
+    d = np.zeros_like(x)
+    for b in range(bits):
+        d |= ((x >> b) & 1) << (2 * b + 1)
+        d |= ((y >> b) & 1) << (2 * b)
+    return d
+
+
+def space_filling_ranks(positions, curve='hilbert', nranks=None, bits=16):
+    """
+    Distribute 2D `positions` among `nranks` processes (default: all)
+    in contiguous, equally long sections of a space-filling curve, so
+    that each process gets a spatially compact set of positions.
+
+    Parameters
+    ----------
+    positions : array-like
+        (N, 2) array of positions.
+    curve : str
+        ``'hilbert'`` or ``'morton'`` (Z-order).
+    nranks : int
+        Number of processes, defaults to the size of the communicator.
+    bits : int
+        Positions are quantized to a grid of 2**bits steps along the
+        larger extent of the scan.
+
+    Returns
+    -------
+    ranks : ndarray
+        Rank of each position.
+    """
+    nranks = size if nranks is None else nranks
+    pos = np.asarray(positions, dtype=float).reshape(-1, 2)
+    N = len(pos)
+    if N == 0:
+        return np.zeros((0,), dtype=int)
+    mn = pos.min(0)
+    extent = (pos.max(0) - mn).max()
+    scale = ((1 << bits) - 1) / extent if extent > 0 else 0.
+    ix, iy = np.round((pos - mn) * scale).astype(np.int64).T
+    if curve == 'hilbert':
+        keys = _hilbert_keys(ix, iy, bits)
+    elif curve == 'morton':
+        keys = _morton_keys(ix, iy, bits)
+    else:
+        raise RuntimeError('Unknown space-filling curve %s' % curve)
+    ranks = np.empty((N,), dtype=int)
+    ranks[np.argsort(keys, kind='stable')] = (np.arange(N) * nranks) // N
+    return ranks
+
+
 def allreduce(a, op=None):
     """
     Wrapper for comm.Allreduce, always in place.
@@ -211,6 +312,118 @@ def allreduceC(c):
     for s in c.S.values():
         allreduce(s.data)
 
+
+def _tile_overlap(corner, shape, other_corner, other_shape):
+    """
+    Slices of the region that a tile with upper-left `corner` and
+    `shape` shares with another tile, relative to the first tile.
+    None if they do not overlap.
+    """
+    sl = []
+    for c, n, oc, on in zip(corner, shape, other_corner, other_shape):
+        lo = max(c, oc)
+        hi = min(c + n, oc + on)
+        if hi <= lo:
+            return None
+        sl.append(slice(lo - c, hi - c))
+    return (Ellipsis,) + tuple(sl)
+
+
+def halo_reduce(a, corner, op=None, tag=7100):
+    """
+    Reduce the tiles of a distributed array in place, over the regions
+    where they overlap.
+
+    Each process holds the tile `a` whose last ``len(corner)`` axes lie
+    at `corner` (integer pixel index of the upper-left element) on a
+    grid common to all processes. Leading axes must be the same
+    everywhere. Every region shared with another process is exchanged
+    with that process only, so communication scales with the overlap
+    and not with the size of the whole array. The result in each pixel
+    is the reduction over all tiles covering it.
+
+    Parameters
+    ----------
+    a : ndarray
+        The local tile, changed in place.
+    corner : tuple of int
+        Grid position of the tile.
+    op : MPI operation
+        None (sum), MPI.MAX or MPI.MIN.
+
+    Returns
+    -------
+    a : ndarray
+    """
+    if not MPIenabled:
+        return a
+    corner = tuple(int(c) for c in corner)
+    nd = len(corner)
+    tiles = comm.allgather((corner, a.shape[-nd:]))
+
+    # Send unreduced copies, so that pixels shared by several
+    # processes get every contribution exactly once
+    requests = []
+    received = []
+    for r, (oc, osh) in enumerate(tiles):
+        if r == rank:
+            continue
+        sl = _tile_overlap(corner, a.shape[-nd:], oc, osh)
+        if sl is None:
+            continue
+        sendbuf = np.ascontiguousarray(a[sl])
+        recvbuf = np.empty_like(sendbuf)
+        requests.append(comm.Isend(sendbuf, dest=r, tag=tag))
+        requests.append(comm.Irecv(recvbuf, source=r, tag=tag))
+        received.append((sl, recvbuf, sendbuf))
+    MPI.Request.Waitall(requests)
+
+    for sl, recvbuf, sendbuf in received:
+        if op is None or op == MPI.SUM:
+            a[sl] += recvbuf
+        elif op == MPI.MAX:
+            np.maximum(a[sl], recvbuf, out=a[sl])
+        elif op == MPI.MIN:
+            np.minimum(a[sl], recvbuf, out=a[sl])
+        else:
+            raise NotImplementedError('halo_reduce supports sum, max and min.')
+    return a
+
+
+def gather_tiles(a, corner, target=0, fill=0):
+    """
+    Assemble the tiles of a distributed array (see :any:`halo_reduce`)
+    at rank `target`. The tiles must agree where they overlap.
+
+    Returns
+    -------
+    out, corner : ndarray, tuple
+        The array covering all tiles and its grid position at rank
+        `target`, ``(None, None)`` elsewhere.
+    """
+    corner = tuple(int(c) for c in corner)
+    if not MPIenabled:
+        return a, corner
+    nd = len(corner)
+    tiles = comm.gather((corner, a.shape[-nd:]), root=target)
+    if rank != target:
+        comm.Send(np.ascontiguousarray(a), dest=target, tag=7101)
+        return None, None
+
+    lo = np.min([c for c, sh in tiles], axis=0)
+    hi = np.max([np.add(c, sh) for c, sh in tiles], axis=0)
+    out = np.empty(a.shape[:-nd] + tuple(hi - lo), dtype=a.dtype)
+    out.fill(fill)
+    for r, (c, sh) in enumerate(tiles):
+        if r == rank:
+            tile = a
+        else:
+            tile = np.empty(a.shape[:-nd] + tuple(sh), dtype=a.dtype)
+            comm.Recv(tile, source=r, tag=7101)
+        out[(Ellipsis,) + tuple(slice(ci - l, ci - l + n)
+                                for ci, l, n in zip(c, lo, sh))] = tile
+    return out, tuple(int(l) for l in lo)
+
 def _MPIop(a, op, axis=None):
     """
     Apply operation op on accross a list of arrays distributed between
@@ -234,6 +447,9 @@ def _MPIop(a, op, axis=None):
                 s = np.array([0.])
             else:
                 s = np.array([1.])
+        elif all(np.isscalar(ai) for ai in a):
+            # Plain list of numbers (e.g. a layermap)
+            s = np.array([npop(np.asarray(a))])
         else:
             # Apply op on locally owned data (and wrap the scalar result in a numpy array
             s = np.array([npop([npop(ai) for ai in a if ai is not None])])
@@ -768,17 +768,17 @@ def figure_from_ptyr(filename, pars=None):
     ------
     fig : matplotlib.figure.Figure
     """
-    from ..io import h5read
+    from ..io import h5read, h5resolve
     header = h5read(filename,'header')['header']
     if str(header['kind']) == 'fullflat':
         raise NotImplementedError('Loading specific data from flattened dump not yet supported')
     else: 
-        content = list(h5read(filename,'content').values())[0]
-        runtime = content['runtime']
+        content = list(h5read(filename,'content', lazy=True).values())[0]
+        runtime = h5resolve(content['runtime'])
         probes = Param()
-        probes.update(content['probe'], Convert = True)
+        probes.update(h5resolve(content['probe']), Convert = True)
         objects = Param()
-        objects.update(content['obj'], Convert = True)
+        objects.update(h5resolve(content['obj']), Convert = True)
     if pars is None:
         pars = TEMPLATES["jupyter"]
     plotter = MPLplotter(pars=pars, 
@@ -693,13 +693,14 @@ def load_from_ptyr(filename, what='probe', ID=None, layer=None):
     else:
         if ID is not None:
             address ='content/' + str(what) + '/' + str(ID)
-            storage = io.h5read(filename, address)[address]
+            storage = io.h5read(filename, address, lazy=True)[address]
         else:
             address = 'content/' + str(what)
-            conti = io.h5read(filename, address)[address]
+            conti = io.h5read(filename, address, lazy=True)[address]
             storage = list(conti.values())[0]
+        # Only the requested part of the buffer is read from file
         if layer is None:
-            return storage['data']
+            return np.asarray(storage['data'])
         else:
             return storage['data'][layer]
 
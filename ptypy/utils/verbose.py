@@ -278,7 +278,7 @@ def report(thing,depth=4,noheader=False):
     def _format_numpy(key, level,a):
         header,extra = _(key, level, a)
         if len(a) < 5 and a.ndim == 1:
-            stringout = header + ' [array = ' + str(a.ravel()) + ']\n'
+            stringout = header + ' [array = ' + str(np.asarray(a).ravel()) + ']\n'
         else:
             stringout = header + ' [' + (('%dx'*(a.ndim-1) + '%d') % a.shape) + ' ' + str(a.dtype) + ' array]\n'
         return stringout
@@ -289,7 +289,9 @@ def report(thing,depth=4,noheader=False):
     def _format(key,level, obj):
         if hasattr(obj,'items'):
             stringout = _format_dict(key,level, obj)
-        elif type(obj) is np.ndarray:
+        elif type(obj) is np.ndarray or (hasattr(obj, 'shape') and hasattr(obj, 'dtype')
+                                         and not np.isscalar(obj)):
+            # arrays and array proxies
             stringout = _format_numpy(key,level, obj)
         elif str(obj)==obj:
             stringout = _format_other(key,level, obj)
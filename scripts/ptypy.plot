@@ -33,12 +33,12 @@ header = io.h5read(filename,'header')['header']
 if str(header['kind']) == 'fullflat':
     raise NotImplementedError('Loading specific data from flattened dump not yet supported')
 else: 
-    content = list(io.h5read(filename,'content').values())[0]#['content']
-    runtime = content['runtime']
+    content = list(io.h5read(filename,'content', lazy=True).values())[0]#['content']
+    runtime = io.h5resolve(content['runtime'])
     probes = u.Param()
-    probes.update(content['probe'], Convert = True)
+    probes.update(io.h5resolve(content['probe']), Convert = True)
     objects = u.Param()
-    objects.update(content['obj'], Convert = True)
+    objects.update(io.h5resolve(content['obj']), Convert = True)
 
 Plotter = u.MPLplotter(pars=pars, probes = probes, objects= objects, runtime= runtime)
 Plotter._set_autolayout(template)
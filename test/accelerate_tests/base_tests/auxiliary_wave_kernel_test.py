@@ -425,5 +425,56 @@ class AuxiliaryWaveKernelTest(unittest.TestCase):
         np.testing.assert_array_equal(exit_wave, expected_exit_wave,
                                       err_msg="The exit_wave has not been updated as expected")
 
+    def check_batched(self, call, shuffle_exit=False):
+        addr, object_array, probe, exit_wave = self.prepare_arrays(scan_points=3)
+        rng = np.random.default_rng(1)
+        object_array += rng.random(object_array.shape).astype(FLOAT_TYPE)
+        exit_wave += rng.random(exit_wave.shape).astype(FLOAT_TYPE)
+        if shuffle_exit:
+            flat_addr = addr.reshape(-1, 5, 3)
+            flat_addr[:, 2, 0] = rng.permutation(len(flat_addr))
+        auxiliary_wave = exit_wave.copy() * 1.5
+        outputs = []
+        for batched in [False, True]:
+            AWK = AuxiliaryWaveKernel(batched=batched)
+            AWK.max_batch_size = 3 * 3 * 5
+            AWK.allocate()
+            arrays = [a.copy() for a in (auxiliary_wave, addr, object_array, probe, exit_wave)]
+            call(AWK, *arrays)
+            outputs.append(arrays)
+        for loop, batched in zip(*outputs):
+            np.testing.assert_array_equal(batched, loop,
+                                          err_msg="The batched kernel does not match the loop")
+
+    def test_make_aux_batched(self):
+        def call(AWK, aux, addr, ob, pr, ex):
+            AWK.make_aux(aux, addr, ob, pr, ex, c_po=0.7, c_e=0.3)
+        self.check_batched(call)
+        self.check_batched(call, shuffle_exit=True)
+
+    def test_make_exit_batched(self):
+        def call(AWK, aux, addr, ob, pr, ex):
+            AWK.make_exit(aux, addr, ob, pr, ex, c_a=0.8, c_po=-1.3, c_e=0.5)
+        self.check_batched(call)
+        self.check_batched(call, shuffle_exit=True)
+
+    def test_build_aux_no_ex_batched(self):
+        def call(AWK, aux, addr, ob, pr, ex):
+            AWK.build_aux_no_ex(aux, addr, ob, pr, fac=1.1, add=True)
+        self.check_batched(call)
+
+    def test_gather_index(self):
+        addr = self.prepare_arrays()[0]
+        AWK = AuxiliaryWaveKernel(batched=True)
+        table = AWK.gather_index(addr)
+        self.assertIs(AWK.gather_index(addr), table)
+        self.assertTrue(table.ex_unique)
+        self.assertEqual(table.ex_slice, slice(0, 16))
+        np.testing.assert_array_equal(table.ob[1], addr.reshape(-1, 5, 3)[:, 1, 1])
+        addr[..., 2, 0] = 0
+        table = AWK.gather_index(addr)
+        self.assertFalse(table.ex_unique)
+        self.assertIsNone(table.ex_slice)
+
 if __name__ == '__main__':
     unittest.main()
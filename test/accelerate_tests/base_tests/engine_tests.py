@@ -167,5 +167,40 @@ class MLSerialTest(unittest.TestCase):
                                            scanmodel="BlockFull", autosave=False, verbose_level="critical"))
         self.check_engine_output(out, plotting=False, debug=False)
 
+    def test_ML_serial_cache_forward(self):
+        engine_params = u.Param()
+        engine_params.name = "ML_serial"
+        engine_params.numiter = 10
+        engine_params.floating_intensities = True
+        tu.EngineToggleRunner(engine_params, "cache_forward", [False, True], compare=("obj", "probe"),
+                              seed=0, output_path=self.outpath, init_correct_probe=True,
+                              scanmodel="BlockFull", autosave=False, verbose_level="critical")
+
+class DMSerialTest(unittest.TestCase):
+
+    def setUp(self):
+        self.outpath = tempfile.mkdtemp(suffix="DM_serial_test")
+
+    def tearDown(self):
+        shutil.rmtree(self.outpath)
+
+    def test_DM_serial_numthreads(self):
+        out = []
+        for numthreads in [1, 3]:
+            np.random.seed(0)
+            engine_params = u.Param()
+            engine_params.name = "DM_serial"
+            engine_params.numiter = 5
+            engine_params.numthreads = numthreads
+            out.append(tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                           scanmodel="BlockFull", autosave=False, verbose_level="critical"))
+        crop = 42
+        OBJ_1, OBJ_3 = [P.obj.S["SMFG00"].data[0,crop:-crop,crop:-crop] for P in out]
+        PRB_1, PRB_3 = [P.probe.S["SMFG00"].data[0] for P in out]
+        np.testing.assert_allclose(OBJ_3, OBJ_1, rtol=1e-4, atol=1e-4,
+                                   err_msg="The object arrays are not matching as expected")
+        np.testing.assert_allclose(PRB_3, PRB_1, rtol=1e-4, atol=1e-3,
+                                   err_msg="The probe arrays are not matching as expected")
+
 if __name__ == "__main__":
     unittest.main()
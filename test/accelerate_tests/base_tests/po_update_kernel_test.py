@@ -508,5 +508,103 @@ class PoUpdateKernelTest(unittest.TestCase):
         np.testing.assert_array_equal(object_norm, expected_object_norm,
                                       err_msg="The object norm has not been updated as expected")
 
+    def prepare_random_arrays(self, npos=40, nmodes=2, fsh=8, osh=30):
+        rng = np.random.default_rng(1)
+        A = npos * nmodes * nmodes
+        probe = (rng.random((nmodes, fsh, fsh)) + 1j * rng.random((nmodes, fsh, fsh))).astype(COMPLEX_TYPE)
+        probe_denominator = rng.random((nmodes, fsh, fsh)).astype(FLOAT_TYPE)
+        object_array = (rng.random((nmodes, osh, osh)) + 1j * rng.random((nmodes, osh, osh))).astype(COMPLEX_TYPE)
+        object_array_denominator = rng.random((nmodes, osh, osh)).astype(FLOAT_TYPE)
+        exit_wave = (rng.random((A, fsh, fsh)) + 1j * rng.random((A, fsh, fsh))).astype(COMPLEX_TYPE)
+        auxiliary_wave = (rng.random((A, fsh, fsh)) + 1j * rng.random((A, fsh, fsh))).astype(COMPLEX_TYPE)
+        norm = (rng.random((npos, fsh, fsh)) + 0.5).astype(FLOAT_TYPE)
+
+        addr = np.zeros((npos, nmodes * nmodes, 5, 3), dtype=INT_TYPE)
+        ypos = rng.integers(0, osh - fsh, npos)
+        xpos = rng.integers(0, osh - fsh, npos)
+        exit_idx = 0
+        for position_idx in range(npos):
+            mode_idx = 0
+            for pr_mode in range(nmodes):
+                for ob_mode in range(nmodes):
+                    addr[position_idx, mode_idx] = np.array([[pr_mode, 0, 0],
+                                                             [ob_mode, ypos[position_idx], xpos[position_idx]],
+                                                             [exit_idx, 0, 0],
+                                                             [position_idx, 0, 0],
+                                                             [position_idx, 0, 0]], dtype=INT_TYPE)
+                    mode_idx += 1
+                    exit_idx += 1
+        return addr, object_array, object_array_denominator, probe, probe_denominator, exit_wave, auxiliary_wave, norm
+
+    def check_batched(self, call):
+        outputs = []
+        for batched in [False, True]:
+            arrays = [a.copy() for a in self.prepare_random_arrays()]
+            POUK = PoUpdateKernel(batched=batched)
+            # force several batches per level
+            POUK.max_batch_size = 8 * 8 * 5
+            POUK.allocate()
+            outputs.append(call(POUK, *arrays))
+        for loop, batched in zip(*outputs):
+            np.testing.assert_array_equal(batched, loop,
+                                          err_msg="The batched update does not match the loop")
+
+    def test_ob_update_batched(self):
+        def call(POUK, addr, ob, obn, pr, prn, ex, aux, nrm):
+            POUK.ob_update(addr, ob, obn, pr, ex)
+            return ob, obn
+        self.check_batched(call)
+
+    def test_pr_update_batched(self):
+        def call(POUK, addr, ob, obn, pr, prn, ex, aux, nrm):
+            POUK.pr_update(addr, pr, prn, ob, ex)
+            return pr, prn
+        self.check_batched(call)
+
+    def test_ob_update_ML_batched(self):
+        def call(POUK, addr, ob, obn, pr, prn, ex, aux, nrm):
+            POUK.ob_update_ML(addr, ob, pr, ex)
+            return ob,
+        self.check_batched(call)
+
+    def test_pr_update_ML_batched(self):
+        def call(POUK, addr, ob, obn, pr, prn, ex, aux, nrm):
+            POUK.pr_update_ML(addr, pr, ob, ex)
+            return pr,
+        self.check_batched(call)
+
+    def test_ob_update_local_batched(self):
+        def call(POUK, addr, ob, obn, pr, prn, ex, aux, nrm):
+            POUK.pr_norm_local(addr, pr, nrm)
+            POUK.ob_update_local(addr, ob, pr, ex, aux, nrm, a=0.3, b=0.6)
+            return ob, nrm
+        self.check_batched(call)
+
+    def test_pr_update_local_batched(self):
+        def call(POUK, addr, ob, obn, pr, prn, ex, aux, nrm):
+            POUK.ob_norm_local(addr, ob, nrm)
+            POUK.pr_update_local(addr, pr, ob, ex, aux, nrm, nrm.max(), a=0.3, b=0.6)
+            return pr, nrm
+        self.check_batched(call)
+
+    def test_batch_plan(self):
+        addr = self.prepare_random_arrays()[0]
+        POUK = PoUpdateKernel(batched=True)
+        flat_addr = addr.reshape(-1, 5, 3)
+        # object: batches must not overlap
+        plan = POUK.batch_plan(addr, 1, (2, 30, 30), 8, 8)
+        self.assertEqual(sorted(np.concatenate([ind for _, ind in plan])), list(range(len(flat_addr))))
+        for reduce, ind in plan:
+            self.assertFalse(reduce)
+            cover = np.zeros((2, 30, 30), dtype=INT_TYPE)
+            for l, y, x in flat_addr[ind, 1]:
+                cover[l, y:y + 8, x:x + 8] += 1
+            self.assertLessEqual(cover.max(), 1)
+        # probe: one reduction per mode
+        plan = POUK.batch_plan(addr, 0, (2, 8, 8), 8, 8)
+        self.assertEqual(len(plan), 2)
+        self.assertTrue(all(reduce for reduce, _ in plan))
+        self.assertIs(POUK.batch_plan(addr, 0, (2, 8, 8), 8, 8), plan)
+
 if __name__ == '__main__':
     unittest.main()
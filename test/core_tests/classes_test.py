@@ -446,6 +446,75 @@ class TestContainer(unittest.TestCase):
             'Returning internal dict of Views in Container failed.'
         )
 
+    def test_view_table_property(self):
+        """Records of all Views in Container as structured array"""
+        cont = c.Container(data_type='real')
+        views = [c.View(cont, shape=4, coord=(i, 0.), psize=1., layer=i)
+                 for i in range(50)]
+        copy = views[3].copy()
+        table = cont.view_table
+        self.assertEqual(len(table), len(cont.views) + 1,
+                         'View table does not hold one row per View.')
+        for v in views + [copy]:
+            np.testing.assert_array_equal(table['dlow'][v.numID, :2], v.dlow)
+            self.assertEqual(table['layer'][v.numID], v.layer)
+        self.assertEqual(table['ID'][copy.numID].decode(), copy.ID)
+
+        # assignments to the table act on the views
+        table['active'][views[7].numID] = False
+        self.assertFalse(views[7].active)
+
+    def test_view_table_removed_and_loaded(self):
+        """View table after removing Views and with detached records"""
+        cont = c.Container(data_type='real')
+        views = [c.View(cont, shape=4, coord=(i, 0.), psize=1., layer=i)
+                 for i in range(20)]
+        del cont._pool[c.VIEW_PREFIX][views[5].ID]
+        new = c.View(cont, shape=4, coord=(30, 0.), psize=1., layer=30)
+        self.assertNotIn(new.numID, [v.numID for v in views],
+                         'numID of a removed View was reused.')
+        table = cont.view_table
+        self.assertEqual(len(table), max(v.numID for v in cont.views.values()) + 1)
+        self.assertEqual(table['layer'][new.numID], 30)
+        self.assertEqual(table['layer'][views[19].numID], 19)
+
+        # records copied as after loading from file are moved back in
+        for v in views:
+            v._record = v._record.copy()
+        views[3].layer = 42
+        cont._recs_dirty[c.VIEW_PREFIX] = True
+        table = cont.view_table
+        self.assertEqual(table['layer'][views[3].numID], 42)
+        table['layer'][views[4].numID] = 43
+        self.assertEqual(views[4].layer, 43)
+
+    def test_new_views(self):
+        """Bulk creation of Views matches one-by-one creation"""
+        coords = np.array([[i, 2. * i] for i in range(20)])
+        cont1 = c.Container(data_type='real')
+        s1 = cont1.new_storage(ID='S0', psize=1., shape=(1, 64, 64))
+        views = [c.View(cont1, storageID='S0', shape=4, coord=xy, psize=1.,
+                        layer=i % 3, active=bool(i % 2))
+                 for i, xy in enumerate(coords)]
+        cont2 = c.Container(data_type='real')
+        s2 = cont2.new_storage(ID='S0', psize=1., shape=(1, 64, 64))
+        bulk = cont2.new_views('S0', coords=coords, layers=np.arange(20) % 3,
+                               shape=4, psize=1., active=np.arange(20) % 2 > 0)
+        self.assertEqual(len(bulk), len(views))
+        for v, b in zip(views, bulk):
+            self.assertEqual(v.ID, b.ID)
+            self.assertIs(b.storage, s2)
+            self.assertEqual(v.active, b.active)
+            self.assertEqual(v.layer, b.layer)
+        cont1.reformat()
+        cont2.reformat()
+        self.assertEqual(s1.layermap, s2.layermap)
+        np.testing.assert_array_equal(s1.center, s2.center)
+        for v, b in zip(views, bulk):
+            np.testing.assert_array_equal(v.dlow, b.dlow)
+            np.testing.assert_array_equal(v.sp, b.sp)
+            self.assertEqual(v.dlayer, b.dlayer)
+
     def test_Vp_property(self):
         """Internal dictionary of View instances in Container as Param"""
         # Test function returns u.Param()
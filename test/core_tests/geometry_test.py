@@ -104,7 +104,65 @@ class GeometryTest(unittest.TestCase):
         G = self.set_up_farfield()
         P = BasicFarfieldPropagator(G.p,ffttype="scipy")
         self. _basic_propagator_test(P)
-    
+
+    def _inplace_propagator_test(self, prop):
+
+        S = (3, 256, 256)
+        A = (np.random.random(S) + 1j * np.random.random(S)).astype(np.complex64)
+
+        # propagation into a preallocated buffer
+        B = prop.fw(A)
+        C = A.copy()
+        prop.fw(C, out=C)
+        np.testing.assert_allclose(B, C, rtol=1e-5, atol=1e-5 * np.abs(B).max(),
+                                   err_msg="fw(x, out=x) differs from fw(x), using {:s}".format(prop.FFTch.ffttype))
+        prop.bw(C, out=C)
+        np.testing.assert_allclose(A, C, rtol=1e-4, atol=1e-5,
+                                   err_msg="bw(fw(x)) in place did not return x, using {:s}".format(prop.FFTch.ffttype))
+
+    def test_inplace_farfield_propagator(self):
+        G = self.set_up_farfield()
+        for ffttype in ["numpy", "scipy", "fftw"]:
+            P = BasicFarfieldPropagator(G.p, ffttype=ffttype, fftworkers=2, dtype=np.complex64)
+            self._inplace_propagator_test(P)
+
+    def test_inplace_nearfield_propagator(self):
+        G = self.set_up_nearfield()
+        for ffttype in ["numpy", "scipy", "fftw"]:
+            P = BasicNearfieldPropagator(G.p, ffttype=ffttype, fftworkers=2, dtype=np.complex64)
+            self._inplace_propagator_test(P)
+
+    def test_fftw_wisdom_file(self):
+        if geometry.pyfftw is None:
+            raise unittest.SkipTest("pyfftw not available")
+        import os, tempfile
+        wisdom = os.path.join(tempfile.mkdtemp(), "wisdom.pkl")
+        G = self.set_up_farfield()
+        P = BasicFarfieldPropagator(G.p, ffttype="fftw", fftw_wisdom=wisdom, dtype=np.complex64)
+        P.fw(np.ones((2, 256, 256), dtype=np.complex64))
+        assert os.path.exists(wisdom), "FFTW wisdom was not written to {:s}".format(wisdom)
+
+    def test_fftw_plan_cache(self):
+        if geometry.pyfftw is None:
+            raise unittest.SkipTest("pyfftw not available")
+        import threading
+        fft, ifft = geometry.FFT_BACKENDS['fftw']()
+        for n in range(geometry.FFTW_MAX_PLANS + 4):
+            x = np.ones((1, 8, 8 + n), dtype=np.complex64)
+            np.testing.assert_allclose(fft(x)[0, 0, 0], x.size)
+        self.assertEqual(len(geometry._fftw_local.plans), geometry.FFTW_MAX_PLANS,
+                         "FFTW plan cache is not bounded")
+
+        # Each thread plans for itself, and its plans go with it
+        def run(out):
+            out.append(fft(np.ones((1, 8, 8), dtype=np.complex64)))
+            out.append(len(geometry._fftw_local.plans))
+        out = []
+        t = threading.Thread(target=run, args=(out,))
+        t.start()
+        t.join()
+        self.assertEqual(out[1], 1)
+        self.assertEqual(len(geometry._fftw_local.plans), geometry.FFTW_MAX_PLANS)
 
 
 if __name__ == '__main__':
@@ -52,6 +52,89 @@ class StorageTest(unittest.TestCase):
         S.reformat()
         assert np.allclose(S[V], 1.)
 
+    def test_storage_layers(self):
+        """
+        Test layer bookkeeping when views are added in chunks
+        """
+        C = Container(data_dims=2, data_type='real')
+        S = C.new_storage(shape=(1, 8, 8), psize=1.)
+        views = []
+        for chunk in range(4):
+            for l in range(10 * chunk, 10 * chunk + 10):
+                views.append(View(container=C, storageID=S.ID, coord=(0., 0.),
+                                  shape=(8, 8), psize=1., layer=2 * l))
+            S.reformat()
+            for v in views[-10:]:
+                S[v] = v.layer
+            assert S.layermap == [2 * l for l in range(len(views))]
+            for v in views:
+                assert S.layermap[v.dlayer] == v.layer
+                assert np.all(S[v] == v.layer)
+
+        # inserting layers in between keeps the existing ones
+        V = View(container=C, storageID=S.ID, coord=(0., 0.), shape=(8, 8),
+                 psize=1., layer=3)
+        S.reformat()
+        assert S.nlayers == len(views) + 1
+        assert S.layermap[V.dlayer] == 3
+        for v in views:
+            assert np.all(S[v] == v.layer)
+
+    def test_storage_tiles(self):
+        """
+        Test that tiles covering different views share one pixel grid
+        """
+        psize = 1.
+        coords = [(10.3, 20.6), (40.3, 35.6), (70.3, 60.6)]
+        tiles = []
+        for cc in [coords[:2], coords[1:]]:
+            C = Container(data_dims=2, distribution='tiled')
+            S = C.new_storage(shape=16, psize=psize)
+            views = [View(container=C, storageID=S.ID, coord=c, shape=(20, 20),
+                          psize=psize) for c in cc]
+            S.reformat()
+            self.assertTrue(S.tiled and C.tiled)
+            self.assertTrue(C.copy(ID='Ccopy', fill=0.).tiled)
+            # Tiles only cover their own views
+            self.assertEqual(S.shape[1:], tuple(views[1].dhigh - views[0].dlow))
+            np.testing.assert_array_equal(S.tile_coverage(), 1)
+            self.assertTrue(S.tile_owned().all())
+            data, center = S.gather_tiles()
+            np.testing.assert_array_equal(center, S.center)
+            tiles.append((S, views))
+        # The shared view lies at the same grid position in both tiles
+        (S0, v0), (S1, v1) = tiles
+        np.testing.assert_array_equal(np.add(S0.tile_corner, v0[1].dlow),
+                                      np.add(S1.tile_corner, v1[0].dlow))
+
+    def test_tile_overlap(self):
+        """
+        Test the reduction of overlapping tiles on a common grid
+        """
+        from ptypy.utils.parallel import _tile_overlap
+        self.assertIsNone(_tile_overlap((0, 0), (4, 4), (4, 0), (3, 3)))
+        rng = np.random.RandomState(0)
+        tiles = [((0, 0), (6, 7)), ((3, 4), (5, 5)), ((5, 1), (4, 4))]
+        full = np.zeros((10, 10))
+        data = []
+        for corner, shape in tiles:
+            a = rng.rand(2, *shape)
+            data.append(a)
+            full_sl = (slice(corner[0], corner[0] + shape[0]),
+                       slice(corner[1], corner[1] + shape[1]))
+            full = full + np.pad(a.sum(0), [(s.start, 10 - s.stop) for s in full_sl])
+        for i, (corner, shape) in enumerate(tiles):
+            out = data[i].copy()
+            for j, (oc, osh) in enumerate(tiles):
+                if j == i:
+                    continue
+                sl = _tile_overlap(corner, shape, oc, osh)
+                osl = _tile_overlap(oc, osh, corner, shape)
+                if sl is not None:
+                    out[sl] += data[j][osl]
+            np.testing.assert_allclose(out.sum(0), full[corner[0]:corner[0] + shape[0],
+                                                         corner[1]:corner[1] + shape[1]])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -10,6 +10,7 @@ import unittest
 from test import utils as tu
 from ptypy import utils as u
 import tempfile
+import numpy as np
 import shutil
 
 class DMTest(unittest.TestCase):
@@ -49,5 +50,23 @@ class DMTest(unittest.TestCase):
         engine_params.obj_smooth_std = 20
         tu.EngineTestRunner(engine_params, output_path=self.outpath)
 
+    def test_DM_tiled_object(self):
+        engine_params = u.Param()
+        engine_params.name = 'DM'
+        engine_params.numiter = 5
+        engine_params.probe_update_start = 2
+        engine_params.object_inertia = 0.1
+        out = tu.EngineToggleRunner(engine_params, 'object_distribution', ['cloned', 'tiled'],
+                                    output_path=self.outpath, autosave=False)
+        self.assertTrue(out[1].obj.tiled)
+
+    def test_tiled_object_unsupported_engine(self):
+        engine_params = u.Param()
+        engine_params.name = 'EPIE'
+        engine_params.numiter = 1
+        with self.assertRaises(NotImplementedError):
+            tu.EngineTestRunner(engine_params, output_path=self.outpath,
+                                autosave=False, object_distribution='tiled')
+
 if __name__ == "__main__":
     unittest.main()
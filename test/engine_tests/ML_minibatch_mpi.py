@@ -0,0 +1,77 @@
+"""
+Mini-batch ML reconstruction under MPI, run by ML_minibatch_test.py as
+
+    mpiexec -n <nprocs> python -m test.engine_tests.ML_minibatch_mpi <outdir>
+
+The processes hold different numbers of frames. Every process compares
+its step scale, object and probe with those of the master, up to the
+rounding of the reductions, and the script exits with an error if any
+of them disagree.
+
+This file is part of the PTYPY package.
+    :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
+    :license: see LICENSE for details.
+"""
+
+import sys
+import numpy as np
+from ptypy import utils as u
+from ptypy.core import Ptycho
+from ptypy.utils import parallel
+
+
+def run(outdir):
+    p = u.Param()
+    p.verbose_level = 'critical'
+    p.io = u.Param()
+    p.io.home = outdir
+    p.io.interaction = u.Param(active=False)
+    p.io.autosave = u.Param(active=False)
+    p.io.autoplot = u.Param(active=False)
+    p.scans = u.Param()
+    p.scans.MF = u.Param()
+    p.scans.MF.name = 'Full'
+    p.scans.MF.propagation = 'farfield'
+    p.scans.MF.data = u.Param()
+    p.scans.MF.data.name = 'MoonFlowerScan'
+    p.scans.MF.data.num_frames = 70
+    p.scans.MF.data.shape = 32
+    p.scans.MF.data.save = None
+    p.scans.MF.data.photons = 1e8
+    p.scans.MF.data.psf = 0.0
+    p.scans.MF.data.density = 0.2
+    p.scans.MF.data.add_poisson_noise = False
+    p.engines = u.Param()
+    p.engines.engine00 = u.Param(name='ML_minibatch', numiter=6, minibatch_size=30,
+                                 step_size=0.7, step_decay=0.5, reg_del2=True,
+                                 probe_update_start=0)
+    np.random.seed(1)
+    return Ptycho(p, level=5)
+
+
+def main(outdir):
+    P = run(outdir)
+    eng = P.engines['engine00']
+    failed = []
+    ref = parallel.bcast(eng.step_scale)
+    if eng.step_scale != ref:
+        failed.append('rank %d: step scale %g != %g' % (parallel.rank, eng.step_scale, ref))
+    for name in ['obj', 'probe']:
+        for ID, s in getattr(P, name).storages.items():
+            ref = parallel.bcast(s.data)
+            if np.abs(s.data - ref).max() > 1e-4 * np.abs(ref).max():
+                failed.append('rank %d: %s %s differs' % (parallel.rank, name, ID))
+    nframes = parallel.comm.allgather(len(eng.frames)) if parallel.MPIenabled else [len(eng.frames)]
+    if parallel.master and len(set(nframes)) < 2:
+        failed.append('frames %s are evenly shared' % nframes)
+
+    failed = sum(parallel.comm.allgather(failed), []) if parallel.MPIenabled else failed
+    if parallel.master:
+        for f in failed:
+            print(f)
+        print('FAILED' if failed else 'OK')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1])
@@ -0,0 +1,115 @@
+"""
+Test for the mini-batch ML engine.
+
+This file is part of the PTYPY package.
+    :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
+    :license: see LICENSE for details.
+"""
+
+import os
+import sys
+import unittest
+import subprocess
+from test import utils as tu
+from ptypy import utils as u
+import tempfile
+import numpy as np
+import shutil
+
+try:
+    import mpi4py
+    have_mpi = shutil.which('mpiexec') is not None
+except ImportError:
+    have_mpi = False
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class MLMinibatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.outpath = tempfile.mkdtemp(suffix="ML_minibatch_test")
+
+    def tearDown(self):
+        shutil.rmtree(self.outpath)
+
+    def test_ML_minibatch_farfield(self):
+        engine_params = u.Param()
+        engine_params.name = 'ML_minibatch'
+        engine_params.numiter = 10
+        engine_params.minibatch_size = 50
+        engine_params.reg_del2 = True
+        engine_params.step_decay = 0.1
+        tu.EngineTestRunner(engine_params, output_path=self.outpath, autosave=False,
+                            verbose_level='critical')
+
+    def test_ML_minibatch_sampling(self):
+        engine_params = u.Param()
+        engine_params.name = 'ML_minibatch'
+        engine_params.numiter = 8
+        engine_params.minibatch_size = 50
+        for sampling in ['random', 'stratified']:
+            engine_params.sampling = sampling
+            P = tu.EngineTestRunner(engine_params, output_path=self.outpath, autosave=False,
+                                    verbose_level='critical')
+            eng = P.engines['engine00']
+            nframes = len(eng.frames)
+
+            # Every frame once per epoch
+            batches = eng._draw_epoch()
+            self.assertEqual(len(batches), -(-nframes // 50))
+            np.testing.assert_array_equal(np.sort(np.concatenate(batches)), np.arange(nframes))
+            self.assertAlmostEqual(eng.epoch, 8 / len(batches))
+            self.assertEqual(len(eng._draw_minibatch()), 50)
+
+    def test_ML_minibatch_seed(self):
+        engine_params = u.Param()
+        engine_params.name = 'ML_minibatch'
+        engine_params.numiter = 4
+        engine_params.minibatch_size = 50
+        # Runs from the same global random state draw the same frames
+        out = []
+        for i in range(2):
+            np.random.seed(1)
+            out.append(tu.EngineTestRunner(engine_params, output_path=self.outpath,
+                                           autosave=False, verbose_level='critical'))
+        for name in ['obj', 'probe']:
+            for ID, s in getattr(out[0], name).storages.items():
+                np.testing.assert_array_equal(getattr(out[1], name).storages[ID].data, s.data)
+        # A given seed does not depend on the global random state
+        engine_params.seed = 3
+        out = []
+        for seed in [1, 2]:
+            np.random.seed(seed)
+            P = tu.EngineTestRunner(engine_params, output_path=self.outpath, autosave=False,
+                                    verbose_level='critical')
+            out.append(P.engines['engine00']._draw_minibatch())
+        np.testing.assert_array_equal(out[0], out[1])
+
+
+@unittest.skipIf(not have_mpi, "no mpi4py or mpiexec available")
+class MLMinibatchMPITest(unittest.TestCase):
+
+    def setUp(self):
+        self.outpath = tempfile.mkdtemp(suffix="ML_minibatch_test")
+
+    def tearDown(self):
+        shutil.rmtree(self.outpath)
+
+    def test_ML_minibatch_mpi(self):
+        '''
+        processes with different numbers of frames keep the same object and probe
+        '''
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([ROOT] + [p for p in [env.get('PYTHONPATH')] if p])
+        env.setdefault('OMPI_ALLOW_RUN_AS_ROOT', '1')
+        env.setdefault('OMPI_ALLOW_RUN_AS_ROOT_CONFIRM', '1')
+        env.setdefault('OMPI_MCA_rmaps_base_oversubscribe', '1')
+        cmd = ['mpiexec', '-n', '2', sys.executable,
+               '-m', 'test.engine_tests.ML_minibatch_mpi', self.outpath]
+        out = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True)
+        self.assertEqual(out.returncode, 0, msg=out.stdout + out.stderr)
+        self.assertIn('OK', out.stdout)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,6 +10,7 @@ import unittest
 from test import utils as tu
 from ptypy import utils as u
 import tempfile
+import numpy as np
 import shutil
 
 class MLTest(unittest.TestCase):
@@ -64,5 +65,63 @@ class MLTest(unittest.TestCase):
 
         tu.EngineTestRunner(engine_params, propagator='nearfield', output_path=self.outpath)
 
+    def test_ML_tiled_object(self):
+        engine_params = u.Param()
+        engine_params.name = 'ML'
+        engine_params.numiter = 5
+        engine_params.probe_update_start = 2
+        engine_params.scale_precond = True
+        out = tu.EngineToggleRunner(engine_params, 'object_distribution', ['cloned', 'tiled'],
+                                    output_path=self.outpath, autosave=False)
+        self.assertTrue(out[1].obj.tiled)
+
+    def test_ML_batched(self):
+        engine_params = u.Param()
+        engine_params.name = 'ML'
+        engine_params.numiter = 3
+        engine_params.probe_update_start = 0
+        engine_params.floating_intensities = True
+        for ML_type in ['gaussian', 'poisson']:
+            engine_params.ML_type = ML_type
+            tu.EngineToggleRunner(engine_params, 'batch_size', [0, 16], atol=1e-4,
+                                  output_path=self.outpath, autosave=False,
+                                  verbose_level='critical')
+
+    def test_ML_cache_forward(self):
+        engine_params = u.Param()
+        engine_params.name = 'ML'
+        engine_params.numiter = 3
+        engine_params.probe_update_start = 0
+        tu.EngineToggleRunner(engine_params, 'cache_forward', [False, True],
+                              output_path=self.outpath, autosave=False, verbose_level='critical')
+
+    def test_ML_optimizers(self):
+        engine_params = u.Param()
+        engine_params.name = 'ML'
+        engine_params.numiter = 10
+        engine_params.probe_update_start = 2
+        engine_params.scale_precond = True
+        engine_params.smooth_gradient = 2.
+        engine_params.smooth_gradient_decay = 0.1
+        out = tu.EngineToggleRunner(engine_params, 'optimizer', ['lbfgs', 'adam'], compare=(),
+                                    output_path=self.outpath, autosave=False,
+                                    verbose_level='critical')
+        for P in out:
+            LL = [info['error'][1] for info in P.runtime.iter_info]
+            self.assertTrue(np.isfinite(LL).all())
+            self.assertLess(LL[-1], LL[0])
+
+    def test_ML_lbfgs_beats_cg(self):
+        engine_params = u.Param()
+        engine_params.name = 'ML'
+        engine_params.numiter = 40
+        engine_params.ML_type = 'poisson'
+        engine_params.scale_precond = True
+        out = tu.EngineToggleRunner(engine_params, 'optimizer', ['cg', 'lbfgs'], compare=(),
+                                    output_path=self.outpath, autosave=False,
+                                    verbose_level='critical')
+        LL_cg, LL_lbfgs = [P.runtime.iter_info[-1]['error'][1] for P in out]
+        self.assertLess(LL_lbfgs, LL_cg)
+
 if __name__ == "__main__":
     unittest.main()
@@ -85,5 +85,20 @@ class FourierUpdateTest(unittest.TestCase):
             #                              "Exit wave data diverges after fourier update")
         np.testing.assert_array_equal(error_LEGACY, error, "Error metrics diverge")
 
+
+class ContainerReductionTest(unittest.TestCase):
+    def test_single_precision_accumulation(self):
+        from ptypy.core import Container
+        C1 = Container(data_type=np.complex64)
+        C2 = Container(data_type=np.complex64)
+        sh = (1, 512, 512)
+        for C in (C1, C2):
+            S = C.new_storage(shape=sh)
+            S.data[:] = (np.random.rand(*sh) + 1j * np.random.rand(*sh)) + 10.
+        a = list(C1.storages.values())[0].data.astype(np.complex128)
+        b = list(C2.storages.values())[0].data.astype(np.complex128)
+        np.testing.assert_allclose(eu.Cnorm2(C1), np.vdot(a, a).real, rtol=1e-7)
+        np.testing.assert_allclose(eu.Cdot(C1, C2), np.vdot(a, b), rtol=1e-7)
+
 if __name__ == "__main__":
     unittest.main()
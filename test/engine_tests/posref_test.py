@@ -0,0 +1,89 @@
+"""
+Test for the position refinement.
+
+This file is part of the PTYPY package.
+    :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
+    :license: see LICENSE for details.
+"""
+
+import unittest
+from test import utils as tu
+from ptypy import utils as u
+import tempfile
+import numpy as np
+import shutil
+
+class PositionRefinementTest(unittest.TestCase):
+
+    def setUp(self):
+        self.outpath = tempfile.mkdtemp(suffix="posref_test")
+
+    def tearDown(self):
+        shutil.rmtree(self.outpath)
+
+    def run_engine(self, method):
+        engine_params = u.Param()
+        engine_params.name = 'ML'
+        engine_params.numiter = 4
+        engine_params.position_refinement = u.Param(start=0, method=method,
+                                                    amplitude=3e-7, max_shift=1e-6)
+        np.random.seed(1)
+        P = tu.EngineTestRunner(engine_params, output_path=self.outpath, autosave=False,
+                                verbose_level='critical')
+        engine = list(P.engines.values())[0]
+        refine = engine.position_refinement
+        refine.update_constraints(0)
+        views = [v for v in P.diff.views.values() if v.active]
+        return refine, views
+
+    def test_stacked_errors(self):
+        '''
+        trial errors of the stacked path are those of re-sliced views
+        '''
+        refine, views = self.run_engine('Annealing')
+        views = views[:20]
+        ob_views = [v.pod.ob_view for v in views]
+        S = ob_views[0].storage
+        sp = np.array([v.sp for v in ob_views])
+        ishifts = np.random.randint(-3, 4, (len(views), 5, 2)).astype(float)
+        valid = np.ones(ishifts.shape[:2], dtype=bool)
+        error = refine._stacked_errors(views, ishifts, valid)
+        for i, (di_view, ob_view) in enumerate(zip(views, ob_views)):
+            coord = ob_view.coord.copy()
+            for j, k in enumerate(ishifts[i]):
+                ob_view.coord = coord + (k - sp[i]) * S.psize
+                S.update_views(ob_view)
+                np.testing.assert_allclose(error[i, j], refine.fourier_error(di_view, ob_view.data),
+                                           rtol=1e-5)
+            ob_view.coord = coord
+            S.update_views(ob_view)
+
+        # Sub-pixel shifts close to the integer ones
+        error_sub = refine._stacked_errors(views, ishifts + 0.02, valid)
+        np.testing.assert_allclose(error_sub, error, rtol=1e-2)
+
+    def test_stacked_grid_search(self):
+        '''
+        batched and view by view grid search move views on the pixel grid alike
+        '''
+        refine, views = self.run_engine('GridSearch')
+        ob_views = [v.pod.ob_view for v in views]
+        S = ob_views[0].storage
+        for v in ob_views:
+            v.coord = v.coord - v.sp * S.psize
+        S.update_views()
+        start = np.array([v.coord for v in ob_views])
+        coords = []
+        for block_size in [0, 64]:
+            refine.p.block_size = block_size
+            refine.update_positions(views)
+            coords.append(np.array([v.coord for v in ob_views]))
+            for v, c in zip(ob_views, start):
+                v.coord = c
+            S.update_views()
+        self.assertTrue((coords[1] != start).any())
+        np.testing.assert_allclose(coords[1], coords[0], rtol=0, atol=1e-3 * S.psize[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
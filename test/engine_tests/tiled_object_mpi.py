@@ -0,0 +1,101 @@
+"""
+Reconstructions with a cloned and a tiled object under MPI, run by
+tiled_object_test.py as
+
+    mpiexec -n <nprocs> python -m test.engine_tests.tiled_object_mpi <outdir>
+
+The master compares the objects assembled from the tiles and those
+written to .ptyr files with the cloned ones, and exits with an error if
+they disagree.
+
+This file is part of the PTYPY package.
+    :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
+    :license: see LICENSE for details.
+"""
+
+import sys
+import numpy as np
+from ptypy import utils as u
+from ptypy import io
+from ptypy.core import Ptycho
+from ptypy.utils import parallel
+
+
+def run(engine, distribution, outdir):
+    p = u.Param()
+    p.verbose_level = 'critical'
+    p.object_distribution = distribution
+    p.io = u.Param()
+    p.io.home = outdir
+    p.io.interaction = u.Param(active=False)
+    p.io.autosave = u.Param(active=False)
+    p.io.autoplot = u.Param(active=False)
+    p.scans = u.Param()
+    p.scans.MF = u.Param()
+    p.scans.MF.name = 'Full'
+    p.scans.MF.propagation = 'farfield'
+    p.scans.MF.data = u.Param()
+    p.scans.MF.data.name = 'MoonFlowerScan'
+    p.scans.MF.data.num_frames = 100
+    p.scans.MF.data.shape = 32
+    p.scans.MF.data.save = None
+    p.scans.MF.data.photons = 1e8
+    p.scans.MF.data.psf = 0.0
+    p.scans.MF.data.density = 0.2
+    p.scans.MF.data.add_poisson_noise = False
+    p.scans.MF.data.mpi_distribution = 'hilbert'
+    p.engines = u.Param()
+    p.engines.engine00 = u.Param(name=engine, numiter=5, probe_update_start=2)
+    np.random.seed(1)
+    P = Ptycho(p, level=5)
+    rfile = '%s/%s_%s.ptyr' % (outdir, engine, distribution)
+    P.save_run(alt_file=rfile, kind='minimal')
+    return P, rfile
+
+
+def main(outdir):
+    failed = []
+    for engine in ['DM', 'ML']:
+        out = {}
+        for distribution in ['cloned', 'tiled']:
+            P, rfile = run(engine, distribution, outdir)
+            S = P.obj.storages['SMFG00']
+            data, center = S.gather_tiles()
+            local_shape = [S.shape[1:]]
+            if parallel.MPIenabled:
+                local_shape = parallel.comm.allgather(S.shape[1:])
+            out[distribution] = (data, center, P.probe.storages['SMFG00'].data.copy(),
+                                 rfile, local_shape)
+
+        if not parallel.master:
+            continue
+        ref, tiled = out['cloned'], out['tiled']
+        scale = np.abs(ref[0]).max()
+
+        # Tiles are smaller than the object
+        if not any(np.prod(sh) < np.prod(ref[0].shape[1:]) for sh in tiled[4]):
+            failed.append('%s: tiles %s cover the whole object' % (engine, tiled[4]))
+        if not np.allclose(tiled[1], ref[1]):
+            failed.append('%s: center %s != %s' % (engine, tiled[1], ref[1]))
+        if tiled[0].shape != ref[0].shape or np.abs(tiled[0] - ref[0]).max() > 1e-3 * scale:
+            failed.append('%s: assembled object differs' % engine)
+        if np.abs(tiled[2] - ref[2]).max() > 1e-3 * np.abs(ref[2]).max():
+            failed.append('%s: probe differs' % engine)
+
+        # Saved objects
+        saved = [io.h5read(r[3], 'content')['content']['obj']['SMFG00'] for r in (ref, tiled)]
+        if (saved[1]['data'].shape != saved[0]['data'].shape
+                or np.abs(saved[1]['data'] - saved[0]['data']).max() > 1e-3 * scale):
+            failed.append('%s: saved object differs' % engine)
+        if not np.allclose(saved[1]['_center'], saved[0]['_center']):
+            failed.append('%s: saved center differs' % engine)
+
+    if parallel.master:
+        for f in failed:
+            print(f)
+        print('FAILED' if failed else 'OK')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1])
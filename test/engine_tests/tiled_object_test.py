@@ -0,0 +1,54 @@
+"""
+Test for reconstructions with a tiled object under MPI.
+
+This file is part of the PTYPY package.
+    :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
+    :license: see LICENSE for details.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+try:
+    import mpi4py
+    have_mpi = shutil.which('mpiexec') is not None
+except ImportError:
+    have_mpi = False
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@unittest.skipIf(not have_mpi, "no mpi4py or mpiexec available")
+class TiledObjectMPITest(unittest.TestCase):
+
+    def setUp(self):
+        self.outpath = tempfile.mkdtemp(suffix="tiled_object_test")
+
+    def tearDown(self):
+        shutil.rmtree(self.outpath)
+
+    def run_mpi(self, nprocs):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([ROOT] + [p for p in [env.get('PYTHONPATH')] if p])
+        env.setdefault('OMPI_ALLOW_RUN_AS_ROOT', '1')
+        env.setdefault('OMPI_ALLOW_RUN_AS_ROOT_CONFIRM', '1')
+        env.setdefault('OMPI_MCA_rmaps_base_oversubscribe', '1')
+        cmd = ['mpiexec', '-n', str(nprocs), sys.executable,
+               '-m', 'test.engine_tests.tiled_object_mpi', self.outpath]
+        return subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True)
+
+    def test_tiled_matches_cloned(self):
+        '''
+        DM and ML with a tiled object reproduce the cloned object and probe
+        '''
+        out = self.run_mpi(3)
+        self.assertEqual(out.returncode, 0, msg=out.stdout + out.stderr)
+        self.assertIn('OK', out.stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()
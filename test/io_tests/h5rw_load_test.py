@@ -95,6 +95,27 @@ class H5rwLoadTest(unittest.TestCase):
         np.testing.assert_array_equal(content["array data"], out["array data"],
                                 err_msg="Can't read back in an array that we saved.")
 
+    def test_load_ndarray_lazy(self):
+        data = np.arange(2 * 6 * 5, dtype=np.complex64).reshape(2, 6, 5)
+        content = {'array data': data, 'scalar data': 2.0, 'list data': [1, 2, 3]}
+        io.h5write(self.filepath % "load_lazy_test", h5layout={'raw': {'filter': 'none', 'chunks': None}},
+                   content=content, raw=data)
+        out = io.h5read(self.filepath % "load_lazy_test", lazy=True)
+        proxy = out["content"]["array data"]
+        self.assertIsInstance(proxy, io.H5Proxy)
+        self.assertEqual(proxy.shape, data.shape)
+        self.assertEqual(proxy.dtype, data.dtype)
+        np.testing.assert_array_equal(proxy[1, 2:4], data[1, 2:4])
+        np.testing.assert_array_equal(np.asarray(proxy), data)
+        np.testing.assert_equal(out["content"]["scalar data"], 2.0)
+        np.testing.assert_equal(out["content"]["list data"], [1, 2, 3])
+        # contiguous, uncompressed datasets are memory-mapped
+        self.assertIsInstance(out["raw"].memmap(), np.memmap)
+        np.testing.assert_array_equal(out["raw"].memmap(), data)
+        self.assertNotIsInstance(proxy.memmap(), np.memmap)
+        resolved = io.h5resolve(out)
+        self.assertIs(type(resolved["content"]["array data"]), np.ndarray)
+
     def test_load_numpy_record_array(self):
         data = np.recarray((8,), dtype=[('ID','<U16')])
         content = {'record array data': data}
@@ -135,4 +156,75 @@ class H5rwLoadTest(unittest.TestCase):
         io.h5write(self.filepath % "load_pickle_test", content=content)
         out = io.h5read(self.filepath % "load_pickle_test", "content")["content"]
         np.testing.assert_equal(type(out['pickle data']), type(content['pickle data']))
-        np.testing.assert_equal(out['pickle data'].__dict__, content['pickle data'].__dict__)
\ No newline at end of file
+        np.testing.assert_equal(out['pickle data'].__dict__, content['pickle data'].__dict__)
+
+    def test_load_async_writer(self):
+        data = np.arange(100.).reshape(10, 10)
+        content = {'array data': data, 'list data': [1, 2, 3],
+                   'param data': u.Param(a=1, b='two')}
+        writer = io.AsyncH5Writer(maxsize=1)
+        writer.write(self.filepath % "load_async_test", content=content)
+        # the writer works on a snapshot
+        data[:] = 0
+        content['list data'].append(4)
+        writer.write(self.filepath % "load_async_test_2", content=content)
+        writer.close()
+        out = io.h5read(self.filepath % "load_async_test", "content")["content"]
+        np.testing.assert_array_equal(out['array data'], np.arange(100.).reshape(10, 10),
+                                      err_msg="Background write did not store a snapshot.")
+        np.testing.assert_equal(out['list data'], [1, 2, 3])
+        np.testing.assert_equal(out['param data'].b, 'two')
+        out = io.h5read(self.filepath % "load_async_test_2", "content")["content"]
+        np.testing.assert_array_equal(out['array data'], 0)
+        np.testing.assert_equal(out['list data'], [1, 2, 3, 4])
+
+    def test_async_writer_unsupported(self):
+        from ptypy.core.data import PtyScan
+        writer = io.AsyncH5Writer()
+        with self.assertRaises(RuntimeError):
+            writer.write(self.filepath % "async_fail_test", content={'x': PtyScan()})
+        io.h5options['UNSUPPORTED'] = 'ignore'
+        writer.write(self.filepath % "async_ignore_test", content={'x': PtyScan(), 'y': 1})
+        writer.flush()
+        out = io.h5read(self.filepath % "async_ignore_test", "content")["content"]
+        np.testing.assert_equal(list(out.keys()), ['y'])
+
+    def test_frame_reader(self):
+        fname = self.filepath % "frame_reader_test"
+        stack = np.random.randint(0, 1000, (2, 3, 16, 12)).astype(np.int32)
+        with h5.File(fname, 'w') as f:
+            f.create_dataset('gzip', data=stack, chunks=(1, 1, 16, 12), compression='gzip')
+            f.create_dataset('shuffle', data=stack.astype('>f8'), chunks=(1, 1, 16, 12),
+                             compression='gzip', shuffle=True, fletcher32=True)
+            f.create_dataset('partial', shape=stack.shape, dtype=np.int16,
+                             chunks=(1, 1, 16, 12), shuffle=True, fillvalue=7)
+            f['partial'][1, 2] = stack[1, 2]
+            f.create_dataset('lzf', data=stack, chunks=(1, 1, 16, 12), compression='lzf')
+            f['contiguous'] = stack
+        frames = [(1, 2), (0, 0), (1, 0), (0, 2)]
+        sel = (slice(2, 14), slice(1, 9))
+        with h5.File(fname, 'r') as f:
+            self.assertFalse(io.H5FrameReader.supported(f['lzf']))
+            self.assertFalse(io.H5FrameReader.supported(f['contiguous']))
+            for key in ['gzip', 'shuffle', 'partial']:
+                dset = f[key]
+                reader = io.H5FrameReader(dset, threads=2)
+                out = np.empty((len(frames), 12, 8), dset.dtype)
+                reader.read(frames, out, sel)
+                reader.close()
+                for j, fr in enumerate(frames):
+                    np.testing.assert_array_equal(out[j], dset[fr][sel], err_msg=key)
+
+        # Corrupted chunks fail the Fletcher-32 check
+        with h5.File(fname, 'r+') as f:
+            dset = f['shuffle']
+            mask, raw = dset.id.read_direct_chunk((0, 0, 0, 0))
+            raw = bytearray(raw)
+            raw[5] ^= 1
+            dset.id.write_direct_chunk((0, 0, 0, 0), bytes(raw), mask)
+            reader = io.H5FrameReader(dset)
+            out = np.empty((1, 16, 12), dset.dtype)
+            with self.assertRaises(OSError):
+                reader.read([(0, 0)], out)
+            with self.assertRaises(OSError):
+                dset[0, 0]
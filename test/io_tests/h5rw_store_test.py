@@ -171,5 +171,29 @@ class H5rwStoreTest(unittest.TestCase):
         except:
             self.fail(msg="This should not have produced an exception!")
 
+    def test_store_layout(self):
+        stack = np.arange(4 * 8 * 8, dtype=np.float32).reshape(4, 8, 8)
+        fname = self.filepath % "store_layout_test"
+        io.h5write(fname, h5layout={'chunks/*/weights': {'filter': 'lzf', 'chunks': (2, 8, 8)},
+                                    'meta': 'none'},
+                   chunks={'0': {'data': stack, 'weights': stack}}, meta=stack[0],
+                   content={'obj': stack})
+        with h5.File(fname, 'r') as f:
+            self.assertEqual(f['chunks/0/data'].compression, 'gzip')
+            self.assertEqual(f['chunks/0/data'].chunks, (1, 8, 8))
+            # Only detector frame stacks are chunked frame by frame
+            self.assertNotEqual(f['content/obj'].chunks, (1, 8, 8))
+            self.assertEqual(f['chunks/0/weights'].compression, 'lzf')
+            self.assertEqual(f['chunks/0/weights'].chunks, (2, 8, 8))
+            self.assertIsNone(f['meta'].compression)
+        np.testing.assert_array_equal(io.h5read(fname, 'chunks')['chunks']['0']['weights'], stack)
+
+    def test_store_filters(self):
+        stack = np.random.randint(0, 10, (3, 16, 16)).astype(np.int32)
+        res = io.h5write_benchmark(self.filepath % "store_filters_test", stack,
+                                   filters=['none', 'gzip', 'lzf', 'shuffle+gzip'])
+        self.assertEqual(list(res.keys()), ['none', 'gzip', 'lzf', 'shuffle+gzip'])
+        self.assertGreater(res['shuffle+gzip']['ratio'], res['none']['ratio'])
+
 if __name__=='__main__':
     unittest.main()
\ No newline at end of file
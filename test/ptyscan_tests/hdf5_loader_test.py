@@ -6,7 +6,7 @@ import shutil
 import numpy as np
 import ptypy
 from test.utils import PtyscanTestRunner
-from ptypy.experiment.hdf5_loader import Hdf5Loader
+from ptypy.experiment.hdf5_loader import Hdf5Loader, Hdf5LoaderFast
 from ptypy import utils as u
 
 
@@ -1345,6 +1345,89 @@ class Hdf5LoaderTestNoSWMR(unittest.TestCase):
         output = PtyscanTestRunner(Hdf5Loader, data_params, auto_frames=k, cleanup=False)
 
 
+    def test_fast_loader_matches_loader(self):
+        '''
+        Hdf5LoaderFast loads the same corrected frames as Hdf5Loader
+        '''
+        k = 12
+        frame_size_m = 50
+        frame_size_n = 40
+
+        positions_slow = np.arange(k)
+        positions_fast = np.arange(k)
+        with h5.File(self.positions_file, 'w') as f:
+            f[self.positions_slow_key] = positions_slow
+            f[self.positions_fast_key] = positions_fast
+
+        rng = np.random.default_rng(1)
+        data = rng.random((k, frame_size_m, frame_size_n)) * 100
+        with h5.File(self.intensity_file, 'w') as f:
+            f[self.intensity_key] = data
+        with h5.File(self.dark_file, 'w') as f:
+            f[self.dark_key] = rng.random((frame_size_m, frame_size_n)) * 10
+        with h5.File(self.flat_file, 'w') as f:
+            f[self.flat_key] = rng.random(data.shape) + 0.5
+        with h5.File(self.mask_file, 'w') as f:
+            f[self.mask_key] = (rng.random(data.shape) > 0.2).astype(int)
+
+        data_params = u.Param()
+        data_params.auto_center = False
+        data_params.shape = 32
+        data_params.padding = [1, 2, 3, 0]
+        data_params.intensities = u.Param()
+        data_params.intensities.file = self.intensity_file
+        data_params.intensities.key = self.intensity_key
+        data_params.darkfield = u.Param()
+        data_params.darkfield.file = self.dark_file
+        data_params.darkfield.key = self.dark_key
+        data_params.flatfield = u.Param()
+        data_params.flatfield.file = self.flat_file
+        data_params.flatfield.key = self.flat_key
+        data_params.mask = u.Param()
+        data_params.mask.file = self.mask_file
+        data_params.mask.key = self.mask_key
+        data_params.positions = u.Param()
+        data_params.positions.file = self.positions_file
+        data_params.positions.slow_key = self.positions_slow_key
+        data_params.positions.fast_key = self.positions_fast_key
+
+        ref = Hdf5Loader(data_params.copy(99))
+        ref.initialize()
+        fast = Hdf5LoaderFast(data_params.copy(99))
+        fast.initialize()
+        for indices in [range(0, 7), range(7, 12)]:
+            I, P, W = ref.load(list(indices))
+            If, Pf, Wf = fast.load(list(indices))
+            for ii in indices:
+                np.testing.assert_array_equal(If[ii], I[ii])
+                np.testing.assert_array_equal(Wf[ii], W[ii])
+                np.testing.assert_array_equal(Pf[ii], P[ii])
+        pool = fast._pool
+        self.assertIsNotNone(pool, 'Worker pool not kept between chunks.')
+
+        # Chunks held by a prefetcher of depth 2 are not overwritten
+        fast.prefetch_depth = 2
+        chunks = [range(0, 3), range(3, 6), range(6, 9), range(9, 12)]
+        held = [fast.load(list(indices)) for indices in chunks]
+        self.assertEqual(len(fast._buffers[0]), 4)
+        for indices, (If, Pf, Wf) in zip(chunks, held):
+            I, P, W = ref.load(list(indices))
+            for ii in indices:
+                np.testing.assert_array_equal(If[ii], I[ii])
+                np.testing.assert_array_equal(Wf[ii], W[ii])
+
+        # The teardown of a worker closes its files
+        Hdf5LoaderFast._init_worker(*fast._worker_args(
+            fast._intensities_raw_array, fast._weights_raw_array, fast._buffers[0].shape))
+        files = list(Hdf5LoaderFast._worker['files'].values())
+        Hdf5LoaderFast._close_worker()
+        self.assertIsNone(Hdf5LoaderFast._worker)
+        self.assertFalse(any(files))
+
+        fast._finalize()
+        ref._finalize()
+        self.assertIsNone(fast._pool)
+
 
 class Hdf5LoaderTestWithSWMR(unittest.TestCase):
     def test_something(self):
@@ -7,6 +7,7 @@ from ptypy import utils as u
 import tempfile
 import shutil
 import unittest
+import numpy as np
 
 u.verbose.set_level(1)
 
@@ -117,6 +118,28 @@ class OnTheFlyPtydTest(unittest.TestCase):
         print(S2.info.num_frames)
         print(S2.check(40))
 
+    def test_memmap(self):
+        compression = ptypy.io.h5options['COMPRESSION']
+        ptypy.io.h5options['COMPRESSION'] = 'none'
+        try:
+            if u.parallel.master: msg = self.S1.auto(30)
+        finally:
+            ptypy.io.h5options['COMPRESSION'] = compression
+        u.parallel.barrier()
+        out = []
+        for memmap in [False, True]:
+            S2 = self._create_PtydScan(save=None, memmap=memmap)
+            S2.initialize()
+            out.append([S2.auto(20), S2.auto(20)])
+        self.assertTrue(all(S2._layout['data'].values()),
+                        'Uncompressed chunks should be memory-mapped')
+        for ref, msg in zip(*out):
+            self.assertEqual(len(ref['iterable']), len(msg['iterable']))
+            for fr, fm in zip(ref['iterable'], msg['iterable']):
+                self.assertEqual(fr['index'], fm['index'])
+                for key in ['data', 'mask', 'position']:
+                    np.testing.assert_array_equal(fr[key], fm[key], err_msg=key)
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -5,8 +5,12 @@ test Scan `ptypy.core.data.MoonFlowerScan`
 
 from ptypy import utils as u
 from ptypy import io
-from ptypy.core.data import MoonFlowerScan
+from ptypy.core.data import MoonFlowerScan, FrameBlock, PtyScanPrefetcher, EOS
+from ptypy.core import Ptycho
 from .. import utils as tu
+import numpy as np
+import tempfile
+import shutil
 import unittest
 global DATA
 DATA = u.Param(
@@ -76,6 +80,135 @@ class PtyscanTest(unittest.TestCase):
         out = tu.PtyscanTestRunner(MoonFlowerScan,data_params=DATA, save_type='link', cleanup=False)
         d = io.h5read(out['output_file'])
 
+    def test_collective_chunk_layout(self):
+        '''
+        chunks written with the parallel HDF5 path read back like gathered ones
+        '''
+        outdir = tempfile.mkdtemp()
+        for kind in ['append', 'link']:
+            p = DATA.copy()
+            p.add_poisson_noise = False
+            p.dfile = '%s/gathered_%s.ptyd' % (outdir, kind)
+            p.save = kind
+            np.random.seed(1)
+            a = MoonFlowerScan(p)
+            a.initialize()
+            a.auto(20)
+            ref = io.h5read(p.dfile, 'chunks')['chunks']['0']
+
+            p.dfile = None
+            p.save = None
+            np.random.seed(1)
+            b = MoonFlowerScan(p)
+            b.initialize()
+            msg = b.auto(20)
+            b.dfile = '%s/collective_%s.ptyd' % (outdir, kind)
+            self.assertTrue(b._mpio_save_chunk(kind, msg['chunk']))
+            out = io.h5read(b.dfile, 'chunks')['chunks']['0']
+
+            self.assertEqual(sorted(ref.keys()), sorted(out.keys()))
+            for k, v in ref.items():
+                self.assertEqual(type(v), type(out[k]))
+                np.testing.assert_array_equal(v, out[k], err_msg=k)
+        shutil.rmtree(outdir)
+
+    def test_frame_block_chunk(self):
+        '''
+        frames loaded as one array are processed like dicts of frames
+        '''
+        class DictMoonFlowerScan(MoonFlowerScan):
+            def load(self, indices):
+                raw, pos, weights = super().load(indices)
+                return dict(zip(indices, raw)), pos, weights
+
+        p = DATA.copy()
+        p.add_poisson_noise = False
+        p.rebin = 2
+        p.orientation = 3
+        out = []
+        for cls in [MoonFlowerScan, DictMoonFlowerScan]:
+            np.random.seed(1)
+            a = cls(p)
+            a.initialize()
+            out.append(a.auto(20))
+        block, ref = out
+        self.assertIsInstance(block['chunk'].data, FrameBlock)
+        self.assertEqual(block['chunk'].data.array.shape, (20, 64, 64))
+        for fb, fr in zip(block['iterable'], ref['iterable']):
+            self.assertEqual(fb['index'], fr['index'])
+            np.testing.assert_array_equal(fb['data'], fr['data'])
+            np.testing.assert_array_equal(fb['mask'], fr['mask'])
+
+    def test_prefetcher(self):
+        '''
+        prefetched data packages are the same as the synchronous ones
+        '''
+        p = DATA.copy()
+        p.add_poisson_noise = False
+        p.dfile = None
+        p.save = None
+        np.random.seed(1)
+        a = MoonFlowerScan(p)
+        a.initialize()
+        np.random.seed(1)
+        b = MoonFlowerScan(p)
+        b.initialize()
+        pf = PtyScanPrefetcher(b, depth=2, max_memory=1)
+        while True:
+            ref = a.auto(20)
+            out = pf.auto(20)
+            if ref == EOS:
+                self.assertEqual(out, EOS)
+                break
+            self.assertEqual(len(ref['iterable']), len(out['iterable']))
+            for fr, fo in zip(ref['iterable'], out['iterable']):
+                self.assertEqual(fr['index'], fo['index'])
+                np.testing.assert_array_equal(fr['data'], fo['data'])
+        pf.close()
+
+    def test_prefetcher_closed_by_finalize(self):
+        '''
+        the prefetching thread of a scan stops when Ptycho finalizes
+        '''
+        p = u.Param()
+        p.verbose_level = 'critical'
+        p.io = u.Param(interaction=u.Param(active=False), autoplot=u.Param(active=False))
+        p.scans = u.Param()
+        p.scans.MF = u.Param(name='Full', prefetch=2)
+        p.scans.MF.data = DATA.copy()
+        p.scans.MF.data.name = 'MoonFlowerScan'
+        p.scans.MF.data.shape = 32
+        p.scans.MF.data.save = None
+        P = Ptycho(p, level=2)
+        pf = P.model.scans['MF']._prefetcher
+        self.assertIsNotNone(pf._thread)
+        P.finalize()
+        self.assertTrue(pf._stop)
+        self.assertFalse(pf._thread.is_alive())
+        self.assertIsNone(P.model.scans['MF']._prefetcher)
+
+    def test_space_filling_distribution(self):
+        '''
+        frames of a raster scan are distributed in compact tiles
+        '''
+        grid = np.indices((16, 16)).reshape(2, -1).T * 1e-6
+        for curve in ['hilbert', 'morton']:
+            ranks = u.parallel.space_filling_ranks(grid, curve, nranks=4)
+            np.testing.assert_array_equal(np.bincount(ranks), [64] * 4)
+            for r in range(4):
+                tile = grid[ranks == r]
+                np.testing.assert_allclose(tile.max(0) - tile.min(0), [7e-6] * 2)
+
+        p = DATA.copy()
+        p.add_poisson_noise = False
+        p.mpi_distribution = 'hilbert'
+        np.random.seed(1)
+        a = MoonFlowerScan(p)
+        a.initialize()
+        self.assertEqual(len(a._frame_ranks), a.num_frames)
+        msg = a.auto(20)
+        self.assertEqual(len(msg['iterable']), 20)
+        self.assertTrue(all(f['data'] is not None for f in msg['iterable']))
 
 
 if __name__ == '__main__':
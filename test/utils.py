@@ -44,10 +44,12 @@ def PtyscanTestRunner(ptyscan_instance, data_params, save_type='append', auto_fr
 
 
 def EngineTestRunner(engine_params,propagator='farfield',output_path='./', output_file=None,
-                    autosave=True, scanmodel="Full", verbose_level="info", init_correct_probe=False):
+                    autosave=True, scanmodel="Full", verbose_level="info", init_correct_probe=False,
+                    object_distribution='cloned'):
 
     p = u.Param()
     p.verbose_level = verbose_level
+    p.object_distribution = object_distribution
     p.io = u.Param()
     p.io.home = output_path
     p.io.rfile = "%s.ptyr" % output_file
@@ -79,6 +81,35 @@ def EngineTestRunner(engine_params,propagator='farfield',output_path='./', outpu
     return P
 
 
+def EngineToggleRunner(engine_params, name, values, compare=('obj',), atol=0., seed=1, **kwargs):
+    """
+    Runs EngineTestRunner once for each of `values` of the engine parameter
+    (or EngineTestRunner keyword) `name`, from the same random state, and
+    asserts that the storages of the containers in `compare` agree with
+    those of the first run, exactly or within `atol` relative to their
+    maximum. Returns the Ptycho instances.
+    """
+    out = []
+    for value in values:
+        params = engine_params.copy(99)
+        if name in inspect.signature(EngineTestRunner).parameters:
+            kwargs[name] = value
+        else:
+            params[name] = value
+        np.random.seed(seed)
+        out.append(EngineTestRunner(params, **kwargs))
+
+    for P in out[1:]:
+        for container in compare:
+            for ID, s in getattr(out[0], container).storages.items():
+                d = getattr(P, container).storages[ID].data
+                if atol:
+                    np.testing.assert_allclose(d, s.data, rtol=0, atol=atol * np.abs(s.data).max())
+                else:
+                    np.testing.assert_array_equal(d, s.data)
+    return out
+
+
 def EngineTestRunner2(engine_params,propagator='farfield',output_path='./', output_file=None,
                     autosave=True, scanmodel="Full", verbose_level="info", init_correct_probe=False):
 